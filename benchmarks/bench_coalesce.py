@@ -0,0 +1,168 @@
+"""Measures what coalescing small messages saves in system calls and costs in latency, for a
+market data style stream of tiny TEXT messages.
+
+A server in a child process sends a burst of messages to every client each interval, from
+its event loop. The messages carry the time they were sent, and the clients, all read by
+one thread of this process, record how long each one took to arrive.
+
+    immediate  - every message is written with a system call of its own.
+    window     - the messages sent to a client within coalesce_delay are written together.
+    batch      - the messages of a burst are joined into one frame with send_batch.
+
+    $ python benchmarks/bench_coalesce.py --clients 50 --burst 10 --interval 0.001
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+UPGRADE_REQUEST = (
+    "GET / HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+SERVER_SCRIPT = """
+import json
+import logging
+import sys
+import threading
+import time
+sys.path.insert(0, {path!r})
+from websock import WebSocketServer
+server = WebSocketServer("127.0.0.1", {port}, coalesce_delay={delay}, tcp_nodelay={nodelay})
+logging.disable(logging.CRITICAL)
+end = None
+sent = 0
+
+def produce(when):
+    global end, sent
+    clients = list(server.clients.values())
+    if len(clients) < {clients}:
+        server.event_loop.call_at(time.monotonic() + 0.01, produce, time.monotonic() + 0.01)
+        return
+    if end is None:
+        end = when + {duration}
+    if when >= end:
+        writes = sum(server.stats(client)['writes_out'] for client in clients)
+        print(json.dumps({{'writes': writes, 'sent': sent}}), flush=True)
+        server.close_server()
+        return
+    for client in clients:
+        messages = ["%.6f" % time.monotonic() for _ in range({burst})]
+        if {batch}:
+            server.send_batch(client, messages)
+        else:
+            for message in messages:
+                server.send(client, message)
+        sent += len(messages)
+    server.event_loop.call_at(when + {interval}, produce, when + {interval})
+
+def start():
+    server.event_loop.call_at(time.monotonic(), produce, time.monotonic())
+
+threading.Timer(0.2, start).start()
+server.serve_forever(event_loop=True)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_frames(buffer):
+    """Split the complete unmasked frames off the front of a buffer.
+
+    :returns: A tuple of (list of (opcode, payload), bytes left over).
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= 2:
+        length = buffer[offset + 1] & 0x7F
+        start = offset + 2
+        if length == 126:
+            if len(buffer) - offset < 4:
+                break
+            length = int.from_bytes(buffer[offset + 2:offset + 4], 'big')
+            start = offset + 4
+        if len(buffer) < start + length:
+            break
+        frames.append((buffer[offset] & 0x0F, buffer[start:start + length]))
+        offset = start + length
+    return frames, buffer[offset:]
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench(args, delay, batch):
+    port = free_port()
+    script = SERVER_SCRIPT.format(path=proj_folder, port=port, delay=delay, nodelay=args.nodelay, clients=args.clients,
+                                  duration=args.duration, burst=args.burst, batch=batch, interval=args.interval)
+    server = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+    time.sleep(0.5)
+    selector = selectors.DefaultSelector()
+    for _ in range(args.clients):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(UPGRADE_REQUEST)
+        response = b""
+        while not response.endswith(b"\r\n\r\n"):
+            response += sock.recv(1)
+        selector.register(sock, selectors.EVENT_READ, [b""])
+
+    latencies = []
+    received = 0
+    while selector.get_map():
+        for key, _ in selector.select():
+            data = key.fileobj.recv(65536)
+            now = time.monotonic()
+            if not data:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                continue
+            frames, key.data[0] = read_frames(key.data[0] + data)
+            for opcode, payload in frames:
+                if opcode != 0x1:
+                    continue    # The CLOSE frame.
+                for message in payload.split(b"\n"):
+                    latencies.append(now - float(message))
+                    received += 1
+    result = json.loads(server.stdout.readline())
+    server.wait()
+    latencies.sort()
+    return received, result["writes"] / max(result["sent"], 1), percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--burst", type=int, default=10, help="Messages sent to every client each interval.")
+    parser.add_argument("--interval", type=float, default=0.002, help="Seconds between bursts.")
+    parser.add_argument("--delays", default="0.0002,0.001,0.005", help="Comma separated coalescing windows in seconds.")
+    parser.add_argument("--nodelay", action="store_true", help="Set TCP_NODELAY on the clients.")
+    args = parser.parse_args()
+
+    runs = [("immediate", None, False)]
+    runs += [("window {:g} ms".format(float(delay) * 1000), float(delay), False) for delay in args.delays.split(",")]
+    runs += [("batch", None, True)]
+    print("{:<16} {:>12} {:>16} {:>10} {:>10}".format("", "messages/s", "writes/message", "p50 ms", "p99 ms"))
+    for name, delay, batch in runs:
+        received, writes, p50, p99 = bench(args, delay, batch)
+        print("{:<16} {:>12.0f} {:>16.3f} {:>10.3f} {:>10.3f}".format(name, received / args.duration, writes, p50 * 1000, p99 * 1000))
+
+
+if __name__ == "__main__":
+    main()
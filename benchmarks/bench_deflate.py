@@ -0,0 +1,88 @@
+"""Measures bytes on the wire and server CPU time per message with and without permessage-deflate.
+
+The workload is a stream of small, repetitive chat messages encoded as JSON, similar to the
+traffic of the example chat application.
+
+    $ python benchmarks/bench_deflate.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock import WebSocketServer, FrameType, PerMessageDeflate
+from websock.FrameParser import MessageAssembler, Frame
+
+USERS = ["alice", "bob", "carol", "dave", "erin"]
+WORDS = "the quick brown fox jumps over the lazy dog hello world how are you today".split()
+
+
+def chat_messages(count, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        messages.append(json.dumps({
+            "type": "message",
+            "room": "general",
+            "user": rng.choice(USERS),
+            "id": i,
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20))),
+        }))
+    return messages
+
+
+def client_compress(compressor, data):
+    return (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+def run(name, deflate, messages):
+    context = deflate.negotiate("permessage-deflate")[0] if deflate is not None else None
+
+    wire_bytes = 0
+    start = time.process_time()
+    for message in messages:
+        wire_bytes += sum(map(len, WebSocketServer._encode_message_parts(context, FrameType.TEXT, message)))
+    encode_time = time.process_time() - start
+
+    # Inbound messages compressed by a client that keeps its context.
+    assembler = MessageAssembler()
+    assembler.deflate = context
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    if context is not None:
+        frames = [Frame(1, FrameType.TEXT, client_compress(compressor, message.encode()), 4) for message in messages]
+    else:
+        frames = [Frame(1, FrameType.TEXT, message.encode()) for message in messages]
+    start = time.process_time()
+    for frame in frames:
+        assembler.add(frame)
+    decode_time = time.process_time() - start
+
+    count = len(messages)
+    print("{:>28}: {:>7.1f} bytes/msg {:>7.2f} us/msg encode {:>7.2f} us/msg decode".format(
+        name, wire_bytes / count, encode_time / count * 1e6, decode_time / count * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    messages = chat_messages(args.messages)
+    raw = sum(len(message) for message in messages) / len(messages)
+    print("Average JSON message: {:.1f} bytes".format(raw))
+
+    run("uncompressed", None, messages)
+    run("deflate", PerMessageDeflate(threshold=0), messages)
+    run("deflate, threshold 128", PerMessageDeflate(threshold=128), messages)
+    run("deflate, no context takeover", PerMessageDeflate(threshold=0, server_no_context_takeover=True), messages)
+    run("deflate, 10 window bits", PerMessageDeflate(threshold=0, server_max_window_bits=10, mem_level=4), messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Compares the thread per client mode with the event loop mode of WebSocketServer.
+
+For each mode a server is started in a child process, N idle connections are opened and the
+resident memory and thread count of the server are sampled. Afterwards a subset of the clients
+echo messages for a few seconds to measure the message throughput.
+
+    $ python benchmarks/bench_event_loop.py --connections 10000
+"""
+import argparse
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock import WebSocketServer, FrameType
+
+UPGRADE_REQUEST = (
+    "GET / HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+SERVER_SCRIPT = """
+import sys
+sys.path.insert(0, {path!r})
+from websock import WebSocketServer
+server = None
+def on_data_receive(client, data):
+    server.send(client, data)
+server = WebSocketServer("127.0.0.1", {port}, on_data_receive=on_data_receive)
+server.serve_forever(event_loop={event_loop})
+"""
+
+
+def masked_frame(text):
+    """Builds a masked TEXT frame the way a browser would."""
+    payload = text.encode()
+    mask_key = os.urandom(4)
+    masked = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+    return bytes([0x81, 0x80 | len(payload)]) + mask_key + masked
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def process_status(pid):
+    """Returns (rss in KiB, thread count) of a process."""
+    rss = threads = 0
+    with open("/proc/{}/status".format(pid)) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+def open_connections(port, count):
+    clients = []
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        clients.append(sock)
+    return clients
+
+
+def echo_throughput(clients, duration):
+    """Keeps one message in flight per client and counts the echoes received."""
+    frame = masked_frame("x" * 64)
+    expected = len(WebSocketServer._encode_data_frame(FrameType.TEXT, "x" * 64))
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for sock in clients:
+        sock.setblocking(False)
+        sock.send(frame)
+        pending[sock] = 0
+        selector.register(sock, selectors.EVENT_READ)
+
+    received = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for key, _ in selector.select(0.1):
+            sock = key.fileobj
+            pending[sock] += len(sock.recv(65536))
+            while pending[sock] >= expected:
+                pending[sock] -= expected
+                received += 1
+                sock.send(frame)
+    selector.close()
+    return received / duration
+
+
+def run(event_loop, connections, active, duration, port):
+    script = SERVER_SCRIPT.format(path=proj_folder, port=port, event_loop=event_loop)
+    server = subprocess.Popen([sys.executable, "-c", script])
+    time.sleep(0.5)
+    try:
+        base_rss, _ = process_status(server.pid)
+        clients = open_connections(port, connections)
+        time.sleep(1)
+        rss, threads = process_status(server.pid)
+        throughput = echo_throughput(clients[:active], duration)
+        for sock in clients:
+            sock.close()
+    finally:
+        server.kill()
+        server.wait()
+
+    return {
+        "mode": "event loop" if event_loop else "threaded",
+        "connections": connections,
+        "rss_per_connection_kib": (rss - base_rss) / connections,
+        "threads": threads,
+        "messages_per_second": throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--active", type=int, default=100, help="Number of clients echoing messages.")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8470)
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    if args.connections * 2 + 64 > limit:
+        exit("The file descriptor limit ({}) is too low for {} connections.".format(limit, args.connections))
+
+    for event_loop in (False, True):
+        result = run(event_loop, args.connections, min(args.active, args.connections), args.duration, args.port)
+        print("{mode:>10}: {connections} connections, {rss_per_connection_kib:.1f} KiB/connection, "
+              "{threads} threads, {messages_per_second:.0f} msg/s".format(**result))
+        args.port += 1
+
+
+if __name__ == "__main__":
+    main()
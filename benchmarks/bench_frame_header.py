@@ -0,0 +1,94 @@
+"""Measures frames per second for parsing and building frame headers with each payload length encoding.
+
+    dicts  - the original code driven by the field dictionaries in DataFrameFormat.
+    struct - the precompiled codec in websock.FrameHeader.
+
+    $ python benchmarks/bench_frame_header.py
+"""
+import argparse
+import os
+import sys
+import timeit
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock.DataFrameFormat import *
+from websock.FrameHeader import parse_header, pack_header
+
+ENCODINGS = [("7 bit", 64), ("16 bit", 4096), ("64 bit", 1 << 20)]
+
+
+def parse_dicts(buffer, pos=0):
+    """The original header parsing."""
+    view = memoryview(buffer)[pos:]
+    available = len(view)
+    if available < 2:
+        return None
+    header_len = PAYLOAD_LEN[HIGH]+1
+    payload_len = (view[PAYLOAD_LEN[LOW]]&PAYLOAD_LEN[BIT_MASK])>>PAYLOAD_LEN[OFFSET]
+    if payload_len == 126:
+        header_len = PAYLOAD_LEN_EXT_126[HIGH]+1
+        if available < header_len:
+            return None
+        payload_len = int.from_bytes(view[PAYLOAD_LEN_EXT_126[LOW]:header_len], 'big')
+    elif payload_len == 127:
+        header_len = PAYLOAD_LEN_EXT_127[HIGH]+1
+        if available < header_len:
+            return None
+        payload_len = int.from_bytes(view[PAYLOAD_LEN_EXT_127[LOW]:header_len], 'big')
+    mask = (view[MASK[LOW]]&MASK[BIT_MASK])>>MASK[OFFSET]
+    if mask:
+        header_len += MASK_KEY[LEN]
+    fin = (view[FIN[LOW]]&FIN[BIT_MASK])>>FIN[OFFSET]
+    opcode = (view[OPCODE[LOW]]&OPCODE[BIT_MASK])>>OPCODE[OFFSET]
+    rsv = (view[RSV[LOW]]&RSV[BIT_MASK])>>RSV[OFFSET]
+    opcode in [frame_type.value for frame_type in FrameType]
+    return (fin, opcode, rsv, mask, header_len, payload_len)
+
+
+def pack_dicts(frame_type, payload_len, fin=True, rsv1=False):
+    """The original header building."""
+    frame = bytearray()
+    frame.append(((1 if fin else 0)<<FIN[OFFSET])^((RSV1 if rsv1 else 0)<<RSV[OFFSET])^frame_type)
+    if payload_len < 126:
+        frame.append(payload_len)
+    elif payload_len < 65535:
+        frame.append(126)
+        for i in range(PAYLOAD_LEN_EXT_126[LEN]-1,-1,-1):
+            frame.append((payload_len>>(i*8))&255)
+    else:
+        frame.append(127)
+        for i in range(PAYLOAD_LEN_EXT_127[LEN]-1,-1,-1):
+            frame.append((payload_len>>(i*8))&255)
+    return frame
+
+
+def rate(function, *args, number):
+    """Returns the best number of calls per second."""
+    return number / min(timeit.repeat(lambda: function(*args), number=number, repeat=3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="Calls per measurement.")
+    args = parser.parse_args()
+
+    print("{:>8} {:>16} {:>16} {:>16} {:>16}".format("length", "parse dicts/s", "parse struct/s", "build dicts/s", "build struct/s"))
+    for name, size in ENCODINGS:
+        # A masked client frame header as it arrives, followed by the masking key.
+        header = bytearray(pack_header(FrameType.BINARY, size)) + b'\x01\x02\x03\x04'
+        header[1] |= 0x80
+        assert parse_dicts(header)[4:] == parse_header(header)[2:]
+        assert bytes(pack_dicts(FrameType.BINARY, size)) == pack_header(FrameType.BINARY, size)
+
+        print("{:>8} {:>16.0f} {:>16.0f} {:>16.0f} {:>16.0f}".format(
+            name,
+            rate(parse_dicts, header, number=args.number),
+            rate(parse_header, header, number=args.number),
+            rate(pack_dicts, FrameType.BINARY, size, number=args.number),
+            rate(pack_header, FrameType.BINARY, size, number=args.number)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Measures how fast data frames are read from a socket and parsed by the FrameParser.
+
+Two workloads are sent over a socketpair by a writer thread:
+    large     - 1 MB masked messages.
+    pipelined - 64 byte masked messages written back to back.
+
+Each workload is read with recv_into using different read sizes.
+
+    $ python benchmarks/bench_frame_parser.py
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock.FrameParser import FrameParser
+
+
+def masked_frame(payload, mask_key=b'\x01\x02\x03\x04'):
+    header = bytearray([0x82])
+    if len(payload) < 126:
+        header.append(0x80 | len(payload))
+    elif len(payload) < 65536:
+        header.append(0x80 | 126)
+        header.extend(len(payload).to_bytes(2, 'big'))
+    else:
+        header.append(0x80 | 127)
+        header.extend(len(payload).to_bytes(8, 'big'))
+    return bytes(header) + mask_key + bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+
+
+def run(frame, count, read_size):
+    reader, writer = socket.socketpair()
+    stream = frame * count
+
+    def write():
+        writer.sendall(stream)
+        writer.close()
+
+    thread = threading.Thread(target=write, daemon=True)
+    parser = FrameParser()
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    frames = 0
+
+    start = time.perf_counter()
+    thread.start()
+    while True:
+        size = reader.recv_into(buffer)
+        if not size:
+            break
+        parser.feed(view[:size])
+        for _ in parser:
+            frames += 1
+    elapsed = time.perf_counter() - start
+    thread.join()
+    reader.close()
+
+    assert frames == count
+    return frames / elapsed, len(stream) / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--large-count", type=int, default=5)
+    parser.add_argument("--small-count", type=int, default=100000)
+    args = parser.parse_args()
+
+    workloads = [
+        ("large", masked_frame(os.urandom(1 << 20)), args.large_count),
+        ("pipelined", masked_frame(os.urandom(64)), args.small_count),
+    ]
+    for name, frame, count in workloads:
+        for read_size in (2048, 16384, 65536):
+            frames_per_second, mb_per_second = run(frame, count, read_size)
+            print("{:>9} read_size={:<6} {:>10.0f} frames/s {:>8.1f} MB/s".format(name, read_size, frames_per_second, mb_per_second))
+
+
+if __name__ == "__main__":
+    main()
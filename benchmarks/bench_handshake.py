@@ -0,0 +1,167 @@
+"""Measures the rate of opening handshakes, which is what limits a server during the reconnect
+storm that follows a deploy.
+
+    parse - upgrade requests parsed and answered per second on one core, for a minimal request
+            and for a browser request carrying a few KB of cookies, whole and in 512 byte reads.
+    accept - the same for the minimal request with a new Sec-WebSocket-Key every time, and with
+            clients retrying with keys the accept cache has already seen.
+    storm - clients of the asyncio load generator reconnecting as fast as they can to a server
+            running in a child process, in handshakes per second.
+
+    $ python benchmarks/bench_handshake.py --concurrency 64 --duration 5
+"""
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import subprocess
+import sys
+import time
+
+bench_folder = os.path.dirname(os.path.abspath(__file__))
+proj_folder = os.path.abspath(os.path.join(bench_folder, '..'))
+sys.path.insert(0, proj_folder)
+sys.path.insert(0, bench_folder)
+
+import loadgen
+from websock import WebSocketServer
+from websock.HttpParser import HttpParser
+
+MINIMAL_REQUEST = (
+    "GET / HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+BROWSER_REQUEST = (
+    "GET /chat?room=lobby HTTP/1.1\r\n"
+    "Host: chat.example.com\r\n"
+    "Connection: keep-alive, Upgrade\r\n"
+    "Pragma: no-cache\r\n"
+    "Cache-Control: no-cache\r\n"
+    "User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36\r\n"
+    "Upgrade: websocket\r\n"
+    "Origin: https://chat.example.com\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "Accept-Encoding: gzip, deflate, br\r\n"
+    "Accept-Language: en-CA,en;q=0.9\r\n"
+    "Cookie: session=" + "a" * 1200 + "; token=" + "b" * 1800 + "\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n\r\n"
+).encode()
+
+SERVER_SCRIPT = """
+import logging
+import sys
+sys.path.insert(0, {path!r})
+from websock import WebSocketServer
+server = WebSocketServer("127.0.0.1", {port})
+logging.disable(logging.CRITICAL)
+server.serve_forever(event_loop={event_loop})
+"""
+
+
+def bench_parse(requests, read_size, duration, accept_cache_size=0):
+    """Returns the upgrade requests parsed and answered per second.
+
+    :param requests: A list of 1000 requests, which are handled in turn.
+    """
+    server = WebSocketServer(None, None, accept_cache_size=accept_cache_size)
+    server.server.close()
+    chunked = [[request[i:i + read_size] for i in range(0, len(request), read_size)] for request in requests]
+    count = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for chunks in chunked:
+            parser = HttpParser()
+            for chunk in chunks:
+                parsed = parser.feed(chunk)
+            valid, _ = server._opening_handshake(None, parsed)
+        count += len(chunked)
+    assert valid
+    return count / duration
+
+
+def with_keys(request, count):
+    """Returns count copies of a request, each with a Sec-WebSocket-Key of its own."""
+    key = b"dGhlIHNhbXBsZSBub25jZQ=="
+    return [request.replace(key, base64.b64encode(os.urandom(16))) for _ in range(count)]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def storm(port, concurrency, duration):
+    """Reconnects concurrency clients in a loop until duration has passed.
+
+    :returns: A tuple of (handshakes, failures).
+    """
+    counts = [0, 0]
+    end = time.perf_counter() + duration
+
+    async def reconnect():
+        while time.perf_counter() < end:
+            try:
+                client = await loadgen.Client.connect("127.0.0.1", port)
+            except (OSError, loadgen.HandshakeError, asyncio.IncompleteReadError):
+                counts[1] += 1
+                continue
+            counts[0] += 1
+            await client.close()
+
+    await asyncio.gather(*(reconnect() for _ in range(concurrency)))
+    return counts
+
+
+def bench_storm(event_loop, concurrency, duration):
+    port = free_port()
+    script = SERVER_SCRIPT.format(path=proj_folder, port=port, event_loop=event_loop)
+    server = subprocess.Popen([sys.executable, "-c", script])
+    time.sleep(0.5)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        handshakes, failures = loop.run_until_complete(storm(port, concurrency, duration))
+    finally:
+        loop.close()
+        server.kill()
+        server.wait()
+    return handshakes / duration, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients reconnecting at the same time.")
+    parser.add_argument("--accept-cache-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    print("parse:")
+    for name, request in (("minimal", MINIMAL_REQUEST), ("browser", BROWSER_REQUEST)):
+        for read_size in (65536, 512):
+            rate = bench_parse([request] * 1000, read_size, args.duration)
+            print("  {:<8} {:>5} bytes/read {:>6} byte request: {:>9.0f} handshakes/s".format(name, read_size, len(request), rate))
+
+    print("accept:")
+    requests = with_keys(MINIMAL_REQUEST, 1000)
+    rate = bench_parse(requests, 65536, args.duration)
+    print("  {:<32} {:>9.0f} handshakes/s".format("new keys, no cache", rate))
+    # The requests are handled over and over, so after the first pass every key is in the cache.
+    rate = bench_parse(requests, 65536, args.duration, accept_cache_size=args.accept_cache_size)
+    print("  {:<32} {:>9.0f} handshakes/s".format("retried keys, cache of {}".format(args.accept_cache_size), rate))
+
+    print("storm:")
+    for event_loop in (True, False):
+        rate, failures = bench_storm(event_loop, args.concurrency, args.duration)
+        print("  {:<10} {:>9.0f} handshakes/s, {} failures".format("event_loop" if event_loop else "threaded", rate, failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Measures the echo throughput of the event loop server with each logging setup.
+
+    off     - the default, nothing is logged below WARNING so no record is built.
+    file    - every message logged at INFO by a FileHandler on the serving thread, like the
+              former logging.basicConfig(filename='ws.log') setup.
+    queue   - every message logged at INFO through log_file, the file is written by a background thread.
+    sampled - like queue, but only one message in 100 is logged.
+
+    $ python benchmarks/bench_logging.py
+"""
+import argparse
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock import WebSocketServer, FrameType
+
+UPGRADE_REQUEST = (
+    "GET / HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+SERVER_SCRIPT = """
+import logging
+import sys
+sys.path.insert(0, {path!r})
+from websock import WebSocketServer
+mode = {mode!r}
+if mode == "file":
+    logging.basicConfig(filename={log!r}, filemode='w', format='%(levelname)s:%(threadName)s\\n\\t%(message)s', level=logging.INFO)
+server = None
+def on_data_receive(client, data):
+    server.send(client, data)
+server = WebSocketServer("127.0.0.1", {port}, on_data_receive=on_data_receive,
+                         log_file={log!r} if mode in ("queue", "sampled") else None,
+                         log_sampling={{'message': 100}} if mode == "sampled" else None)
+server.serve_forever(event_loop=True)
+"""
+
+MODES = ("off", "file", "queue", "sampled")
+
+
+def masked_frame(text):
+    """Builds a masked TEXT frame the way a browser would."""
+    payload = text.encode()
+    mask_key = os.urandom(4)
+    masked = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+    return bytes([0x81, 0x80 | len(payload)]) + mask_key + masked
+
+
+def open_connections(port, count):
+    clients = []
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        clients.append(sock)
+    return clients
+
+
+def echo_throughput(clients, duration):
+    """Keeps one message in flight per client and counts the echoes received."""
+    frame = masked_frame("x" * 64)
+    expected = len(WebSocketServer._encode_data_frame(FrameType.TEXT, "x" * 64))
+    selector = selectors.DefaultSelector()
+    pending = {}
+    for sock in clients:
+        sock.setblocking(False)
+        sock.send(frame)
+        pending[sock] = 0
+        selector.register(sock, selectors.EVENT_READ)
+
+    received = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for key, _ in selector.select(0.1):
+            sock = key.fileobj
+            pending[sock] += len(sock.recv(65536))
+            while pending[sock] >= expected:
+                pending[sock] -= expected
+                received += 1
+                sock.send(frame)
+    selector.close()
+    return received / duration
+
+
+def run(mode, active, duration, port, log):
+    script = SERVER_SCRIPT.format(path=proj_folder, port=port, mode=mode, log=log)
+    server = subprocess.Popen([sys.executable, "-c", script])
+    time.sleep(0.5)
+    try:
+        clients = open_connections(port, active)
+        throughput = echo_throughput(clients, duration)
+        for sock in clients:
+            sock.close()
+    finally:
+        server.kill()
+        server.wait()
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--active", type=int, default=50, help="Number of clients echoing messages.")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8490)
+    args = parser.parse_args()
+
+    best = dict.fromkeys(MODES, 0.0)
+    with tempfile.TemporaryDirectory() as folder:
+        log = os.path.join(folder, "ws.log")
+        for _ in range(args.rounds):
+            for mode in MODES:
+                best[mode] = max(best[mode], run(mode, args.active, args.duration, args.port, log))
+                args.port += 1
+
+    for mode in MODES:
+        print("{:>8}: {:.0f} msg/s".format(mode, best[mode]))
+
+
+if __name__ == "__main__":
+    main()
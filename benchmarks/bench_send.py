@@ -0,0 +1,113 @@
+"""Compares the allocations and throughput of sending messages before and after scatter-gather writes.
+
+    before - the header is built one byte at a time, the payload is copied into the frame with
+             extend and the frame is copied again into bytes before being sent with send_raw.
+    after  - WebSocketServer.send, which packs the header with a precompiled struct and writes it
+             together with the untouched payload using sendmsg. Payloads below 4 KB are joined
+             with the header instead since that is cheaper than gathering them.
+
+A reader thread drains the other end of a socketpair. Allocations are traced with tracemalloc.
+
+    $ python benchmarks/bench_send.py
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock import WebSocketServer, FrameType
+from websock.Connection import Connection
+
+SIZES = [64, 1024, 16384, 1 << 20]
+
+
+def encode_before(frame_type, data):
+    """The original implementation."""
+    frame = bytearray()
+    frame.append((1<<7)^frame_type)
+    payload_len = len(data)
+    if payload_len < 126:
+        frame.append(payload_len)
+    elif payload_len < 65535:
+        frame.append(126)
+        for i in range(1, -1, -1):
+            frame.append((payload_len>>(i*8))&255)
+    else:
+        frame.append(127)
+        for i in range(7, -1, -1):
+            frame.append((payload_len>>(i*8))&255)
+    frame.extend(data)
+    return bytes(frame)
+
+
+def drain(sock):
+    buffer = bytearray(1 << 20)
+    while sock.recv_into(buffer):
+        pass
+
+
+def run(send, data, count):
+    """Returns (messages per second, peak bytes allocated while sending one message)."""
+    for i in range(10):
+        send(data)
+
+    start = time.perf_counter()
+    for i in range(count):
+        send(data)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(20):
+        tracemalloc.clear_traces()
+        baseline = tracemalloc.get_traced_memory()[0]
+        send(data)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+        tracemalloc.start()
+    tracemalloc.stop()
+    return count / elapsed, min(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=512, help="Bytes sent per measurement.")
+    args = parser.parse_args()
+
+    server = WebSocketServer(None, None)
+    client, peer = socket.socketpair()
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 << 20)
+    server.clients[('127.0.0.1', 0)] = client
+    server._connections[client] = Connection(client, ('127.0.0.1', 0))
+    reader = threading.Thread(target=drain, args=(peer,), daemon=True)
+    reader.start()
+
+    def before(data):
+        connection = server._connections[client]
+        with connection.lock:
+            server.send_raw(client, encode_before(FrameType.BINARY, data))
+
+    def after(data):
+        server.send(client, data)
+
+    print("{:>8} {:>14} {:>14} {:>16} {:>16}".format("size", "before msg/s", "after msg/s", "before peak B", "after peak B"))
+    for size in SIZES:
+        data = os.urandom(size)
+        count = max(100, (args.megabytes << 20) // size // 8)
+        before_rate, before_peak = run(before, data, count)
+        after_rate, after_peak = run(after, data, count)
+        print("{:>8} {:>14.0f} {:>14.0f} {:>16} {:>16}".format(size, before_rate, after_rate, before_peak, after_peak))
+
+    client.close()
+    reader.join()
+    server.server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""Load tests WebSocketServer over loopback and writes the results as JSON.
+
+Every scenario runs against a fresh server process driven by the asyncio load generator in
+loadgen.py:
+
+    connect    - connections opened per second with a bounded number of handshakes in
+                 flight, the handshake latency and the resident memory per idle connection.
+    echo       - round trip time of small messages with one message in flight per client.
+    fanout     - time for a broadcast to reach every client, for each number of clients.
+    throughput - bytes per second echoed with large BINARY messages.
+
+Results of different commits can be compared:
+
+    $ python benchmarks/bench_suite.py --output before.json
+    $ git checkout other-branch
+    $ python benchmarks/bench_suite.py --output after.json --compare before.json
+
+The load generator is a single Python process as well, so at tens of thousands of clients it
+can become the bottleneck. Large runs need a file descriptor limit above twice the number of
+clients, which the suite raises up to the hard limit.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+bench_folder = os.path.dirname(os.path.abspath(__file__))
+proj_folder = os.path.abspath(os.path.join(bench_folder, '..'))
+sys.path.insert(0, bench_folder)
+
+import loadgen
+
+SERVER_SCRIPT = """
+import sys
+sys.path.insert(0, {path!r})
+try:
+    import resource
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+except (ImportError, ValueError, OSError):
+    pass
+from websock import WebSocketServer
+server = None
+def on_data_receive(client, data):
+    if data.startswith('broadcast:'):
+        server.broadcast(data)
+    else:
+        server.send(client, data)
+def on_binary_receive(client, data):
+    server.send(client, data)
+server = WebSocketServer("127.0.0.1", {port}, on_data_receive=on_data_receive, on_binary_receive=on_binary_receive)
+server.serve_forever(event_loop={event_loop})
+"""
+
+
+def percentile(values, percent):
+    """Returns the value below which percent of the sorted values fall."""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(len(values) * percent / 100.0))
+    return values[index]
+
+
+def latency_summary(seconds):
+    """Returns p50, p99 and max of a list of durations in milliseconds."""
+    seconds = sorted(seconds)
+    return {
+        'samples': len(seconds),
+        'p50_ms': percentile(seconds, 50) * 1000 if seconds else None,
+        'p99_ms': percentile(seconds, 99) * 1000 if seconds else None,
+        'max_ms': seconds[-1] * 1000 if seconds else None,
+    }
+
+
+def rss_kib(pid):
+    """Returns the resident memory of a process in KiB, None where /proc is not available."""
+    try:
+        with open("/proc/{}/status".format(pid)) as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def raise_fd_limit():
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        return soft
+    return hard
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """The server under test, running in a child process."""
+
+    def __init__(self, event_loop):
+        self.port = free_port()
+        script = SERVER_SCRIPT.format(path=proj_folder, port=self.port, event_loop=event_loop)
+        self.process = subprocess.Popen([sys.executable, "-c", script])
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError("The server did not start")
+                time.sleep(0.05)
+
+    def stop(self):
+        self.process.kill()
+        self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+async def open_clients(port, count, concurrency):
+    """Open count connections with at most concurrency handshakes in flight.
+
+    :returns: A tuple of (clients, handshake durations, failures).
+    """
+    limit = asyncio.Semaphore(concurrency)
+    durations = []
+    failures = [0]
+
+    async def open_one():
+        async with limit:
+            started = time.perf_counter()
+            try:
+                client = await loadgen.Client.connect("127.0.0.1", port)
+            except (OSError, loadgen.HandshakeError, asyncio.IncompleteReadError):
+                failures[0] += 1
+                return None
+            durations.append(time.perf_counter() - started)
+            return client
+
+    clients = await asyncio.gather(*(open_one() for _ in range(count)))
+    return [client for client in clients if client is not None], durations, failures[0]
+
+
+async def close_clients(clients):
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+async def scenario_connect(server, concurrency, count):
+    base = rss_kib(server.process.pid)
+    started = time.perf_counter()
+    clients, durations, failures = await open_clients(server.port, count, concurrency)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(1)
+    rss = rss_kib(server.process.pid)
+    await close_clients(clients)
+
+    result = {
+        'connections': len(clients),
+        'failures': failures,
+        'connections_per_second': len(clients) / elapsed,
+        'handshake': latency_summary(durations),
+        'rss_per_connection_kib': (rss - base) / len(clients) if rss is not None and clients else None,
+    }
+    return result
+
+
+async def scenario_echo(server, concurrency, count, messages, size):
+    clients, _, _ = await open_clients(server.port, count, concurrency)
+    payload = "x" * size
+    round_trips = []
+
+    async def echo(client):
+        for _ in range(messages):
+            started = time.perf_counter()
+            client.send(payload)
+            await client.recv()
+            round_trips.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(echo(client) for client in clients))
+    elapsed = time.perf_counter() - started
+    await close_clients(clients)
+
+    result = {'clients': len(clients), 'message_size': size, 'messages_per_second': len(round_trips) / elapsed}
+    result.update(latency_summary(round_trips))
+    return result
+
+
+async def scenario_fanout(server, concurrency, count, rounds):
+    clients, _, _ = await open_clients(server.port, count, concurrency)
+    publisher = clients[0]
+    latencies = []
+    completions = []
+
+    for sequence in range(rounds):
+        message = "broadcast:{}".format(sequence)
+        arrivals = []
+
+        async def receive(client):
+            while True:
+                opcode, payload = await client.recv()
+                if payload == message.encode() or opcode == loadgen.CLOSE:
+                    arrivals.append(time.perf_counter())
+                    return
+
+        receivers = [asyncio.ensure_future(receive(client)) for client in clients]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        publisher.send(message)
+        await asyncio.gather(*receivers)
+        latencies.extend(arrival - started for arrival in arrivals)
+        completions.append(max(arrivals) - started)
+        await asyncio.sleep(0.05)
+    await close_clients(clients)
+
+    result = {'clients': len(clients), 'rounds': rounds, 'delivery': latency_summary(latencies),
+              'complete': latency_summary(completions)}
+    return result
+
+
+async def scenario_throughput(server, concurrency, count, messages, size):
+    clients, _, _ = await open_clients(server.port, count, concurrency)
+    payload = os.urandom(size)
+    frame = loadgen.encode_frame(payload, loadgen.BINARY)
+    received = [0]
+
+    async def echo(client):
+        for _ in range(messages):
+            client.writer.write(frame)
+            _, data = await client.recv()
+            received[0] += len(data)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(echo(client) for client in clients))
+    elapsed = time.perf_counter() - started
+    await close_clients(clients)
+    return {'clients': len(clients), 'message_size': size, 'messages': messages * len(clients),
+            'megabytes_per_second': received[0] / elapsed / (1 << 20)}
+
+
+def run_scenario(loop, event_loop, coroutine_function, *args):
+    with Server(event_loop) as server:
+        return loop.run_until_complete(coroutine_function(server, *args))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=proj_folder,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """Returns a dictionary of dotted path to every number in the results."""
+    values = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            values.update(flatten(value, prefix + str(key) + '.'))
+    elif isinstance(results, list):
+        for index, value in enumerate(results):
+            values.update(flatten(value, prefix + str(index) + '.'))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        values[prefix[:-1]] = results
+    return values
+
+
+def compare(old, new):
+    """Print the relative change of every number of two result files."""
+    old_values = flatten(old['results'])
+    new_values = flatten(new['results'])
+    print("{:<45} {:>14} {:>14} {:>9}".format("metric", old['meta'].get('commit') or "old",
+                                              new['meta'].get('commit') or "new", "change"))
+    for name, value in new_values.items():
+        before = old_values.get(name)
+        if before is None:
+            continue
+        change = "{:+.1f}%".format(100.0 * (value - before) / before) if before else ""
+        print("{:<45} {:>14.4g} {:>14.4g} {:>9}".format(name, before, value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("event_loop", "threaded"), default="event_loop")
+    parser.add_argument("--scenarios", default="connect,echo,fanout,throughput")
+    parser.add_argument("--connections", type=int, default=2000, help="Connections opened by the connect scenario.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Handshakes in flight while the clients of a scenario connect.")
+    parser.add_argument("--echo-clients", type=int, default=50)
+    parser.add_argument("--echo-messages", type=int, default=200)
+    parser.add_argument("--echo-size", type=int, default=64)
+    parser.add_argument("--fanout", default="1000", help="Comma separated numbers of clients, e.g. 1000,10000,50000.")
+    parser.add_argument("--fanout-rounds", type=int, default=10)
+    parser.add_argument("--throughput-clients", type=int, default=4)
+    parser.add_argument("--throughput-messages", type=int, default=20)
+    parser.add_argument("--throughput-size", type=int, default=1 << 20)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--compare", help="A JSON file of earlier results to compare with.")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    fanout_sizes = [int(size) for size in args.fanout.split(',')]
+    limit = raise_fd_limit()
+    largest = max([args.connections] + fanout_sizes)
+    if limit is not None and largest + 64 > limit:
+        exit("The file descriptor limit ({}) is too low for {} connections.".format(limit, largest))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    event_loop = args.mode == "event_loop"
+    results = {}
+    if 'connect' in scenarios:
+        results['connect'] = run_scenario(loop, event_loop, scenario_connect, args.concurrency, args.connections)
+    if 'echo' in scenarios:
+        results['echo'] = run_scenario(loop, event_loop, scenario_echo, args.concurrency, args.echo_clients, args.echo_messages, args.echo_size)
+    if 'fanout' in scenarios:
+        results['fanout'] = [run_scenario(loop, event_loop, scenario_fanout, args.concurrency, size, args.fanout_rounds) for size in fanout_sizes]
+    if 'throughput' in scenarios:
+        results['throughput'] = run_scenario(loop, event_loop, scenario_throughput, args.concurrency, args.throughput_clients,
+                                             args.throughput_messages, args.throughput_size)
+    loop.close()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'mode': args.mode,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'arguments': vars(args),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            compare(json.load(previous), report)
+
+
+if __name__ == "__main__":
+    main()
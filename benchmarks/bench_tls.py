@@ -0,0 +1,141 @@
+"""Measures the cost of TLS handshakes on a wss:// server, which dominates a reconnect storm
+once the server terminates TLS itself.
+
+    full    - clients connecting with a new session every time, each a full key exchange.
+    resumed - clients offering the session of their previous connection, resumed from a
+              session ticket without the key exchange.
+
+Each client process loops connecting, completing the TLS and opening handshakes and closing
+to a server running in a child process on the event loop, with a self-signed certificate
+made by openssl. The rate is in handshakes per second, and the server's CPU time per
+handshake is read from /proc.
+
+    $ python benchmarks/bench_tls.py --clients 4 --duration 5
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_folder = os.path.dirname(os.path.abspath(__file__))
+proj_folder = os.path.abspath(os.path.join(bench_folder, '..'))
+
+UPGRADE_REQUEST = (
+    "GET / HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+SERVER_SCRIPT = """
+import logging
+import sys
+sys.path.insert(0, {path!r})
+from websock import WebSocketServer, create_server_context
+context = create_server_context({certfile!r}, session_tickets={tickets})
+server = WebSocketServer("127.0.0.1", {port}, ssl_context=context)
+logging.disable(logging.CRITICAL)
+server.serve_forever(event_loop=True)
+"""
+
+
+def make_certificate(folder):
+    certfile = os.path.join(folder, "cert.pem")
+    subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                           "-subj", "/CN=localhost", "-keyout", certfile, "-out", certfile],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    """Returns the user and system CPU time of a process in seconds."""
+    with open("/proc/{}/stat".format(pid)) as stat:
+        fields = stat.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def reconnect(args):
+    """Reconnects in a loop until duration has passed.
+
+    :returns: A tuple of (handshakes, resumed).
+    """
+    port, certfile, resume, duration = args
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(certfile)
+    session = None
+    handshakes = resumed = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        sock = socket.create_connection(("127.0.0.1", port))
+        # Browsers do the same, otherwise the upgrade request waits for the ACK of the client's Finished.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock = context.wrap_socket(sock, server_hostname="localhost", session=session)
+        sock.sendall(UPGRADE_REQUEST)
+        response = b""
+        while not response.endswith(b"\r\n\r\n"):
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+        handshakes += 1
+        resumed += sock.session_reused
+        if resume:
+            # TLS 1.3 tickets are sent after the handshake and have been read with the response.
+            session = sock.session
+        sock.close()
+    return handshakes, resumed
+
+
+def bench(certfile, clients, duration, resume):
+    port = free_port()
+    script = SERVER_SCRIPT.format(path=proj_folder, certfile=certfile, port=port, tickets=2 if resume else 0)
+    server = subprocess.Popen([sys.executable, "-c", script])
+    time.sleep(0.5)
+    try:
+        cpu = cpu_seconds(server.pid)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(reconnect, [(port, certfile, resume, duration)] * clients)
+        cpu = cpu_seconds(server.pid) - cpu
+    finally:
+        server.kill()
+        server.wait()
+    handshakes = sum(result[0] for result in results)
+    resumed = sum(result[1] for result in results)
+    return handshakes / duration, resumed, cpu / max(handshakes, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--clients", type=int, default=4, help="Client processes reconnecting at the same time.")
+    args = parser.parse_args()
+    if shutil.which("openssl") is None:
+        sys.exit("openssl is needed to create a certificate")
+
+    folder = tempfile.mkdtemp()
+    try:
+        certfile = make_certificate(folder)
+        for name, resume in (("full", False), ("resumed", True)):
+            rate, resumed, cpu = bench(certfile, args.clients, args.duration, resume)
+            print("{:<8} {:>8.0f} handshakes/s {:>7.0f} us server CPU/handshake, {} resumed".format(
+                name, rate, cpu * 1e6, resumed))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compares the byte by byte generator used to unmask payloads with the block based paths in websock.Masking.
+
+    $ python benchmarks/bench_unmask.py
+"""
+import argparse
+import os
+import sys
+import timeit
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, proj_folder)
+
+from websock import Masking
+
+MASK_KEY = b'\x8a\x13\xf0\x5c'
+SIZES = [16, 256, 4096, 65536, 1 << 20, 16 << 20]
+
+
+def generator_unmask(data, mask_key, out):
+    """The original implementation."""
+    return bytearray(data[i]^mask_key[i%4] for i in range(len(data)))
+
+
+def measure(function, data, budget):
+    """Returns the best time per call in seconds."""
+    out = bytearray(len(data))
+    number = 1
+    # Find a number of iterations that takes roughly the budget.
+    while True:
+        elapsed = timeit.timeit(lambda: function(data, MASK_KEY, out), number=number)
+        if elapsed > budget / 5 or number >= 1 << 20:
+            break
+        number *= 4
+    best = min(timeit.repeat(lambda: function(data, MASK_KEY, out), number=number, repeat=3))
+    return best / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=0.5, help="Rough number of seconds spent per measurement.")
+    parser.add_argument("--max-size", type=int, default=16 << 20)
+    args = parser.parse_args()
+
+    paths = [("generator", generator_unmask), ("int blocks", Masking._unmask_int)]
+    if Masking.numpy is not None:
+        paths.append(("numpy", Masking._unmask_numpy))
+
+    print("{:>10} ".format("size") + "".join("{:>16}".format(name) for name, _ in paths))
+    for size in SIZES:
+        if size > args.max_size:
+            break
+        data = os.urandom(size)
+        row = "{:>10} ".format(size)
+        for _, function in paths:
+            seconds = measure(function, data, args.budget)
+            row += "{:>11.1f} MB/s".format(size / seconds / 1e6)
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
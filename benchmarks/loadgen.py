@@ -0,0 +1,126 @@
+"""A load generator speaking raw RFC 6455 over asyncio.
+
+It does not depend on websock so the server is only driven through the wire protocol, and
+it is kept small enough that thousands of clients can run in one process.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def mask(payload, key):
+    """XOR a payload with a 4 byte masking key, using big integers so large payloads are fast."""
+    size = len(payload)
+    if not size:
+        return b''
+    repeated = (key * (size // 4 + 1))[:size]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(size, 'big')
+
+
+def encode_frame(payload, opcode=TEXT, fin=True):
+    """Build a masked client frame.
+
+    :param payload: The payload as bytes.
+    :param opcode: The opcode of the frame.
+    :param fin: False if more fragments follow.
+    """
+    first = (0x80 if fin else 0) | opcode
+    size = len(payload)
+    if size < 126:
+        header = struct.pack('!BB', first, 0x80 | size)
+    elif size <= 0xFFFF:
+        header = struct.pack('!BBH', first, 0x80 | 126, size)
+    else:
+        header = struct.pack('!BBQ', first, 0x80 | 127, size)
+    key = os.urandom(4)
+    return header + key + mask(payload, key)
+
+
+class HandshakeError(Exception):
+    pass
+
+
+class Client:
+    """One WebSocket connection."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port, path='/'):
+        """Open a connection and complete the opening handshake.
+
+        :returns: The connected Client.
+        :raises HandshakeError: If the server did not switch protocols.
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        key = base64.b64encode(os.urandom(16))
+        writer.write(b"GET " + path.encode() + b" HTTP/1.1\r\n"
+                     b"Host: " + host.encode() + b"\r\n"
+                     b"Upgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: " + key + b"\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        response = await reader.readuntil(b"\r\n\r\n")
+        accept = base64.b64encode(hashlib.sha1(key + _GUID).digest())
+        if not response.startswith(b"HTTP/1.1 101") or accept not in response:
+            writer.close()
+            raise HandshakeError(response.split(b"\r\n", 1)[0].decode(errors='replace'))
+        return cls(reader, writer)
+
+    def send(self, payload, opcode=None):
+        """Queue a message, TEXT for Strings and BINARY for bytes unless opcode is given."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+            if opcode is None:
+                opcode = TEXT
+        self.writer.write(encode_frame(payload, BINARY if opcode is None else opcode))
+
+    async def recv(self):
+        """Receive the next message, answering PINGs on the way.
+
+        :returns: A tuple of (opcode, payload) or (CLOSE, payload) once the server closes.
+        """
+        opcode = None
+        fragments = []
+        while True:
+            first, second = await self.reader.readexactly(2)
+            size = second & 0x7F
+            if size == 126:
+                size = struct.unpack('!H', await self.reader.readexactly(2))[0]
+            elif size == 127:
+                size = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+            payload = await self.reader.readexactly(size) if size else b''
+            frame_opcode = first & 0x0F
+            if frame_opcode == PING:
+                self.send(payload, PONG)
+                continue
+            if frame_opcode == PONG:
+                continue
+            if frame_opcode == CLOSE:
+                return (CLOSE, payload)
+            if frame_opcode:
+                opcode = frame_opcode
+            fragments.append(payload)
+            if first & 0x80:
+                return (opcode, fragments[0] if len(fragments) == 1 else b''.join(fragments))
+
+    async def close(self):
+        """Close the TCP connection without waiting for the closing handshake."""
+        self.writer.close()
+        if hasattr(self.writer, 'wait_closed'):
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
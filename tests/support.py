@@ -0,0 +1,121 @@
+""" Helpers shared by the tests that talk to a server the way a client would.
+"""
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+
+UPGRADE_REQUEST = (
+    "GET /chat HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+).encode()
+
+# "This is a test message." sent as a masked TEXT frame.
+MASKED_FRAME = b'\x81\x97p\xb4\x99"$\xdc\xf0QP\xdd\xea\x02\x11\x94\xedG\x03\xc0\xb9O\x15\xc7\xeaC\x17\xd1\xb7'
+
+
+def masked_frame(payload, opcode=WS.FrameType.TEXT, fin=1, mask_key=b'\x01\x02\x03\x04'):
+    """Builds a masked frame the way a client would."""
+    header = bytearray([(fin << 7) | opcode])
+    if len(payload) < 126:
+        header.append(0x80 | len(payload))
+    elif len(payload) < 65536:
+        header.append(0x80 | 126)
+        header.extend(len(payload).to_bytes(2, 'big'))
+    else:
+        header.append(0x80 | 127)
+        header.extend(len(payload).to_bytes(8, 'big'))
+    return bytes(header) + mask_key + bytes(WS.Masking.unmask(payload, mask_key))
+
+
+def recv_exactly(sock, size):
+    """Returns the next size bytes received, fewer if the connection is closed first."""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    """Returns the (opcode, payload) of the next small unmasked frame sent by the server,
+    (None, None) if the connection is closed."""
+    header = recv_exactly(sock, 2)
+    if len(header) < 2:
+        return (None, None)
+    return (header[0] & 0x0F, recv_exactly(sock, header[1] & 0x7F))
+
+
+def read_response(sock):
+    """Returns the HTTP response head sent by the server."""
+    response = b''
+    while not response.endswith(b'\r\n\r\n'):
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        response += chunk
+    return response
+
+
+class ServerTestCase(unittest.TestCase):
+    """Runs servers on a free loopback port, each one is closed when the test ends."""
+
+    def start_server(self, event_loop=True, **kwargs):
+        """Start a WebSocketServer on a thread of its own.
+
+        :param event_loop: Passed on to serve_forever.
+        :param kwargs: Passed on to the WebSocketServer.
+
+        :returns: The server, also kept as self.server with its port as self.port.
+        """
+        server = WS.WebSocketServer("127.0.0.1", 0, **kwargs)
+        server.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_thread = threading.Thread(target=server.serve_forever, kwargs={'event_loop': event_loop}, daemon=True)
+        server_thread.start()
+        self.addCleanup(self.stop_server, server, server_thread)
+        if event_loop:
+            while server.event_loop is None:
+                time.sleep(0.01)
+        else:
+            while server.server.getsockname()[1] == 0:
+                time.sleep(0.01)
+        self.server = server
+        self.server_thread = server_thread
+        self.port = server.server.getsockname()[1]
+        return server
+
+    @staticmethod
+    def stop_server(server, server_thread):
+        """Close a server unless the test already did, and wait for its event loop to stop."""
+        if server.alive:
+            server.close_server()
+        if server.event_loop is not None:
+            server_thread.join(5)
+
+    def connect(self):
+        """Open a socket to the server and complete the opening handshake, it is closed when the test ends."""
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(UPGRADE_REQUEST)
+        self.assertTrue(read_response(sock).startswith(b'HTTP/1.1 101'))
+        return sock
+
+    def wait_for(self, condition, timeout=5):
+        """Wait until condition() is true, at most timeout seconds."""
+        started = time.monotonic()
+        while not condition() and time.monotonic() - started < timeout:
+            time.sleep(0.01)
@@ -0,0 +1,104 @@
+import socket
+import time
+import unittest
+from unittest import mock
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import ServerTestCase, UPGRADE_REQUEST, read_response
+
+
+class TestAdmissionControl(unittest.TestCase):
+
+    def test_connection_limits(self):
+        """Test that the global limit refuses with 503, the per address limit with 429, and releases make room."""
+        admission = WS.AdmissionControl(max_connections=3, max_connections_per_ip=2)
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        self.assertEqual(429, admission.admit('10.0.0.1'))
+        self.assertIsNone(admission.admit('10.0.0.2'))
+        self.assertEqual(503, admission.admit('10.0.0.3'))
+
+        admission.release('10.0.0.1')
+        self.assertIsNone(admission.admit('10.0.0.1'))
+        for _ in range(2):
+            admission.release('10.0.0.1')
+        admission.release('10.0.0.2')
+        self.assertEqual(0, admission.connections)
+        self.assertEqual({}, admission._per_ip)
+
+    def test_token_bucket(self):
+        """Test that an address may open burst connections at once and then rate per second."""
+        admission = WS.AdmissionControl(rate=2, burst=3)
+        for _ in range(3):
+            self.assertIsNone(admission.admit('10.0.0.1', now=100.0))
+        self.assertEqual(429, admission.admit('10.0.0.1', now=100.0))
+        self.assertIsNone(admission.admit('10.0.0.2', now=100.0))
+        self.assertIsNone(admission.admit('10.0.0.1', now=100.5))
+        self.assertEqual(429, admission.admit('10.0.0.1', now=100.6))
+        self.assertIsNone(admission.admit('10.0.0.1', now=101.5))
+        self.assertIsNone(admission.admit('10.0.0.1', now=101.5))
+
+
+class TestServerAdmission(ServerTestCase):
+
+    def test_refused_before_state(self):
+        """Test that a client over its limit is answered with 429 without being registered."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, admission=WS.AdmissionControl(max_connections_per_ip=1))
+                first = self.connect()
+
+                second = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+                self.addCleanup(second.close)
+                second.sendall(UPGRADE_REQUEST)
+                self.assertTrue(read_response(second).startswith(b'HTTP/1.1 429'))
+                self.assertEqual(1, len(server.clients))
+                self.assertEqual(1, server.stats()['connections_refused'])
+
+                first.close()
+                self.wait_for(lambda: not server.admission.connections)
+                self.assertEqual(0, server.admission.connections)
+
+    def test_handshake_timeout(self):
+        """Test that a client that never finishes its upgrade request is dropped."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, handshake_timeout=0.2)
+                sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+                self.addCleanup(sock.close)
+                sock.sendall(UPGRADE_REQUEST[:20])
+                started = time.monotonic()
+                self.assertEqual(b'', sock.recv(1024))
+                self.assertLess(time.monotonic() - started, 2)
+                self.assertEqual(1, server.stats()['handshake_timeouts'])
+
+    def test_setup_failure_releases_slot(self):
+        """Test that an admitted client whose socket cannot be set up gives its slot back."""
+        setsockopt = socket.socket.setsockopt
+
+        def failing_setsockopt(sock, level, option, value):
+            if option == socket.TCP_NODELAY:
+                raise ConnectionResetError("reset by peer")
+            return setsockopt(sock, level, option, value)
+
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, tcp_nodelay=True, admission=WS.AdmissionControl(max_connections_per_ip=1))
+                with mock.patch.object(socket.socket, 'setsockopt', failing_setsockopt):
+                    sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+                    self.addCleanup(sock.close)
+                    self.assertEqual(b'', sock.recv(1024))
+                self.wait_for(lambda: not server.admission.connections)
+                self.assertEqual(0, server.admission.connections)
+                self.assertTrue(server.alive)
+                self.connect()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import UPGRADE_REQUEST, MASKED_FRAME, masked_frame
+
+
+class TestAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _echo(self, server):
+        async def run():
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(UPGRADE_REQUEST)
+            response = await reader.readuntil(b'\r\n\r\n')
+            writer.write(MASKED_FRAME)
+            expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+            echo = await reader.readexactly(len(expected))
+            writer.close()
+            await server.close_server()
+            return response, echo, expected
+
+        response, echo, expected = self.loop.run_until_complete(run())
+        self.assertTrue(response.startswith(b'HTTP/1.1 101'))
+        self.assertEqual(expected, echo)
+
+    def test_async_callback(self):
+        """Test that coroutine callbacks can await send."""
+        async def on_data_receive(client, data):
+            await client.send(data + '!')
+
+        self._echo(WS.AsyncWebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive))
+
+    def test_async_iterator(self):
+        """Test that messages can be consumed by iterating over the client."""
+        async def on_connection_open(client):
+            async for data in client:
+                await client.send(data + '!')
+
+        self._echo(WS.AsyncWebSocketServer("127.0.0.1", 0, on_connection_open=on_connection_open))
+
+    def test_request_limits(self):
+        """Test that oversized and malformed upgrade requests are answered with an HTTP error."""
+        errors = []
+        server = WS.AsyncWebSocketServer("127.0.0.1", 0, on_error=errors.append, max_request_size=1024, max_request_headers=10)
+        cookie = b"Cookie: " + b"x" * 100000 + b"\r\n\r\n"
+        requests = [
+            UPGRADE_REQUEST[:-2] + cookie,
+            UPGRADE_REQUEST[:-2] + b"X-A: 1\r\n" * 10 + b"\r\n",
+            b"GET /\r\n\r\n",
+        ]
+
+        async def run():
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            responses = []
+            for request in requests:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(request)
+                responses.append(await reader.read())
+                writer.close()
+            await server.close_server()
+            return responses
+
+        responses = self.loop.run_until_complete(run())
+        self.assertTrue(responses[0].startswith(b'HTTP/1.1 431'))
+        self.assertTrue(responses[1].startswith(b'HTTP/1.1 431'))
+        self.assertTrue(responses[2].startswith(b'HTTP/1.1 400'))
+        self.assertEqual([431, 431, 400], [exc.status for exc in errors])
+
+    def test_invalid_handshake(self):
+        """Test that an upgrade request that cannot be accepted is answered with 400."""
+        errors = []
+        server = WS.AsyncWebSocketServer("127.0.0.1", 0, on_error=errors.append)
+
+        async def run():
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(UPGRADE_REQUEST.replace(b"Upgrade: websocket\r\n", b""))
+            response = await reader.read()
+            writer.close()
+            await server.close_server()
+            return response
+
+        self.assertTrue(self.loop.run_until_complete(run()).startswith(b'HTTP/1.1 400'))
+        self.assertIsInstance(errors[0], WS.WebSocketInvalidHandshake)
+
+    def test_close_status_echo(self):
+        """Test that the closing handshake echoes the status code sent by the client."""
+        closed = []
+        server = WS.AsyncWebSocketServer("127.0.0.1", 0, on_connection_close=closed.append)
+
+        async def run():
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(UPGRADE_REQUEST)
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(masked_frame(int(WS.CloseStatus.GOING_AWAY).to_bytes(2, 'big'), WS.FrameType.CLOSE))
+            close = await reader.read()
+            writer.close()
+            await server.close_server()
+            return close
+
+        close = self.loop.run_until_complete(run())
+        self.assertEqual(WS.WebSocketServer._encode_data_frame(WS.FrameType.CLOSE, int(WS.CloseStatus.GOING_AWAY).to_bytes(2, 'big')), close)
+        self.assertEqual(1, len(closed))
+        self.assertEqual({}, server.clients)
+
+    def test_handler_error(self):
+        """Test that a client whose handler raises is reported to on_error and torn down."""
+        errors = []
+        closed = []
+
+        async def on_data_receive(client, data):
+            raise ValueError(data)
+
+        server = WS.AsyncWebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive,
+                                         on_error=errors.append, on_connection_close=closed.append)
+
+        async def run():
+            await server.start()
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(UPGRADE_REQUEST)
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(MASKED_FRAME)
+            rest = await reader.read()
+            writer.close()
+            await server.close_server()
+            return rest
+
+        self.assertEqual(b'', self.loop.run_until_complete(run()))
+        self.assertIsInstance(errors[0], ValueError)
+        self.assertEqual(1, len(closed))
+        self.assertEqual({}, server.clients)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import socket
+import unittest
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Connection import Connection
+
+
+class TestBroadcast(unittest.TestCase):
+
+    def setUp(self):
+        self.server = WS.WebSocketServer(None, None)
+        self.peers = []
+        for i in range(4):
+            client, peer = socket.socketpair()
+            address = ('127.0.0.1', i)
+            self.server.clients[address] = client
+            self.server._connections[client] = Connection(client, address)
+            self.peers.append(peer)
+
+    def tearDown(self):
+        for client in self.server.clients.values():
+            client.close()
+        for peer in self.peers:
+            peer.close()
+        self.server.server.close()
+
+    def test_broadcast(self):
+        """Test that every client but the excluded one receives the message."""
+        clients = list(self.server.clients.values())
+        expected = bytes(WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "hello"))
+        for executor in (None, ThreadPoolExecutor(2)):
+            failures = self.server.broadcast("hello", exclude=clients[0], executor=executor)
+            self.assertEqual({}, failures)
+            for peer in self.peers[1:]:
+                self.assertEqual(expected, peer.recv(1024))
+            self.peers[0].setblocking(False)
+            self.assertRaises(BlockingIOError, self.peers[0].recv, 1024)
+
+    def test_failures_are_reported(self):
+        """Test that a failing client does not stop the broadcast."""
+        clients = list(self.server.clients.values())
+        clients[1].close()
+        failures = self.server.broadcast(b'\x00\x01')
+        self.assertEqual([clients[1]], list(failures))
+        self.assertEqual(b'\x82\x02\x00\x01', self.peers[3].recv(1024))
+
+    def test_shared_frame(self):
+        """Test that the frame is only built once for clients without their own compression context."""
+        frames = {}
+        no_takeover = WS.PerMessageDeflate(server_no_context_takeover=True, threshold=0)
+        takeover = WS.PerMessageDeflate(threshold=0)
+        first = WS.WebSocketServer._shared_frame(frames, None, WS.FrameType.TEXT, b'hello')
+        self.assertIs(first, WS.WebSocketServer._shared_frame(frames, None, WS.FrameType.TEXT, b'hello'))
+
+        compressed = WS.WebSocketServer._shared_frame(frames, no_takeover.negotiate("permessage-deflate")[0], WS.FrameType.TEXT, b'hello')
+        self.assertIs(compressed, WS.WebSocketServer._shared_frame(frames, no_takeover.negotiate("permessage-deflate")[0], WS.FrameType.TEXT, b'hello'))
+        self.assertIsNot(first, compressed)
+        self.assertIsNone(WS.WebSocketServer._shared_frame(frames, takeover.negotiate("permessage-deflate")[0], WS.FrameType.TEXT, b'hello'))
+
+
+if __name__ == "__main__":
+    unittest.main()
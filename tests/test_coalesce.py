@@ -0,0 +1,87 @@
+import socket
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import ServerTestCase, recv_frame
+
+
+class TestCoalescing(ServerTestCase):
+
+    def connect(self):
+        """Returns the socket of a new client and the server side Client."""
+        sock = super().connect()
+        self.wait_for(lambda: self.server.clients)
+        return sock, next(iter(self.server.clients.values()))
+
+    def test_window(self):
+        """Test that the frames sent during a window are written in order with one system call."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, coalesce_delay=0.05)
+                sock, client = self.connect()
+                writes = server.stats(client)['writes_out']
+                started = time.monotonic()
+                for number in range(20):
+                    server.send(client, str(number))
+                self.assertEqual([str(number).encode() for number in range(20)], [recv_frame(sock)[1] for _ in range(20)])
+                self.assertGreaterEqual(time.monotonic() - started, 0.04)
+                self.assertEqual(1, server.stats(client)['writes_out'] - writes)
+                self.assertEqual(20, server.stats(client)['frames_out'])
+
+    def test_byte_budget(self):
+        """Test that a window ends as soon as its byte budget is spent."""
+        self.start_server(coalesce_delay=30, coalesce_bytes=100)
+        sock, client = self.connect()
+        started = time.monotonic()
+        for _ in range(4):
+            self.server.send(client, "x" * 28)
+        self.assertEqual([b"x" * 28] * 4, [recv_frame(sock)[1] for _ in range(4)])
+        self.assertLess(time.monotonic() - started, 5)
+
+        self.server.set_coalescing(client, None)
+        self.server.send(client, "now")
+        self.assertEqual(b"now", recv_frame(sock)[1])
+
+    def test_batch_and_tcp_options(self):
+        """Test that a batch is sent as one message and that the TCP options are applied."""
+        self.start_server(tcp_nodelay=True)
+        sock, client = self.connect()
+        self.assertEqual(1, client.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        self.server.set_tcp_options(client, nodelay=False)
+        self.assertEqual(0, client.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+        if hasattr(socket, 'TCP_CORK'):
+            self.server.set_tcp_options(client, cork=True)
+            self.assertEqual(1, client.getsockopt(socket.IPPROTO_TCP, socket.TCP_CORK))
+            self.server.set_tcp_options(client, cork=False)
+
+        self.server.send_batch(client, ["a", "b", "c"])
+        self.assertEqual((WS.FrameType.TEXT, b"a\nb\nc"), recv_frame(sock))
+        self.server.send_batch(client, [b"\x00", b"\x01"], separator=b"")
+        self.assertEqual((WS.FrameType.BINARY, b"\x00\x01"), recv_frame(sock))
+
+
+class TestCallAt(unittest.TestCase):
+
+    def test_order(self):
+        """Test that deadlines shorter than a tick of the timer wheel are kept."""
+        loop = WS.EventLoop.EventLoop()
+        fired = []
+        now = time.monotonic()
+        loop.call_at(now + 0.02, fired.append, 2)
+        loop.call_at(now + 0.01, fired.append, 1)
+        while len(fired) < 2 and time.monotonic() - now < 2:
+            loop.run_once()
+        loop.close()
+        self.assertEqual([1, 2], fired)
+        self.assertLess(time.monotonic() - now, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
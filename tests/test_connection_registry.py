@@ -0,0 +1,110 @@
+import socket
+import threading
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Connection import Connection
+from websock.ConnectionRegistry import ConnectionRegistry
+
+
+class TestConnectionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def connection(self, port):
+        client, peer = socket.socketpair()
+        self.sockets.extend((client, peer))
+        return Connection(client, ('127.0.0.1', port))
+
+    def test_ids_and_lookups(self):
+        """Test that ids increase, are never reused and every index follows additions and removals."""
+        registry = ConnectionRegistry()
+        first, second = self.connection(1), self.connection(2)
+        self.assertEqual(1, registry.add(first))
+        self.assertEqual(2, registry.add(second))
+        self.assertIs(second, registry.by_id(2))
+        self.assertIs(first.client, registry.by_address[('127.0.0.1', 1)])
+
+        snapshot = registry.snapshot()
+        registry.pop(first.client)
+        self.assertEqual((first, second), snapshot)
+        self.assertEqual((second,), registry.snapshot())
+        self.assertIsNone(registry.by_id(1))
+        self.assertNotIn(('127.0.0.1', 1), registry.by_address)
+        self.assertEqual(3, registry.add(self.connection(3)))
+
+    def test_tags(self):
+        """Test that clients are found by tag and dropped from the index when removed or retagged."""
+        registry = ConnectionRegistry()
+        connections = [self.connection(port) for port in range(3)]
+        for connection in connections:
+            registry.add(connection)
+        registry.tag(connections[0].client, 'user', 'kai')
+        registry.tag(connections[1].client, 'user', 'kai')
+        registry.tag(connections[2].client, 'user', 'fraser')
+        self.assertEqual([connections[0].client, connections[1].client], registry.tagged('user', 'kai'))
+
+        registry.tag(connections[1].client, 'user', 'fraser')
+        registry.pop(connections[0].client)
+        self.assertEqual([], registry.tagged('user', 'kai'))
+        self.assertEqual([connections[2].client, connections[1].client], registry.tagged('user', 'fraser'))
+        registry.untag(connections[2].client, 'user')
+        self.assertEqual([connections[1].client], registry.tagged('user', 'fraser'))
+
+
+class TestServerRegistry(unittest.TestCase):
+
+    def test_broadcast_under_churn(self):
+        """Test that broadcasting while other threads add and close clients never fails."""
+        server = WS.WebSocketServer(None, None)
+        sockets = []
+        lock = threading.Lock()
+        stop = threading.Event()
+        errors = []
+
+        def churn(offset):
+            port = offset
+            while not stop.is_set():
+                client, peer = socket.socketpair()
+                with lock:
+                    sockets.extend((client, peer))
+                address = ('127.0.0.1', port)
+                server._connections.add(Connection(client, address))
+                server.tag(client, 'group', offset)
+                server.close_client(address, hard_close=True)
+                port += 4
+
+        threads = [threading.Thread(target=churn, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(2000):
+                server.broadcast(b'x', local=True)
+                server.tagged('group', 0)
+        except RuntimeError as exc:
+            errors.append(exc)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            server.server.close()
+            for sock in sockets:
+                sock.close()
+        self.assertEqual([], errors)
+        self.assertEqual(0, len(server._connections))
+        self.assertEqual([], server.tagged('group', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,15 @@ class TestDataFrameDecode(unittest.TestCase):
         self.assertTrue(valid is not None)
         self.assertEqual(expected_decoded_data, decoded_data)
 
+    def test_decode_binary(self):
+        """Test that binary payloads are returned without being decoded."""
+        encoded_data = b'\x82\x84\x01\x02\x03\x04\xfe\xfd\xfc\xfb'
+
+        valid, decoded_data = WS.WebSocketServer._decode_data_frame(encoded_data)
+        self.assertEqual(WS.FrameType.BINARY, valid)
+        self.assertIsInstance(decoded_data, memoryview)
+        self.assertEqual(b'\xff\xff\xff\xff', bytes(decoded_data))
+
 
 if __name__ == "__main__":
     unittest.main()
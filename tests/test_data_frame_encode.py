@@ -16,6 +16,24 @@ class TestDataFrameEncode(unittest.TestCase):
         decoded_data = "This is a test message."
         expected_encoded_data = b'\x81\x97p\xb4\x99"$\xdc\xf0QP\xdd\xea\x02\x11\x94\xedG\x03\xc0\xb9O\x15\xc7\xeaC\x17\xd1\xb7'
 
+    def test_encode_binary(self):
+        """Test that bytes-like objects are framed as they are."""
+        expected_encoded_data = b'\x82\x03\x00\xff\x10'
+        for data in (b'\x00\xff\x10', bytearray(b'\x00\xff\x10'), memoryview(b'\x00\xff\x10')):
+            data_type = WS.WebSocketServer._data_type(data)
+            self.assertEqual(WS.FrameType.BINARY, data_type)
+            self.assertEqual(expected_encoded_data, WS.WebSocketServer._encode_data_frame(data_type, data))
+
+    def test_encode_lengths(self):
+        """Test the 7 bit, 16 bit and 64 bit payload length encodings."""
+        for size, header in ((125, b'\x82\x7d'), (126, b'\x82\x7e\x00\x7e'), (65535, b'\x82\x7e\xff\xff'),
+                             (65536, b'\x82\x7f\x00\x00\x00\x00\x00\x01\x00\x00')):
+            data = bytes(size)
+            self.assertEqual(header + data, WS.WebSocketServer._encode_data_frame(WS.FrameType.BINARY, data))
+            parts = WS.WebSocketServer._encode_message_parts(None, WS.FrameType.BINARY, data)
+            self.assertEqual(header, parts[0])
+            self.assertIs(data, parts[1])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+import struct
+import tempfile
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock import Handoff
+from tests.support import ServerTestCase, masked_frame, recv_frame
+
+
+class TestDrain(ServerTestCase):
+
+    def start_server(self, event_loop=True, **kwargs):
+        self.closed = []
+        return super().start_server(event_loop, on_connection_close=self.closed.append, **kwargs)
+
+    def test_client_close(self):
+        """Test that a CLOSE frame from a client is answered with its status code and closes the connection."""
+        server = self.start_server()
+        sock = self.connect()
+        sock.sendall(masked_frame(struct.pack('!H', WS.CloseStatus.NORMAL), opcode=0x8))
+        self.assertEqual((WS.FrameType.CLOSE, struct.pack('!H', WS.CloseStatus.NORMAL)), recv_frame(sock))
+        self.assertEqual(b'', sock.recv(1))
+        self.wait_for(lambda: not server.clients)
+        self.assertEqual(1, len(self.closed))
+        self.assertEqual({WS.CloseStatus.NORMAL: 1}, server.stats()['close_codes'])
+
+    def test_drain(self):
+        """Test that a drain spreads the CLOSE frames, waits for the acknowledgements and drops the rest."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop)
+                socks = [self.connect() for _ in range(3)]
+                self.wait_for(lambda: len(server.clients) == 3)
+                started = time.monotonic()
+                server.drain(WS.CloseStatus.GOING_AWAY, window=0.4, timeout=0.3)
+
+                received = []
+                for sock in socks:
+                    self.assertEqual((WS.FrameType.CLOSE, struct.pack('!H', WS.CloseStatus.GOING_AWAY)), recv_frame(sock))
+                    received.append(time.monotonic() - started)
+                self.assertGreater(received[-1] - received[0], 0.15)
+                # The first two clients complete the close, the last one never answers.
+                for sock in socks[:2]:
+                    sock.sendall(masked_frame(struct.pack('!H', WS.CloseStatus.GOING_AWAY), opcode=0x8))
+                    self.assertEqual(b'', sock.recv(1))
+                self.assertFalse(server.drained.is_set())
+
+                self.assertTrue(server.drained.wait(5))
+                self.assertEqual(b'', socks[2].recv(1))
+                self.assertGreaterEqual(time.monotonic() - started, 0.6)
+                self.assertEqual({WS.CloseStatus.GOING_AWAY: 2, WS.CloseStatus.ABNORMAL: 1}, server.stats()['close_codes'])
+                self.assertEqual(3, len(self.closed))
+                self.assertFalse(server.alive)
+                self.server_thread.join(5)
+                self.assertFalse(self.server_thread.is_alive())
+
+    def test_handoff(self):
+        """Test that the listening socket is passed to a new server while the old one drains."""
+        old = self.start_server()
+        old_thread = self.server_thread
+        sock = self.connect()
+        path = os.path.join(tempfile.mkdtemp(), "handoff.sock")
+        old.enable_handoff(path, timeout=1.0)
+
+        new = WS.WebSocketServer(listener=Handoff.receive_listener(path))
+        new_thread = threading.Thread(target=new.serve_forever, kwargs={'event_loop': True}, daemon=True)
+        new_thread.start()
+        self.addCleanup(self.stop_server, new, new_thread)
+        self.assertEqual((WS.FrameType.CLOSE, struct.pack('!H', WS.CloseStatus.GOING_AWAY)), recv_frame(sock))
+        sock.sendall(masked_frame(b'', opcode=0x8))
+        self.assertTrue(old.drained.wait(5))
+        old_thread.join(5)
+        self.assertFalse(os.path.exists(path))
+
+        # The old server has closed its copy, the port is still served.
+        self.connect()
+        self.wait_for(lambda: new.clients)
+        self.assertEqual(1, len(new.clients))
+
+
+if __name__ == '__main__':
+    unittest.main()
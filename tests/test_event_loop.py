@@ -0,0 +1,162 @@
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import UPGRADE_REQUEST, MASKED_FRAME, masked_frame, recv_exactly
+
+
+class TestEventLoop(unittest.TestCase):
+
+    def setUp(self):
+        def on_data_receive(client, data):
+            if data == 'boom':
+                raise ValueError(data)
+            if data.startswith('stream:'):
+                self.server.send_stream(client, data[len('stream:'):].split(' '))
+            else:
+                self.server.send(client, data + '!')
+
+        def on_binary_receive(client, data):
+            self.server.send(client, bytes(reversed(data)))
+
+        self.server = WS.WebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive, on_binary_receive=on_binary_receive)
+        self.server.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={'event_loop': True}, daemon=True)
+        self.server_thread.start()
+        while self.server.event_loop is None:
+            time.sleep(0.01)
+        self.port = self.server.server.getsockname()[1]
+        self.threads = set(threading.enumerate())
+
+    def tearDown(self):
+        self.server.close_server()
+        self.server_thread.join(5)
+
+    def _connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        self.assertTrue(response.startswith(b'HTTP/1.1 101'))
+        return sock
+
+    def test_echo_multiple_clients(self):
+        """Test that several clients are served by the single event loop thread."""
+        clients = [self._connect() for _ in range(5)]
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+        for sock in clients:
+            sock.sendall(MASKED_FRAME)
+        for sock in clients:
+            self.assertEqual(expected, recv_exactly(sock, len(expected)))
+            sock.close()
+        self.assertEqual([], [thread for thread in threading.enumerate() if thread not in self.threads])
+
+    def test_callback_error(self):
+        """Test that an exception raised by a callback closes only its client and is passed to on_error."""
+        errors = []
+        self.server.on_error = errors.append
+        other = self._connect()
+        sock = self._connect()
+        sock.sendall(masked_frame(b'boom', WS.FrameType.TEXT, 1))
+        self.assertEqual(b'', recv_exactly(sock, 1))
+        sock.close()
+        self.assertEqual(1, len(errors))
+        self.assertIsInstance(errors[0], ValueError)
+
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+        for client in (other, self._connect()):
+            client.sendall(MASKED_FRAME)
+            self.assertEqual(expected, recv_exactly(client, len(expected)))
+            client.close()
+
+    def test_close_callback_error(self):
+        """Test that a client disconnecting is forgotten even when on_connection_close raises."""
+        def on_connection_close(client):
+            raise ValueError("close")
+
+        self.server.on_connection_close = on_connection_close
+        sock = self._connect()
+        sock.close()
+        deadline = time.monotonic() + 5
+        while self.server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({}, self.server.clients)
+        self.assertEqual(0, len(self.server._connections))
+
+        self.assertTrue(self.server_thread.is_alive())
+        sock = self._connect()
+        sock.sendall(MASKED_FRAME)
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+        self.assertEqual(expected, recv_exactly(sock, len(expected)))
+        sock.close()
+
+    def test_ping_flood(self):
+        """Test that a client flooding PINGs without reading the PONGs is evicted and the loop keeps serving."""
+        self.server.max_write_buffer = 65536
+        self.server.slow_consumer_policy = 'drop'
+        flooder = self._connect()
+        flooder.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        pings = masked_frame(b'p' * 125, WS.FrameType.PING, 1) * 1000
+        try:
+            for _ in range(500):
+                flooder.sendall(pings)
+        except OSError:
+            pass
+        deadline = time.monotonic() + 5
+        while self.server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({}, self.server.clients)
+        flooder.close()
+
+        self.assertTrue(self.server_thread.is_alive())
+        sock = self._connect()
+        sock.sendall(MASKED_FRAME)
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+        self.assertEqual(expected, recv_exactly(sock, len(expected)))
+        sock.close()
+
+    def test_split_frame(self):
+        """Test that a frame split across several reads is reassembled."""
+        sock = self._connect()
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "This is a test message.!")
+        for i in range(len(MASKED_FRAME)):
+            sock.sendall(MASKED_FRAME[i:i+1])
+        self.assertEqual(expected, recv_exactly(sock, len(expected)))
+        sock.close()
+
+    def test_fragmented_messages(self):
+        """Test that fragmented messages are reassembled and send_stream fragments its output."""
+        sock = self._connect()
+        sock.sendall(masked_frame(b'stream:a', WS.FrameType.TEXT, 0))
+        sock.sendall(masked_frame(b' b', WS.FrameType.CONTINUATION, 0))
+        sock.sendall(masked_frame(b' c', WS.FrameType.CONTINUATION, 1))
+        expected = b''.join([
+            WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, 'a', fin=False),
+            WS.WebSocketServer._encode_data_frame(WS.FrameType.CONTINUATION, 'b', fin=False),
+            WS.WebSocketServer._encode_data_frame(WS.FrameType.CONTINUATION, 'c'),
+        ])
+        self.assertEqual(expected, recv_exactly(sock, len(expected)))
+        sock.close()
+
+    def test_binary_message(self):
+        """Test that binary messages reach on_binary_receive undecoded."""
+        sock = self._connect()
+        payload = bytes(range(256)) * 4
+        header = bytes([0x80 | WS.FrameType.BINARY, 0x80 | 126]) + len(payload).to_bytes(2, 'big')
+        sock.sendall(header + b'\0\0\0\0' + payload)
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.BINARY, bytes(reversed(payload)))
+        self.assertEqual(expected, recv_exactly(sock, len(expected)))
+        sock.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
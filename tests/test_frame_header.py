@@ -0,0 +1,37 @@
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.FrameHeader import parse_header, pack_header, OPCODES
+
+
+class TestFrameHeader(unittest.TestCase):
+
+    def test_round_trip(self):
+        """Test that headers built for each length encoding are parsed back."""
+        for size, header_len in ((0, 2), (125, 2), (126, 4), (65535, 4), (65536, 10), (1 << 40, 10)):
+            header = pack_header(WS.FrameType.BINARY, size, fin=False, rsv1=True)
+            self.assertEqual(header_len, len(header))
+            self.assertEqual((0x42, 0, header_len, size), parse_header(header))
+            self.assertIsNone(parse_header(header[:-1]))
+
+    def test_masked(self):
+        """Test that the masking key is counted in the header length."""
+        header = b'\x00\x81\xfe\x00\x80'
+        self.assertEqual((0x81, 0x80, 8, 128), parse_header(header, 1))
+
+    def test_opcodes(self):
+        """Test that only the opcodes defined by RFC 6455 are in the lookup table."""
+        self.assertEqual(16, len(OPCODES))
+        self.assertEqual(set(WS.FrameType), {opcode for opcode in OPCODES if opcode is not None})
+        for frame_type in WS.FrameType:
+            self.assertIs(frame_type, OPCODES[frame_type])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.FrameParser import FrameParser, MessageAssembler, Frame
+from tests.support import MASKED_FRAME, masked_frame
+
+
+class TestFrameParser(unittest.TestCase):
+
+    def test_split_across_chunks(self):
+        """Test that a frame is only returned once every byte has been fed."""
+        parser = FrameParser()
+        for byte in MASKED_FRAME[:-1]:
+            parser.feed(bytes([byte]))
+            self.assertIsNone(parser.next_frame())
+        parser.feed(MASKED_FRAME[-1:])
+        frame = parser.next_frame()
+        self.assertEqual(b"This is a test message.", frame.payload)
+        self.assertEqual(1, frame.fin)
+        self.assertEqual(WS.FrameType.TEXT, frame.opcode)
+
+    def test_pipelined_frames(self):
+        """Test that several frames received in one chunk are all returned."""
+        parser = FrameParser()
+        parser.feed(MASKED_FRAME * 3 + MASKED_FRAME[:5])
+        self.assertEqual(3, len(list(parser)))
+        self.assertEqual(5, parser.pending())
+        parser.feed(MASKED_FRAME[5:])
+        self.assertEqual(b"This is a test message.", parser.next_frame().payload)
+        self.assertEqual(0, parser.pending())
+
+    def test_extended_lengths(self):
+        """Test the 16 and 64 bit payload length encodings."""
+        for size in (125, 126, 65535, 65536, 1 << 20):
+            payload = bytes(i % 251 for i in range(size))
+            frame = masked_frame(payload, WS.FrameType.BINARY)
+            parser = FrameParser()
+            for i in range(0, len(frame), 65536):
+                parser.feed(frame[i:i+65536])
+            self.assertEqual(payload, parser.next_frame().payload)
+
+
+class TestMessageAssembler(unittest.TestCase):
+
+    def test_fragmented_message(self):
+        """Test that fragments are reassembled and control frames pass through in between."""
+        assembler = MessageAssembler()
+        self.assertIsNone(assembler.add(Frame(0, WS.FrameType.TEXT, b'Hello')))
+        self.assertEqual((WS.FrameType.PING, b'ping'), assembler.add(Frame(1, WS.FrameType.PING, b'ping')))
+        self.assertIsNone(assembler.add(Frame(0, WS.FrameType.CONTINUATION, b', ')))
+        opcode, payload = assembler.add(Frame(1, WS.FrameType.CONTINUATION, b'World'))
+        self.assertEqual(WS.FrameType.TEXT, opcode)
+        self.assertEqual(b'Hello, World', payload)
+
+    def test_invalid_sequences(self):
+        """Test that fragmentation rules are enforced."""
+        with self.assertRaises(WS.WebSocketInvalidDataFrame):
+            MessageAssembler().add(Frame(1, WS.FrameType.CONTINUATION, b'x'))
+
+        assembler = MessageAssembler()
+        assembler.add(Frame(0, WS.FrameType.TEXT, b'x'))
+        with self.assertRaises(WS.WebSocketInvalidDataFrame):
+            assembler.add(Frame(1, WS.FrameType.TEXT, b'x'))
+
+        with self.assertRaises(WS.WebSocketInvalidDataFrame):
+            MessageAssembler().add(Frame(0, WS.FrameType.PING, b'x'))
+
+    def test_max_message_size(self):
+        """Test that messages larger than the limit are refused."""
+        assembler = MessageAssembler(max_message_size=8)
+        assembler.add(Frame(0, WS.FrameType.BINARY, b'12345'))
+        with self.assertRaises(WS.WebSocketMessageTooBig):
+            assembler.add(Frame(1, WS.FrameType.CONTINUATION, b'6789'))
+
+        parser = FrameParser(max_frame_size=8)
+        parser.feed(masked_frame(b'123456789'))
+        with self.assertRaises(WS.WebSocketMessageTooBig):
+            parser.next_frame()
+
+
+if __name__ == "__main__":
+    unittest.main()
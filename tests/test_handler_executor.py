@@ -0,0 +1,133 @@
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import UPGRADE_REQUEST, masked_frame
+
+
+class TestHandlerExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = WS.HandlerExecutor(max_workers=4, max_pending=4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_order_per_key(self):
+        """Test that the tasks of a key run in order while different keys run concurrently."""
+        results = {'a': [], 'b': []}
+        running = set()
+        overlap = threading.Event()
+        lock = threading.Lock()
+
+        def task(key, i):
+            with lock:
+                running.add(key)
+                if len(running) > 1:
+                    overlap.set()
+            time.sleep(0.005)
+            with lock:
+                running.discard(key)
+            results[key].append(i)
+
+        for i in range(20):
+            self.executor.submit('a', task, 'a', i)
+            self.executor.submit('b', task, 'b', i)
+            self.executor.wait('a')
+            self.executor.wait('b')
+        self.executor.shutdown()
+        self.assertEqual(list(range(20)), results['a'])
+        self.assertEqual(list(range(20)), results['b'])
+        self.assertTrue(overlap.is_set())
+
+    def test_bounded_queue(self):
+        """Test that submit reports a full queue and on_resume is called once it drains."""
+        release = threading.Event()
+        resumed = threading.Event()
+        self.executor.on_resume = lambda key: resumed.set()
+        accepted = [self.executor.submit('a', release.wait) for _ in range(4)]
+        self.assertEqual([True, True, True, False], accepted)
+        self.assertFalse(self.executor.wait('a', timeout=0.05))
+        release.set()
+        self.assertTrue(resumed.wait(1))
+        self.assertTrue(self.executor.wait('a', timeout=1))
+
+    def test_metrics(self):
+        """Test that queue wait and execution times are recorded and callbacks get the result."""
+        results = []
+        self.executor.submit('a', time.sleep, 0.02)
+        self.executor.submit('a', sum, (1, 2), callback=results.append)
+        self.executor.shutdown()
+        metrics = self.executor.metrics()
+        self.assertEqual([3], results)
+        self.assertEqual(0, metrics['pending'])
+        self.assertEqual(2, metrics['execution']['count'])
+        self.assertGreaterEqual(metrics['execution']['max'], 0.02)
+        self.assertGreaterEqual(metrics['queue_wait']['max'], 0.015)
+
+
+class TestServerHandlerExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.received = []
+
+        def on_data_receive(client, data):
+            self.release.wait(5)
+            self.received.append(data)
+            self.server.send(client, data)
+
+        self.executor = WS.HandlerExecutor(max_pending=2)
+        self.server = WS.WebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive, handler_executor=self.executor)
+        self.server.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={'event_loop': True}, daemon=True)
+        self.server_thread.start()
+        while self.server.event_loop is None:
+            time.sleep(0.01)
+        self.port = self.server.server.getsockname()[1]
+
+    def tearDown(self):
+        self.release.set()
+        self.server.close_server()
+        self.server_thread.join(5)
+        self.executor.shutdown()
+
+    def test_slow_handler_pauses_reading(self):
+        """Test that the event loop stays responsive and stops reading a client whose handler is behind."""
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+
+        messages = ["message {}".format(i) for i in range(6)]
+        sock.sendall(b''.join(masked_frame(message.encode()) for message in messages))
+        time.sleep(0.2)
+        connection = next(iter(self.server._connections.values()))
+        self.assertTrue(connection.read_paused)
+        self.assertEqual(2, self.executor.pending(connection.client))
+
+        self.release.set()
+        expected = b''.join(WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, message) for message in messages)
+        data = b''
+        while len(data) < len(expected):
+            chunk = sock.recv(len(expected) - len(data))
+            if not chunk:
+                break
+            data += chunk
+        self.assertEqual(expected, data)
+        self.assertEqual(messages, self.received)
+        self.assertFalse(connection.read_paused)
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -43,6 +43,25 @@ class TestHandShake(unittest.TestCase):
         self.assertTrue(valid)
         self.assertEqual(expected_upgrade_response, upgrade_response.decode())
 
+    def test_accept_cache(self):
+        """Test that a retried Sec-WebSocket-Key is answered from the cache with the same response."""
+        upgrade_request = (
+            "GET /chat HTTP/1.1\r\n"
+            "Host: example.com:8000\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode()
+
+        ws = WS.WebSocketServer(None, None)
+        cached = WS.WebSocketServer(None, None, accept_cache_size=2)
+        responses = [cached._opening_handshake(None, upgrade_request) for _ in range(3)]
+        self.assertEqual([ws._opening_handshake(None, upgrade_request)] * 3, responses)
+        self.assertEqual(2, cached._accept.cache_info().hits)
+        ws.server.close()
+        cached.server.close()
+
     def test_handshake_invalid(self):
         """Test the handshake output for an invalid upgrade request."""
         upgrade_request_bad_upgrade = (
@@ -0,0 +1,137 @@
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.HttpParser import HttpParser, handshake_response
+from tests.support import masked_frame
+
+UPGRADE_REQUEST = (
+    "GET /chat?room=lobby&user=kai HTTP/1.1\r\n"
+    "Host: localhost\r\n"
+    "upgrade: WebSocket\r\n"
+    "Connection: keep-alive, Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Version: 13\r\n"
+    "Cookie: session=" + "x" * 4096 + "\r\n\r\n"
+).encode()
+
+
+class TestHttpParser(unittest.TestCase):
+
+    def test_partial_reads(self):
+        """Test that a request fed one byte at a time is parsed once its header is complete."""
+        parser = HttpParser()
+        data = UPGRADE_REQUEST + b'frame'
+        for i in range(len(UPGRADE_REQUEST) - 1):
+            self.assertIsNone(parser.feed(data[i:i + 1]))
+        request = parser.feed(data[len(UPGRADE_REQUEST) - 1:])
+        self.assertEqual(b'frame', parser.leftover)
+        self.assertEqual("GET", request.method)
+        self.assertEqual("/chat", request.path)
+        self.assertEqual({'room': ['lobby'], 'user': ['kai']}, request.params())
+        self.assertEqual("WebSocket", request.header("Upgrade"))
+        self.assertTrue(request.has_token("connection", "upgrade"))
+        self.assertEqual(4104, len(request.header("cookie")))
+
+    def test_repeated_fields(self):
+        """Test that repeated header fields are joined and empty values are kept."""
+        request = HttpParser().feed(b"GET / HTTP/1.1\r\nX-A: 1\r\nx-a:2\r\nX-Empty:\r\n\r\n")
+        self.assertEqual("1, 2", request.header("x-a"))
+        self.assertEqual("", request.header("x-empty"))
+
+    def test_limits(self):
+        """Test that malformed and oversized requests are refused with the right status."""
+        cases = [
+            (HttpParser(), b"GET /\r\n\r\n", 400),
+            (HttpParser(), b"GET / HTTP/1.1\r\nNo colon\r\n\r\n", 400),
+            (HttpParser(), b"GET / HTTP/1.1\r\n folded: value\r\n\r\n", 400),
+            (HttpParser(max_size=1024), UPGRADE_REQUEST, 431),
+            (HttpParser(max_size=1024), UPGRADE_REQUEST[:2000], 431),
+            (HttpParser(max_headers=4), UPGRADE_REQUEST, 431),
+        ]
+        for parser, data, status in cases:
+            with self.assertRaises(WS.WebSocketBadRequest) as context:
+                parser.feed(data)
+            self.assertEqual(status, context.exception.status)
+
+    def test_handshake_response(self):
+        """Test that the 101 response carries the accept key and that invalid requests are refused."""
+        valid, response, deflate = handshake_response(UPGRADE_REQUEST, WS.WebSocketServer._accept_key)
+        self.assertTrue(valid)
+        self.assertIsNone(deflate)
+        self.assertTrue(response.startswith(b"HTTP/1.1 101 Switching Protocols\r\n"))
+        self.assertIn(b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n\r\n", response)
+
+        request = HttpParser().feed(b"POST /chat HTTP/1.1\r\nUpgrade: websocket\r\nSec-WebSocket-Key: x\r\n\r\n")
+        self.assertEqual((False, None, None), handshake_response(request, WS.WebSocketServer._accept_key))
+
+
+class TestServerHandshake(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.errors = []
+
+        def on_connection_open(client):
+            self.requests.append(self.server.request(client))
+
+        def on_data_receive(client, data):
+            self.server.send(client, data)
+
+        self.server = WS.WebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive, on_connection_open=on_connection_open,
+                                         on_error=self.errors.append, max_request_size=8192)
+        self.server.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={'event_loop': True}, daemon=True)
+        self.server_thread.start()
+        while self.server.event_loop is None:
+            time.sleep(0.01)
+        self.port = self.server.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close_server()
+        self.server_thread.join(5)
+
+    def read_all(self, sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def test_pipelined_frame(self):
+        """Test that a request split over several writes and a frame sent with its end are both handled."""
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST[:100])
+        time.sleep(0.05)
+        sock.sendall(UPGRADE_REQUEST[100:] + masked_frame(b'hello'))
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        self.assertTrue(response.startswith(b"HTTP/1.1 101"))
+        self.assertEqual(b'\x81\x05hello', self.read_all(sock, 7))
+        self.assertEqual("/chat", self.requests[0].path)
+        sock.close()
+
+    def test_request_too_large(self):
+        """Test that a request over max_request_size is answered with 431 and closed."""
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST.replace(b"x" * 4096, b"x" * 10000))
+        response = self.read_all(sock, 1 << 16)
+        self.assertTrue(response.startswith(b"HTTP/1.1 431 Request Header Fields Too Large\r\n"))
+        self.assertEqual([], self.requests)
+        self.assertEqual(431, self.errors[0].status)
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
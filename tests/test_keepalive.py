@@ -0,0 +1,131 @@
+import struct
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import ServerTestCase, masked_frame, recv_frame
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def test_order_and_cancel(self):
+        """Test that timers fire once their tick has passed, in order, unless cancelled."""
+        wheel = WS.TimerWheel(tick=1.0, slots=8)
+        fired = []
+        for delay in (5, 2, 20):
+            wheel.schedule(delay, fired.append, delay)
+        wheel.schedule(3, fired.append, 3).cancel()
+        self.assertEqual(4, len(wheel))
+
+        self.assertEqual(1, wheel.advance(wheel._start + 2.5))
+        self.assertEqual([2], fired)
+        self.assertEqual(1, wheel.advance(wheel._start + 5.5))
+        self.assertEqual([2, 5], fired)
+        # A timer further away than a turn of the wheel waits in its slot.
+        self.assertEqual(0, wheel.advance(wheel._start + 12))
+        self.assertEqual(1, wheel.advance(wheel._start + 21))
+        self.assertEqual([2, 5, 20], fired)
+        self.assertEqual(0, len(wheel))
+        self.assertIsNone(wheel.timeout())
+
+    def test_failing_callbacks(self):
+        """Test that a callback that raises neither stops the wheel nor the event loop."""
+        def fail(*args):
+            raise ValueError("timer")
+
+        wheel = WS.TimerWheel(tick=1.0, slots=8)
+        fired = []
+        wheel.schedule(1, fail)
+        wheel.schedule(1, fired.append, 1)
+        self.assertEqual(2, wheel.advance(wheel._start + 1.5))
+        self.assertEqual([1], fired)
+
+        loop = WS.EventLoop.EventLoop()
+        loop.call_soon_threadsafe(fail)
+        loop.call_soon_threadsafe(fired.append, 2)
+        loop.call_at(time.monotonic(), fail)
+        loop.call_at(time.monotonic(), fired.append, 3)
+        loop.run_once(0)
+        loop.close()
+        self.assertEqual([1, 2, 3], fired)
+
+    def test_event_loop_call_later(self):
+        """Test that the event loop runs delayed callbacks on its thread."""
+        loop = WS.EventLoop.EventLoop()
+        fired = []
+        loop.call_later(0.05, fired.append, 1)
+        loop.call_later(0.05, fired.append, 2).cancel()
+        started = time.monotonic()
+        while not fired and time.monotonic() - started < 2:
+            loop.run_once()
+        loop.close()
+        self.assertEqual([1], fired)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+
+class TestKeepalive(ServerTestCase):
+
+    def test_ping_round_trip(self):
+        """Test that a quiet client is pinged and the round trip time of its PONG is recorded."""
+        self.start_server(ping_interval=0.2)
+        sock = self.connect()
+        opcode, payload = recv_frame(sock)
+        self.assertEqual(WS.FrameType.PING, opcode)
+        self.assertEqual(8, len(payload))
+        sock.sendall(masked_frame(payload, opcode=0xA))
+        time.sleep(0.1)
+
+        client = next(iter(self.server.clients.values()))
+        self.assertIsNotNone(self.server.stats(client)['rtt'])
+        self.assertEqual(1, self.server.stats()['rtt_seconds']['count'])
+        sock.close()
+
+    def test_pong_timeout(self):
+        """Test that a client which does not answer is dropped, also when its thread is blocked reading."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, ping_interval=0.1, ping_timeout=0.2)
+                sock = self.connect()
+                self.addCleanup(sock.close)
+                started = time.monotonic()
+                self.assertEqual(WS.FrameType.PING, recv_frame(sock)[0])
+                self.assertEqual((None, None), recv_frame(sock))
+                self.assertLess(time.monotonic() - started, 2)
+                self.assertEqual(1, server.stats()['pong_timeouts'])
+
+    def test_close_callback_error_in_timeout(self):
+        """Test that timeouts keep firing after on_connection_close raised during one."""
+        def on_connection_close(client):
+            raise ValueError("close")
+
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop, idle_timeout=0.2, on_connection_close=on_connection_close)
+                for _ in range(2):
+                    sock = self.connect()
+                    self.assertEqual(WS.FrameType.CLOSE, recv_frame(sock)[0])
+                    self.wait_for(lambda: not server.clients)
+                    self.assertEqual({}, server.clients)
+                self.assertEqual(2, server.stats()['idle_timeouts'])
+
+    def test_idle_timeout(self):
+        """Test that a client sending nothing but control frames is closed with GOING_AWAY."""
+        self.start_server(idle_timeout=0.3)
+        sock = self.connect()
+        sock.sendall(masked_frame(b'', opcode=0x9))
+        self.assertEqual(WS.FrameType.PONG, recv_frame(sock)[0])
+        opcode, payload = recv_frame(sock)
+        self.assertEqual(WS.FrameType.CLOSE, opcode)
+        self.assertEqual(WS.CloseStatus.GOING_AWAY, struct.unpack('!H', payload)[0])
+        self.assertEqual(1, self.server.stats()['idle_timeouts'])
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
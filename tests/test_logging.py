@@ -0,0 +1,84 @@
+import logging
+import os
+import tempfile
+import unittest
+import sys
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Log import logger, log_frame, Sampler, FileLog
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = RecordingHandler()
+        logger.addHandler(self.handler)
+        self.level = logger.level
+
+    def tearDown(self):
+        logger.removeHandler(self.handler)
+        logger.setLevel(self.level)
+
+    def test_sampler(self):
+        """Test that one in N events is logged and a rate of 0 drops them all."""
+        sampler = Sampler({'message': 10, 'control': 0})
+        self.assertEqual(10, sum(sampler.sample('message') for _ in range(100)))
+        self.assertFalse(any(sampler.sample('control') for _ in range(100)))
+        self.assertTrue(sampler.sample('other'))
+
+    def test_lazy_arguments(self):
+        """Test that messages are passed as arguments and formatted by the handlers only."""
+        logger.setLevel(logging.INFO)
+        sampler = Sampler({'message': 2})
+        for _ in range(2):
+            log_frame(sampler, WS.FrameType.TEXT, ('127.0.0.1', 1), "payload")
+        self.assertEqual(1, len(self.handler.records))
+        self.assertEqual("payload", self.handler.records[0].args[-1])
+        self.assertIn("TEXT: ('127.0.0.1', 1) - 'payload'", self.handler.records[0].getMessage())
+
+    def test_server_leaves_logging_alone(self):
+        """Test that creating a server neither configures the root logger nor creates a log file."""
+        handlers = list(logging.getLogger().handlers)
+        with tempfile.TemporaryDirectory() as folder:
+            cwd = os.getcwd()
+            os.chdir(folder)
+            try:
+                server = WS.WebSocketServer(None, None)
+                server.server.close()
+                self.assertEqual([], os.listdir(folder))
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(handlers, logging.getLogger().handlers)
+
+    def test_file_log(self):
+        """Test that records reach the log file through the queue."""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "ws.log")
+            log = FileLog(path, logging.INFO).start()
+            logger.info("%s CONNECTION: %s", "[IN] ", ('127.0.0.1', 1))
+            log.stop()
+            with open(path) as log_file:
+                self.assertIn("[IN]  CONNECTION: ('127.0.0.1', 1)", log_file.read())
+            self.assertNotIn(log._queue_handler, logger.handlers)
+
+    def test_silent_by_default(self):
+        """Test that records do not fall back to stderr when the application configures no logging."""
+        self.assertTrue(any(isinstance(handler, logging.NullHandler) for handler in logger.handlers))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import unittest
+import sys
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+from websock import Masking
+
+
+def reference_unmask(data, mask_key):
+    return bytearray(data[i] ^ mask_key[i % 4] for i in range(len(data)))
+
+
+class TestMasking(unittest.TestCase):
+
+    SIZES = (1, 3, 4, 7, 8, 9, 125, 4096, 65535, 65536, 65541, 200003)
+
+    def test_unmask(self):
+        """Test that the fast paths agree with a byte by byte XOR."""
+        mask_key = b'\x8a\x13\xf0\x5c'
+        paths = [Masking._unmask_int]
+        if Masking.numpy is not None:
+            paths.append(Masking._unmask_numpy)
+
+        for size in self.SIZES:
+            data = os.urandom(size)
+            expected = reference_unmask(data, mask_key)
+            for path in paths:
+                out = bytearray(size)
+                path(data, mask_key, out)
+                self.assertEqual(expected, out)
+
+    def test_unmask_in_place(self):
+        """Test that a buffer can be unmasked in place."""
+        mask_key = b'\x01\x02\x03\x04'
+        data = bytearray(os.urandom(1001))
+        expected = reference_unmask(data, mask_key)
+        self.assertIs(data, Masking.unmask(data, mask_key, data))
+        self.assertEqual(expected, data)
+        self.assertEqual(bytearray(), Masking.unmask(b'', mask_key))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import socket
+import threading
+import time
+import unittest
+import urllib.request
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Metrics import Histogram
+from tests.support import UPGRADE_REQUEST, masked_frame, recv_exactly
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        """Test that percentiles are within the bucket precision and values are kept in order."""
+        histogram = Histogram()
+        for value in range(1, 10001):
+            histogram.record(value / 1000000.0)
+        self.assertEqual(10000, histogram.count)
+        self.assertAlmostEqual(0.005, histogram.percentile(50), delta=0.005 / 16)
+        self.assertAlmostEqual(0.0099, histogram.percentile(99), delta=0.0099 / 16)
+        self.assertEqual(0.01, histogram.percentile(100))
+        self.assertEqual(15, histogram.below(16))
+        self.assertEqual(1023, histogram.below(1024))
+
+    def test_threads_are_merged(self):
+        """Test that durations recorded by exited threads are still counted."""
+        metrics = WS.Metrics()
+        threads = [threading.Thread(target=metrics.observe, args=('callback_seconds', 0.001)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics.observe('callback_seconds', 0.002)
+        histogram = metrics.histogram('callback_seconds')
+        self.assertEqual(9, histogram.count)
+        self.assertEqual(0.002, histogram.max / 1000000.0)
+
+
+class TestServerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        def on_data_receive(client, data):
+            self.server.send(client, data)
+
+        self.server = WS.WebSocketServer("127.0.0.1", 0, on_data_receive=on_data_receive, metrics_port=0)
+        self.server.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={'event_loop': True}, daemon=True)
+        self.server_thread.start()
+        while self.server.event_loop is None:
+            time.sleep(0.01)
+        self.port = self.server.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close_server()
+        self.server_thread.join(5)
+
+    def _connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        return sock
+
+    def test_counters(self):
+        """Test that frames, bytes, handshakes and close codes are counted."""
+        sock = self._connect()
+        expected = WS.WebSocketServer._encode_data_frame(WS.FrameType.TEXT, "hello")
+        for _ in range(3):
+            sock.sendall(masked_frame(b"hello"))
+            self.assertEqual(expected, recv_exactly(sock, len(expected)))
+
+        client = next(iter(self.server.clients.values()))
+        stats = self.server.stats(client)
+        self.assertEqual(3, stats['messages_in'])
+        self.assertEqual(3, stats['frames_out'])
+        self.assertEqual(len(UPGRADE_REQUEST) + 3 * len(masked_frame(b"hello")), stats['bytes_in'])
+
+        sock.close()
+        deadline = time.monotonic() + 5
+        while self.server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        snapshot = self.server.stats()
+        self.assertEqual(1, snapshot['connections_opened'])
+        self.assertEqual(1, snapshot['connections_closed'])
+        self.assertEqual(0, snapshot['connections'])
+        self.assertEqual(1, snapshot['handshakes'])
+        self.assertEqual(3, snapshot['messages_in'])
+        self.assertEqual(3, snapshot['callback_seconds']['count'])
+        self.assertEqual(1, snapshot['handshake_seconds']['count'])
+        self.assertEqual({WS.CloseStatus.ABNORMAL: 1}, snapshot['close_codes'])
+
+    def test_prometheus_endpoint(self):
+        """Test that the metrics are served in the Prometheus text format."""
+        sock = self._connect()
+        sock.sendall(masked_frame(b"hello"))
+        recv_exactly(sock, 7)
+        # The echo is sent from within the callback, which is timed once it returns.
+        deadline = time.monotonic() + 5
+        while not self.server.stats()['callback_seconds']['count'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        port = self.server._metrics_endpoint.server_address[1]
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(port), timeout=5) as response:
+            text = response.read().decode()
+        self.assertIn("websock_messages_in_total 1\n", text)
+        self.assertIn("websock_connections 1\n", text)
+        self.assertIn('websock_callback_seconds_bucket{le="+Inf"} 1\n', text)
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
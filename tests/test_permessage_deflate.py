@@ -0,0 +1,101 @@
+import unittest
+import sys
+import os
+import zlib
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.FrameParser import FrameParser, MessageAssembler, Frame
+
+UPGRADE_REQUEST = (
+    "GET /chat HTTP/1.1\r\n"
+    "Host: example.com:8000\r\n"
+    "Upgrade: websocket\r\n"
+    "Connection: Upgrade\r\n"
+    "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    "Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n"
+    "Sec-WebSocket-Version: 13\r\n\r\n"
+)
+
+
+def client_compress(data):
+    """Compresses a message the way a client would."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return (compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+class TestPerMessageDeflate(unittest.TestCase):
+
+    def test_negotiate(self):
+        """Test the agreed parameters for several offers."""
+        deflate = WS.PerMessageDeflate()
+        context, response = deflate.negotiate("permessage-deflate")
+        self.assertEqual("permessage-deflate", response)
+        self.assertFalse(context.server_no_context_takeover)
+
+        context, response = deflate.negotiate("permessage-deflate; server_no_context_takeover; server_max_window_bits=10")
+        self.assertEqual("permessage-deflate; server_no_context_takeover; server_max_window_bits=10", response)
+        self.assertTrue(context.server_no_context_takeover)
+        self.assertEqual(10, context.server_window_bits)
+
+        deflate = WS.PerMessageDeflate(client_no_context_takeover=True, client_max_window_bits=12)
+        _, response = deflate.negotiate("permessage-deflate; client_max_window_bits")
+        self.assertEqual("permessage-deflate; client_no_context_takeover; client_max_window_bits=12", response)
+
+    def test_negotiate_fallback(self):
+        """Test that invalid offers are declined in favour of the next one."""
+        deflate = WS.PerMessageDeflate()
+        _, response = deflate.negotiate("permessage-deflate; unknown, permessage-deflate; server_max_window_bits=8, permessage-deflate")
+        self.assertEqual("permessage-deflate", response)
+        self.assertEqual((None, None), deflate.negotiate("x-webkit-deflate-frame"))
+
+    def test_handshake(self):
+        """Test that the extension is accepted in the handshake response."""
+        ws = WS.WebSocketServer(None, None, permessage_deflate=WS.PerMessageDeflate())
+        valid, response = ws._opening_handshake(None, UPGRADE_REQUEST.encode())
+        self.assertTrue(valid)
+        self.assertIn("Sec-WebSocket-Extensions: permessage-deflate\r\n", response.decode())
+        self.assertTrue(response.endswith(b"\r\n\r\n"))
+
+        ws = WS.WebSocketServer(None, None)
+        valid, response = ws._opening_handshake(None, UPGRADE_REQUEST.encode())
+        self.assertNotIn("Sec-WebSocket-Extensions", response.decode())
+
+    def test_round_trip(self):
+        """Test that compressed frames are flagged with RSV1 and can be decompressed by a client."""
+        context, _ = WS.PerMessageDeflate(threshold=16).negotiate("permessage-deflate")
+        message = '{"user": "alice", "text": "hello"}' * 10
+        decompressor = zlib.decompressobj(-15)
+        for _ in range(3):
+            frame = b''.join(WS.WebSocketServer._encode_message_parts(context, WS.FrameType.TEXT, message))
+            self.assertEqual(0xc1, frame[0])
+            parser = FrameParser()
+            parser.feed(frame)
+            payload = parser.next_frame().payload
+            self.assertLess(len(payload), len(message))
+            self.assertEqual(message.encode(), decompressor.decompress(bytes(payload) + b'\x00\x00\xff\xff'))
+
+        small = b''.join(WS.WebSocketServer._encode_message_parts(context, WS.FrameType.TEXT, "hi"))
+        self.assertEqual(b'\x81\x02hi', small)
+
+    def test_decompress_received(self):
+        """Test that the assembler decompresses messages flagged with RSV1."""
+        context, _ = WS.PerMessageDeflate().negotiate("permessage-deflate")
+        assembler = MessageAssembler(max_message_size=1000)
+        with self.assertRaises(WS.WebSocketInvalidDataFrame):
+            assembler.add(Frame(1, WS.FrameType.TEXT, client_compress(b'hello'), WS.RSV1))
+
+        assembler.deflate = context
+        compressed = client_compress(b'hello hello hello')
+        self.assertIsNone(assembler.add(Frame(0, WS.FrameType.TEXT, compressed[:3], WS.RSV1)))
+        self.assertEqual((WS.FrameType.TEXT, b'hello hello hello'), assembler.add(Frame(1, WS.FrameType.CONTINUATION, compressed[3:])))
+
+        with self.assertRaises(WS.WebSocketMessageTooBig):
+            assembler.add(Frame(1, WS.FrameType.BINARY, client_compress(bytes(2000)), WS.RSV1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import socket
+import struct
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Connection import Connection
+
+
+class FakeNode:
+    """A server with clients connected over socket pairs."""
+
+    def __init__(self, clients=3, backplane=None):
+        self.server = WS.WebSocketServer(None, None, backplane=backplane)
+        self.clients = []
+        self.peers = []
+        for i in range(clients):
+            client, peer = socket.socketpair()
+            peer.settimeout(5)
+            address = ('127.0.0.1', i)
+            self.server.clients[address] = client
+            self.server._connections[client] = Connection(client, address)
+            self.clients.append(client)
+            self.peers.append(peer)
+
+    def close(self):
+        self.server.close_server()
+        for peer in self.peers:
+            peer.close()
+
+    def received_nothing(self, peer):
+        peer.setblocking(False)
+        try:
+            peer.recv(1024)
+        except BlockingIOError:
+            return True
+        finally:
+            peer.settimeout(5)
+        return False
+
+
+class TestTopicIndex(unittest.TestCase):
+
+    def test_subscribe(self):
+        """Test that the index is kept consistent in both directions."""
+        index = WS.TopicIndex()
+        index.subscribe('a', 'room1')
+        index.subscribe('a', 'room2')
+        index.subscribe('b', 'room1')
+        self.assertEqual({'a', 'b'}, set(index.subscribers('room1')))
+        self.assertEqual({'room1', 'room2'}, index.topics('a'))
+
+        index.unsubscribe('b', 'room1')
+        self.assertEqual(['a'], index.subscribers('room1'))
+        self.assertEqual(set(), index.topics('b'))
+
+        self.assertEqual({'room1', 'room2'}, index.remove('a'))
+        self.assertEqual(set(), index.topics())
+        self.assertEqual([], index.subscribers('room1'))
+
+
+class TestPublish(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = []
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.close()
+
+    def _node(self, **kwargs):
+        node = FakeNode(**kwargs)
+        self.nodes.append(node)
+        return node
+
+    def test_publish(self):
+        """Test that only the subscribers of a topic receive a message."""
+        node = self._node()
+        node.server.subscribe(node.clients[0], 'room')
+        node.server.subscribe(node.clients[1], 'room')
+        self.assertEqual({}, node.server.publish('room', 'hi', exclude=node.clients[1]))
+        self.assertEqual(b'\x81\x02hi', node.peers[0].recv(1024))
+        self.assertTrue(node.received_nothing(node.peers[1]))
+        self.assertTrue(node.received_nothing(node.peers[2]))
+
+        node.server.close_client(('127.0.0.1', 0), hard_close=True)
+        self.assertEqual([node.clients[1]], node.server.topics.subscribers('room'))
+
+    def test_local_backplane(self):
+        """Test that messages reach the subscribers of every server sharing a LocalBackplane."""
+        backplane = WS.LocalBackplane()
+        first = self._node(backplane=backplane)
+        second = self._node(backplane=backplane)
+        first.server.subscribe(first.clients[0], 'room')
+        second.server.subscribe(second.clients[2], 'room')
+        first.server.publish('room', b'\x01')
+        self.assertEqual(b'\x82\x01\x01', first.peers[0].recv(1024))
+        self.assertEqual(b'\x82\x01\x01', second.peers[2].recv(1024))
+
+    def test_tcp_backplane(self):
+        """Test that messages reach the subscribers of several servers connected over TCP."""
+        backplanes = [WS.TcpBackplane(reconnect_delay=0.1, allowed_peers=['127.0.0.1'], secret=b'secret') for i in range(3)]
+        nodes = [self._node(backplane=backplane) for backplane in backplanes]
+        for backplane in backplanes:
+            for other in backplanes:
+                if other is not backplane:
+                    backplane.add_peer(other.address())
+
+        for node in nodes:
+            node.server.subscribe(node.clients[1], 'room')
+        nodes[0].server.publish('room', 'hello')
+        nodes[2].server.publish('other', 'nobody')
+        for node in nodes:
+            self.assertEqual(b'\x81\x05hello', node.peers[1].recv(1024))
+
+    def test_tcp_backplane_refuses_strangers(self):
+        """Test that connections from outside allowed_peers or without the secret are closed unheard."""
+        node = self._node(backplane=WS.TcpBackplane(secret=b'secret'))
+        sock = socket.create_connection(node.server.backplane.address(), timeout=5)
+        self.assertEqual(16, len(sock.recv(16)))
+        sock.sendall(b'\x00' * 32)
+        self.assertEqual(b'', sock.recv(1024))
+        sock.close()
+
+        stranger = self._node(backplane=WS.TcpBackplane(allowed_peers=['192.0.2.1']))
+        sock = socket.create_connection(stranger.server.backplane.address(), timeout=5)
+        self.assertEqual(b'', sock.recv(1024))
+        sock.close()
+
+    def test_tcp_backplane_bad_topic(self):
+        """Test that a message whose topic is not UTF-8 is dropped without dropping the peer."""
+        node = self._node(backplane=WS.TcpBackplane())
+        node.server.subscribe(node.clients[0], 'room')
+        sock = socket.create_connection(node.server.backplane.address(), timeout=5)
+        self.addCleanup(sock.close)
+        for topic in (b'\xff', b'room'):
+            sock.sendall(struct.pack('!HIB', len(topic), 2, WS.FrameType.TEXT) + topic + b'hi')
+        self.assertEqual(b'\x81\x02hi', node.peers[0].recv(1024))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import ServerTestCase, UPGRADE_REQUEST, masked_frame, recv_exactly, read_response
+
+
+@unittest.skipUnless(shutil.which('openssl'), "openssl is needed to create a certificate")
+class TestTls(ServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp()
+        cls.certfile = os.path.join(cls.folder, 'cert.pem')
+        subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                               '-subj', '/CN=localhost', '-keyout', cls.certfile, '-out', cls.certfile],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder)
+
+    def setUp(self):
+        self.client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.client_context.load_verify_locations(self.certfile)
+        self.client_context.set_alpn_protocols(['http/1.1'])
+
+    def start_server(self, event_loop=True):
+        self.received = []
+        return super().start_server(event_loop, ssl_context=WS.create_server_context(self.certfile),
+                                    on_data_receive=lambda client, data: self.received.append(data))
+
+    def connect(self, session=None):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock = self.client_context.wrap_socket(sock, server_hostname='localhost', session=session)
+        self.addCleanup(sock.close)
+        sock.sendall(UPGRADE_REQUEST)
+        self.assertTrue(read_response(sock).startswith(b'HTTP/1.1 101'))
+        return sock
+
+    def test_echo(self):
+        """Test that messages are exchanged over TLS by both kinds of server."""
+        for event_loop in (True, False):
+            with self.subTest(event_loop=event_loop):
+                server = self.start_server(event_loop)
+                sock = self.connect()
+                self.assertEqual('http/1.1', sock.selected_alpn_protocol())
+                sock.sendall(masked_frame(b'hello'))
+                self.wait_for(lambda: self.received)
+                self.assertEqual(['hello'], self.received)
+
+                client = next(iter(server.clients.values()))
+                server.send(client, 'world')
+                self.assertEqual(b'\x81\x05world', recv_exactly(sock, 7))
+                self.assertEqual('http/1.1', server.stats(client)['tls']['alpn'])
+                self.assertEqual(1, server.stats()['tls_handshakes'])
+
+    def test_threaded_sends_do_not_block(self):
+        """Test that sends to a threaded TLS client that does not read are queued and it is disconnected as a slow consumer."""
+        self.start_server(event_loop=False)
+        self.server.max_write_buffer = 1 << 20
+        sock = self.connect()
+        self.wait_for(lambda: self.server.clients)
+        client = next(iter(self.server.clients.values()))
+        chunk = b'\x00' * 65536
+        started = time.monotonic()
+        with self.assertRaises(WS.WebSocketSlowConsumer):
+            for i in range(1024):
+                self.server.send(client, chunk)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual({}, self.server.clients)
+
+    def test_resumption(self):
+        """Test that a client reconnecting with its session gets an abbreviated handshake."""
+        self.start_server()
+        sock = self.connect()
+        # TLS 1.3 tickets arrive after the handshake, they have been read with the response.
+        session = sock.session
+        sock.close()
+        sock = self.connect(session)
+        self.assertTrue(sock.session_reused)
+        self.wait_for(lambda: self.server.stats()['tls_resumed'])
+        self.assertEqual(1, self.server.stats()['tls_resumed'])
+
+    def test_failed_handshake(self):
+        """Test that a client that does not speak TLS is dropped without being seen by the application."""
+        self.start_server()
+        opened = []
+        self.server.on_connection_open = opened.append
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        sock.sendall(UPGRADE_REQUEST)
+        self.assertEqual(b'', sock.recv(1024))
+        self.wait_for(lambda: self.server.stats()['tls_handshake_failures'])
+        self.assertEqual(1, self.server.stats()['tls_handshake_failures'])
+        self.assertEqual([], opened)
+        sock.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
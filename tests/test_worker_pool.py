@@ -0,0 +1,101 @@
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+import sys
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from tests.support import UPGRADE_REQUEST, masked_frame, recv_exactly
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(hasattr(socket, 'SO_REUSEPORT') and hasattr(os, 'fork'), "Requires SO_REUSEPORT and fork")
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        def on_data_receive(client, data):
+            self.server.send_all(client, data, echo=True)
+
+        self.port = free_port()
+        self.server = WS.WebSocketServer("127.0.0.1", self.port, on_data_receive=on_data_receive)
+        self.pool = WS.WorkerPool(self.server, workers=2, restart_delay=0.1, drain_timeout=5, close_timeout=4)
+        self.pool_thread = threading.Thread(target=self.pool.serve_forever, daemon=True)
+        self.pool_thread.start()
+
+    def tearDown(self):
+        self.pool.stop()
+        self.pool_thread.join(10)
+        self.server.server.close()
+
+    def _connect(self):
+        deadline = time.monotonic() + 5
+        while True:
+            try:
+                sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        sock.sendall(UPGRADE_REQUEST)
+        response = b''
+        while not response.endswith(b'\r\n\r\n'):
+            response += sock.recv(1)
+        self.assertTrue(response.startswith(b'HTTP/1.1 101'))
+        return sock
+
+    def _wait_for_workers(self):
+        deadline = time.monotonic() + 5
+        while len(self.pool.processes) < 2 or not all(process.is_alive() for process in self.pool.processes.values()):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        # Both workers have bound their socket once they accept connections.
+        for i in range(4):
+            self._connect().close()
+
+    def test_broadcast_reaches_every_worker(self):
+        """Test that send_all reaches the clients of every worker."""
+        self._wait_for_workers()
+        clients = [self._connect() for i in range(16)]
+        time.sleep(0.2)
+        clients[0].sendall(masked_frame(b'hello', WS.FrameType.TEXT, 1))
+        for client in clients:
+            self.assertEqual(b'\x81\x05hello', recv_exactly(client, 7))
+            client.close()
+
+    def test_restart_and_drain(self):
+        """Test that a killed worker is restarted and that clients are closed on shutdown."""
+        self._wait_for_workers()
+        pid = self.pool.processes[0].pid
+        os.kill(pid, signal.SIGKILL)
+        deadline = time.monotonic() + 5
+        while 0 not in self.pool.processes or self.pool.processes[0].pid == pid:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+        client = self._connect()
+        started = time.monotonic()
+        self.pool.stop()
+        self.assertEqual(b'\x88\x02\x03\xe9', recv_exactly(client, 4))
+        client.sendall(masked_frame(b'\x03\xe9', WS.FrameType.CLOSE, 1))
+        self.assertEqual(b'', client.recv(1024))
+        client.close()
+        self.pool_thread.join(10)
+        self.assertFalse(self.pool_thread.is_alive())
+        # The worker exits as soon as its client acknowledged the close, not after close_timeout.
+        self.assertLess(time.monotonic() - started, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+proj_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+socket_folder = os.path.join(proj_folder, 'websocket')
+sys.path.insert(0, socket_folder)
+
+import websock as WS
+from websock.Connection import Connection
+from tests.support import recv_exactly
+
+
+class TestWriteQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.paused = threading.Event()
+        self.resumed = threading.Event()
+        self.closed = []
+        self.server = WS.WebSocketServer(None, None, on_pause_writing=lambda client: self.paused.set(),
+                                         on_resume_writing=lambda client: self.resumed.set(),
+                                         on_connection_close=self.closed.append,
+                                         write_limit_high=65536, write_limit_low=0, max_write_buffer=1 << 20)
+        self.client, self.peer = socket.socketpair()
+        self.address = ('127.0.0.1', 0)
+        self.server.clients[self.address] = self.client
+        self.server._connections[self.client] = Connection(self.client, self.address)
+
+    def tearDown(self):
+        self.server.close_server()
+        self.client.close()
+        self.peer.close()
+
+    def test_slow_client_does_not_block(self):
+        """Test that sends to a client that does not read are queued and delivered in order."""
+        chunks = [bytes([i]) * 16384 for i in range(32)]
+        start = time.monotonic()
+        for chunk in chunks:
+            self.server.send_raw(self.client, chunk)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(self.paused.is_set())
+        self.assertGreater(self.server._connections[self.client].out_bytes, 0)
+
+        self.assertEqual(b''.join(chunks), recv_exactly(self.peer, 16384 * 32))
+        self.assertTrue(self.resumed.wait(1))
+        self.assertEqual(0, self.server._connections[self.client].out_bytes)
+
+    def test_queued_buffers_are_copied(self):
+        """Test that a buffer reused by the caller after a send does not change the queued data."""
+        self.server.write_limit_high = None
+        data = bytearray(1 << 20)
+        self.server.send(self.client, data)
+        data[:] = b'\xff' * len(data)
+        self.server.send(self.client, b'end')
+
+        received = recv_exactly(self.peer, (1 << 20) + 10 + 5)
+        self.assertEqual(bytes(1 << 20), received[10:-5])
+        self.assertEqual(b'\x82\x03end', received[-5:])
+
+    def test_drop_policy(self):
+        """Test that messages to a full queue are dropped and the client stays connected."""
+        self.server.slow_consumer_policy = 'drop'
+        chunk = b'\x00' * 65536
+        with self.assertRaises(WS.WebSocketSlowConsumer):
+            for i in range(64):
+                self.server.send_raw(self.client, chunk)
+        self.assertIn(self.address, self.server.clients)
+        self.assertLessEqual(self.server._connections[self.client].out_bytes, 1 << 20)
+
+    def test_disconnect_policy(self):
+        """Test that a client whose queue is full is disconnected."""
+        chunk = b'\x00' * 65536
+        with self.assertRaises(WS.WebSocketSlowConsumer):
+            for i in range(64):
+                self.server.send_raw(self.client, chunk)
+        self.assertNotIn(self.address, self.server.clients)
+        self.assertEqual([self.client], self.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
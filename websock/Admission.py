@@ -0,0 +1,85 @@
+""" Admission control of the connections accepted by a server.
+
+Connections are admitted or refused as soon as they are accepted, before the server spends
+a thread, a TLS handshake or any per-connection state on them. A refused client is sent a
+canned HTTP response: 503 when the server as a whole is full, and 429 when the client's
+address has too many connections open or has opened new ones faster than its token bucket
+allows. The limits are per server, so with a WorkerPool they apply to each worker.
+"""
+import threading
+import time
+
+_MAX_BUCKETS = 65536    # Addresses tracked before the buckets that have refilled are dropped.
+
+
+class AdmissionControl:
+    """Limits on the connections of a server.
+
+        admission = AdmissionControl(max_connections=10000, max_connections_per_ip=20, rate=5, burst=20)
+        server = WebSocketServer("0.0.0.0", 8467, admission=admission)
+    """
+
+    def __init__(self, max_connections=None, max_connections_per_ip=None, rate=None, burst=None):
+        """
+        :param max_connections: The most connections open at once, None for no limit.
+        :param max_connections_per_ip: The most connections open at once from one address, None for no limit.
+        :param rate: The new connections per second allowed from one address, None for no limit.
+        :param burst: The new connections an address may open at once before it is held to rate.
+        Defaults to rate, or 1 if rate is below 1.
+        """
+        self.max_connections = max_connections
+        self.max_connections_per_ip = max_connections_per_ip
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 0, 1)
+        self.connections = 0    # Connections admitted and not released yet.
+        self._per_ip = {}       # Dictionary of address to its open connections.
+        self._buckets = {}      # Dictionary of address to a list of [tokens, time of the last update].
+        self._lock = threading.Lock()
+
+    def admit(self, ip, now=None):
+        """Decide whether a new connection is accepted. An admitted connection must be released
+        once it is closed.
+
+        :param ip: The address of the client.
+        :param now: The time.monotonic() of the connection, the current time if left out.
+
+        :returns: None if the connection is admitted, otherwise the HTTP status to refuse it with.
+        """
+        with self._lock:
+            if self.max_connections is not None and self.connections >= self.max_connections:
+                return 503
+            count = self._per_ip.get(ip, 0)
+            if self.max_connections_per_ip is not None and count >= self.max_connections_per_ip:
+                return 429
+            if self.rate is not None:
+                if now is None:
+                    now = time.monotonic()
+                bucket = self._buckets.get(ip)
+                if bucket is None:
+                    if len(self._buckets) >= _MAX_BUCKETS:
+                        self._prune(now)
+                    bucket = self._buckets[ip] = [self.burst, now]
+                else:
+                    bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                    bucket[1] = now
+                if bucket[0] < 1:
+                    return 429
+                bucket[0] -= 1
+            self.connections += 1
+            self._per_ip[ip] = count + 1
+        return None
+
+    def release(self, ip):
+        """Forget an admitted connection that has been closed."""
+        with self._lock:
+            self.connections -= 1
+            count = self._per_ip.pop(ip, 1) - 1
+            if count:
+                self._per_ip[ip] = count
+
+    def _prune(self, now):
+        """Drop the buckets that are full again, the caller must hold the lock."""
+        full = [ip for ip, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for ip in full:
+            del self._buckets[ip]
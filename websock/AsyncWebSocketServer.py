@@ -0,0 +1,406 @@
+import asyncio
+import inspect
+import logging
+from http import HTTPStatus
+from .DataFrameFormat import *
+from .ServerException import *
+from .WebSocketServer import WebSocketServer
+from .FrameParser import FrameParser, MessageAssembler
+from .HttpParser import HttpParser, handshake_response
+from .FrameHeader import parse_header, HEADER, LENGTH_BITS
+from .Log import logger, log_frame, Sampler, LOG_IN, LOG_OUT
+
+
+async def _call(callback, *args):
+    """Run a user defined callback which may either be a plain function or a coroutine function.
+    """
+    result = callback(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _aiter(iterable):
+    """Wrap a plain iterable so it can be consumed with async for.
+    """
+    for item in iterable:
+        yield item
+
+
+class AsyncClient:
+    """A client connected to an AsyncWebSocketServer.
+
+    Messages can be received with recv or by iterating over the client:
+
+        async for message in client:
+            await client.send(message)
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+        self.closed = False
+        self.parser = FrameParser()
+        self.assembler = MessageAssembler(max_message_size=server.max_message_size)
+        self.deflate = None     # DeflateContext if permessage-deflate was negotiated.
+        self.request = None     # The HttpRequest that opened the connection.
+        self.lock = asyncio.Lock()  # Keeps the frames of a message and the compressor state in order.
+
+    def getpeername(self):
+        """Returns the address of the client, mirrors socket.getpeername."""
+        return self.address
+
+    async def send(self, data, data_type=None):
+        """Send data to the client. Strings are sent as TEXT messages and bytes-like objects as BINARY
+        messages. Waits while the transport's write buffer is above its high water mark until it drains
+        below the low water mark.
+
+        :param data: The data to send.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+        """
+        if data_type is None:
+            data_type = WebSocketServer._data_type(data)
+        async with self.lock:
+            self.writer.writelines(WebSocketServer._encode_message_parts(self.deflate, data_type, data))
+            await self.writer.drain()
+
+    async def send_stream(self, chunks, data_type=None):
+        """Send a message as a sequence of fragments so it never has to be held in memory at once.
+
+        :param chunks: An iterable or asynchronous iterable of strings or bytes-like objects, each of which
+        is sent as one fragment.
+        :param data_type: The FrameType of the message -- derived from the type of the first chunk if left out.
+        """
+        if not hasattr(chunks, '__aiter__'):
+            chunks = _aiter(chunks)
+
+        async with self.lock:
+            frame_type = data_type
+            previous = None
+            async for chunk in chunks:
+                if previous is not None:
+                    if frame_type is None:
+                        frame_type = WebSocketServer._data_type(previous)
+                    self.writer.writelines(WebSocketServer._encode_message_parts(self.deflate, frame_type, previous, fin=False, stream=True))
+                    await self.writer.drain()
+                    frame_type = FrameType.CONTINUATION
+                previous = chunk
+
+            if previous is None:
+                previous = b''
+            if frame_type is None:
+                frame_type = WebSocketServer._data_type(previous)
+            self.writer.writelines(WebSocketServer._encode_message_parts(self.deflate, frame_type, previous, stream=True))
+            await self.writer.drain()
+
+    async def recv(self):
+        """Receive the next message from the client. Control frames are handled while waiting.
+
+        :returns: The message sent by the client, a String for TEXT messages and a memoryview for
+        BINARY messages, or None once the connection is closed.
+        """
+        while not self.closed:
+            try:
+                self.parser.feed(await self._read_frame())
+                message = self.assembler.add(self.parser.next_frame())
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await self.server._close_client(self, hard_close=True)
+                return None
+            except WebSocketInvalidDataFrame as exc:
+                logger.critical("Received Invalid Data Frame: %s", exc)
+                if isinstance(exc, WebSocketMessageTooBig):
+                    status_code = CloseStatus.MESSAGE_TOO_BIG
+                else:
+                    status_code = CloseStatus.PROTOCOL_ERROR
+                await self.server._close_client(self, status_code=status_code)
+                return None
+
+            if message is None:
+                continue
+            valid, data = WebSocketServer._frame_message(*message)
+            if valid is not None and logger.isEnabledFor(logging.INFO):
+                log_frame(self.server._sampler, valid, self.address, data)
+
+            if valid == FrameType.TEXT or valid == FrameType.BINARY:
+                return data
+            elif valid == FrameType.CLOSE:
+                # The closing handshake is answered with the status code of the client.
+                status_code = int.from_bytes(data[:2], 'big') if len(data) >= 2 else None
+                await self.server._close_client(self, status_code=status_code)
+            elif valid == FrameType.PING:
+                await self.send(data, FrameType.PONG)
+            elif valid == FrameType.PONG:
+                pass
+            else:
+                logger.critical("Received Invalid Data Frame")
+                await self.server._close_client(self, hard_close=True)
+        return None
+
+    async def _read_frame(self):
+        """Read exactly one data frame from the stream.
+
+        :returns: The raw bytes of the frame.
+        """
+        header = await self.reader.readexactly(HEADER.size)
+        parsed = parse_header(header)
+        if parsed is None:
+            # The payload length is extended to 16 or 64 bits.
+            header += await self.reader.readexactly(2 if header[1] & LENGTH_BITS == 126 else 8)
+            parsed = parse_header(header)
+        masked, header_len, payload_len = parsed[1:]
+
+        max_size = self.server.max_message_size
+        if max_size is not None and payload_len > max_size:
+            raise WebSocketMessageTooBig("Frame of {} bytes exceeds the limit".format(payload_len), self)
+
+        return header + await self.reader.readexactly(header_len - len(header) + payload_len)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        data = await self.recv()
+        if data is None:
+            raise StopAsyncIteration
+        return data
+
+    async def ping(self):
+        """Send a Ping frame."""
+        await self.send(None, FrameType.PING)
+
+    async def close(self, status_code=None, app_data=None):
+        """Close the connection with the client.
+
+        :param status_code: A 16 bit optional status code.
+        :param app_data: A utf-8 encoded String to include with the close frame.
+        """
+        await self.server._close_client(self, status_code=status_code, app_data=app_data)
+
+
+class AsyncWebSocketServer:
+    """An asyncio implementation of the WebSocket server. It shares the handshake and the data frame
+    format with WebSocketServer but every callback may be a coroutine function and sends are awaitable.
+    """
+
+    def __init__(self, ip='', port=80, on_data_receive=None, on_connection_open=None, on_connection_close=None, on_server_destruct=None, on_error=None, write_limit_high=None, write_limit_low=None, max_message_size=16777216, on_binary_receive=None, permessage_deflate=None, log_sampling=None, ssl_context=None,
+                 max_request_size=16384, max_request_headers=100):
+        """
+        :param write_limit_high: The size of the transport's write buffer above which send waits.
+        :param write_limit_low: The size of the write buffer below which waiting sends resume.
+        :param max_message_size: Larger messages are refused, None for no limit.
+        :param permessage_deflate: A PerMessageDeflate offered to clients, None to disable compression.
+        :param log_sampling: A dictionary of event to N, only one record in N of the event is logged, see Sampler.
+        :param ssl_context: A server side ssl.SSLContext to serve wss://, see Tls.create_server_context.
+        :param max_request_size: The largest upgrade request header in bytes, larger ones are answered with 431.
+        :param max_request_headers: The most header fields in an upgrade request, more are answered with 431.
+        """
+        self.server = None
+        self.ip = ip
+        self.port = port
+        self.ssl_context = ssl_context
+        self.clients = {}   # Dictionary of active clients, remove when the connection is closed.
+        self.on_data_receive = on_data_receive if on_data_receive is not None else self._default_func
+        self.on_connection_open = on_connection_open if on_connection_open is not None else self._default_func
+        self.on_connection_close = on_connection_close if on_connection_close is not None else self._default_func
+        self.on_server_destruct = on_server_destruct if on_server_destruct is not None else self._default_func
+        self.on_error = on_error if on_error is not None else self._default_func
+        self.on_binary_receive = on_binary_receive if on_binary_receive is not None else self._default_func
+        self.write_limit_high = write_limit_high
+        self.write_limit_low = write_limit_low
+        self.max_message_size = max_message_size
+        self.permessage_deflate = permessage_deflate
+        self.max_request_size = max_request_size
+        self.max_request_headers = max_request_headers
+        self._sampler = Sampler(log_sampling)
+
+    def _default_func(self, *args, **kwargs):
+        """Default function if the user does not define one.
+        """
+        pass
+
+    async def start(self):
+        """Start listening for incoming connections and return immediately.
+        """
+        self.server = await asyncio.start_server(self._manage_client, self.ip, self.port, ssl=self.ssl_context)
+        logger.info("Server is ready to accept")
+
+    async def serve_forever(self):
+        """Start the server and serve clients until close_server is called.
+        """
+        if self.server is None:
+            await self.start()
+        await self.server.wait_closed()
+
+    async def _manage_client(self, reader, writer):
+        """Run as a task for each client. Completes the opening handshake and then passes every
+        message to on_data_receive until the connection is closed.
+
+        :param reader: The StreamReader of the connection.
+        :param writer: The StreamWriter of the connection.
+        """
+        if self.write_limit_high is not None or self.write_limit_low is not None:
+            writer.transport.set_write_buffer_limits(high=self.write_limit_high, low=self.write_limit_low)
+
+        client = AsyncClient(self, reader, writer)
+        logger.info("%s CONNECTION: %s", LOG_IN, client.address)
+
+        parser = HttpParser(self.max_request_size, self.max_request_headers)
+        try:
+            while client.request is None:
+                try:
+                    data = await reader.readuntil(WebSocketServer._HANDSHAKE_END)
+                except asyncio.LimitOverrunError as exc:
+                    # More than the stream buffers at once, the parser decides whether it is too large.
+                    data = await reader.readexactly(exc.consumed)
+                client.request = parser.feed(data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except WebSocketBadRequest as exc:
+            logger.warning("%s REJECTED: %s %d %s", LOG_OUT, client.address, exc.status, exc)
+            exc.client = client
+            await self._report(exc)
+            writer.write((WebSocketServer._ERROR_RESP % (exc.status, HTTPStatus(exc.status).phrase)).encode())
+            writer.close()
+            return
+
+        valid, ack, deflate = handshake_response(client.request, WebSocketServer._accept_key, self.permessage_deflate)
+        if not valid:
+            await self._report(WebSocketInvalidHandshake("Invalid Handshake", client))
+            writer.write((WebSocketServer._ERROR_RESP % (400, HTTPStatus(400).phrase)).encode())
+            writer.close()
+            return
+
+        client.deflate = client.assembler.deflate = deflate
+        writer.write(ack)
+        self.clients[client.address] = client
+        try:
+            await _call(self.on_connection_open, client)
+            async for data in client:
+                if isinstance(data, str):
+                    await _call(self.on_data_receive, client, data)
+                else:
+                    await _call(self.on_binary_receive, client, data)
+        except Exception as exc:
+            logger.error("%s HANDLER FAILED: %s %r", LOG_OUT, client.address, exc)
+            await self._report(exc)
+        finally:
+            await self._close_client(client, hard_close=True)
+
+    async def _report(self, exc):
+        """Pass an exception to on_error, logging what on_error itself raises."""
+        try:
+            await _call(self.on_error, exc)
+        except Exception:
+            logger.exception("on_error failed")
+
+    async def send(self, client, data, data_type=None):
+        """Send data to the client.
+
+        :param data: The data to send.
+        :param client: The AsyncClient to send the data too.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+        """
+        await client.send(data, data_type)
+
+    async def send_all(self, client, data, echo=False):
+        """Send a string of data to all clients.
+
+        :param data: A String or a bytes-like object
+        :param client: The client initiating the data transfer.
+        :param echo: A boolean that indicates whether 'client'
+        should receive an echo of the message they are initiating.
+        """
+        await self.broadcast(data, exclude=None if echo else client)
+
+    async def broadcast(self, data, clients=None, exclude=None, data_type=None):
+        """Send the same message to many clients concurrently. The data frame is built once and
+        the same immutable buffer is written to every transport, only clients that compress their
+        messages with a context of their own get a frame of their own.
+
+        :param data: A String or a bytes-like object.
+        :param clients: The AsyncClients to send the message to, every connected client if left out.
+        :param exclude: A client that should not receive the message.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+
+        :returns: A dictionary of client to the exception raised while sending to it, empty
+        if every send succeeded.
+        """
+        if data_type is None:
+            data_type = WebSocketServer._data_type(data)
+        if isinstance(data, str):
+            data = data.encode()
+        if clients is None:
+            clients = list(self.clients.values())
+        endpoints = [endpoint for endpoint in clients if endpoint is not exclude]
+        frames = {}     # Shared frames by compression settings.
+
+        async def send(endpoint):
+            async with endpoint.lock:
+                frame = WebSocketServer._shared_frame(frames, endpoint.deflate, data_type, data)
+                if frame is None:
+                    frame = WebSocketServer._encode_message_parts(endpoint.deflate, data_type, data)
+                endpoint.writer.writelines(frame)
+                await endpoint.writer.drain()
+
+        results = await asyncio.gather(*(send(endpoint) for endpoint in endpoints), return_exceptions=True)
+        failures = {endpoint: result for endpoint, result in zip(endpoints, results) if isinstance(result, BaseException)}
+        for endpoint, exc in failures.items():
+            logger.warning("Broadcast to %s failed: %s", endpoint.address, exc)
+        return failures
+
+    async def _close_client(self, client, status_code=None, app_data=None, hard_close=False):
+        """Close the connection with a client.
+
+        :param client: The AsyncClient to close the connection with.
+        :param status_code: A 16 bit optional status code.
+        :param app_data: A utf-8 encoded String to include with the close frame.
+        :param hard_close: A boolean which indicates whether the client needs to be closed hard or soft.
+        """
+        if client.closed:
+            return
+        client.closed = True
+        self.clients.pop(client.address, None)
+        try:
+            await _call(self.on_connection_close, client)
+        except Exception:
+            logger.exception("on_connection_close of %s failed", client.address)
+
+        try:
+            if not hard_close:
+                payload = b''
+                if status_code is not None:
+                    payload += int(status_code).to_bytes(2, 'big')
+                if app_data is not None:
+                    payload += app_data.encode()
+                try:
+                    client.writer.write(WebSocketServer._encode_data_frame(FrameType.CLOSE, payload or None))
+                    await client.writer.drain()
+                except ConnectionError:
+                    pass
+        finally:
+            client.writer.close()
+
+    async def close_client(self, client, status_code=None, app_data=None):
+        """Close the connection with a client.
+
+        :param client: The AsyncClient to close the connection with.
+        :param status_code: A 16 bit optional status code.
+        :param app_data: A utf-8 encoded String to include with the close frame.
+        """
+        await self._close_client(client, status_code=status_code, app_data=app_data)
+
+    async def close_server(self, status_code=None, app_data=None):
+        """Close the connection with each client and then stop listening.
+
+        :param status_code: A 16 bit optional status code to send to all of the clients.
+        :param app_data: A utf-8 encoded String to include with the close frame.
+        """
+        for client in list(self.clients.values()):
+            await self._close_client(client, status_code=status_code, app_data=app_data)
+
+        await _call(self.on_server_destruct)
+        self.server.close()
+        await self.server.wait_closed()
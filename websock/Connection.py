@@ -0,0 +1,146 @@
+import ssl
+import threading
+import time
+from collections import deque
+from itertools import islice
+from enum import IntEnum
+from .FrameParser import FrameParser, MessageAssembler
+
+_IOV_MAX = 1024     # Most buffers gathered by a single sendmsg call.
+_GATHER_MIN_SIZE = 4096     # Smaller header and payload pairs are cheaper to join than to gather.
+
+
+class ConnectionState(IntEnum):
+    HANDSHAKE = 0
+    OPEN = 1
+    CLOSED = 2
+
+
+class Connection:
+    """Per-client state kept by the server.
+
+    The connection starts in the HANDSHAKE state, moves to OPEN once the upgrade request
+    has been answered and to CLOSED when the socket is released.
+    """
+
+    # Servers keep one per client, slots keep them compact and attribute access fast.
+    __slots__ = (
+        'client', 'address', 'id', 'tags', 'non_blocking', 'state', 'tls_pending', 'http', 'request', 'rejected',
+        'parser', 'assembler', 'deflate', 'lock', 'write_lock', 'out_queue', 'out_bytes', 'scatter',
+        'writing', 'paused', 'paused_since', 'read_paused', 'events', 'on_event', 'opened',
+        'coalesce_delay', 'coalesce_bytes', 'coalescing',
+        'frames_in', 'messages_in', 'bytes_in', 'frames_out', 'bytes_out', 'writes_out', 'retired',
+        'last_seen', 'last_message', 'ping_sent', 'ping_payload', 'rtt', 'keepalive',
+        'close_sent',
+    )
+
+    def __init__(self, client, address, non_blocking=False, max_message_size=None):
+        self.client = client
+        self.address = address
+        self.id = None                  # Integer id given by the ConnectionRegistry.
+        self.tags = {}                  # Dictionary of tag name to value, see ConnectionRegistry.tag.
+        self.non_blocking = non_blocking    # True if the client is multiplexed on an event loop.
+        self.state = ConnectionState.HANDSHAKE
+        self.tls_pending = True if isinstance(client, ssl.SSLSocket) else None   # True until the TLS handshake is done, None without TLS.
+        self.http = None                # HttpParser of the upgrade request until the handshake is complete.
+        self.request = None             # The HttpRequest once the handshake is complete.
+        self.rejected = False           # True if the upgrade request was refused, on_connection_open was never called.
+        self.parser = FrameParser(max_frame_size=max_message_size)  # Buffers the received data frames.
+        self.assembler = MessageAssembler(max_message_size=max_message_size)
+        self.deflate = None             # DeflateContext if permessage-deflate was negotiated.
+        self.lock = threading.RLock()   # Keeps the frames of a message and the compressor state in order.
+        self.write_lock = threading.Lock()  # Guards the outbound queue, held only for short periods.
+        self.out_queue = deque()        # Buffers waiting for the socket to become writable, oldest first.
+        self.out_bytes = 0              # Total number of bytes in out_queue.
+        self.scatter = hasattr(client, 'sendmsg') and not isinstance(client, ssl.SSLSocket)   # True if sendmsg can be used.
+        self.writing = False            # True while the socket is watched for writability.
+        self.paused = False             # True while out_bytes is above the high watermark.
+        self.paused_since = None        # time.monotonic() at which the connection was paused.
+        self.read_paused = False        # True while the handler executor is max_pending messages behind.
+        self.coalesce_delay = None      # Seconds frames are held to be written together, None to write them at once.
+        self.coalesce_bytes = 65536     # Queued bytes that end a coalescing window early.
+        self.coalescing = False         # True while frames are held until the coalescing window ends.
+        self.events = 0                 # Events the socket is registered for with the event loop.
+        self.on_event = None            # Callback registered with the event loop.
+        self.opened = time.monotonic()  # When the connection was accepted.
+        self.frames_in = 0              # Counters read by Metrics, see Metrics.CONNECTION_COUNTERS.
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.writes_out = 0
+        self.retired = False            # True once the counters have been added to the totals of Metrics.
+        self.last_seen = self.opened    # When bytes were last received.
+        self.last_message = self.opened # When the last TEXT or BINARY message was received.
+        self.ping_sent = None           # When the unanswered keepalive PING was sent, None if there is none.
+        self.ping_payload = None        # Payload of the unanswered keepalive PING.
+        self.rtt = None                 # Round trip time of the last answered keepalive PING in seconds.
+        self.keepalive = None           # Timer of the handshake timeout, then of the next keepalive check.
+        self.close_sent = False         # True once the server has sent its CLOSE frame, the next CLOSE received acknowledges it.
+
+    def set_deflate(self, deflate):
+        """Enable permessage-deflate for the connection.
+
+        :param deflate: The negotiated DeflateContext or None.
+        """
+        self.deflate = deflate
+        self.assembler.deflate = deflate
+
+    def send_buffers(self, buffers, flags=0):
+        """Write a sequence of buffers to the socket with a single system call, gathering them
+        with sendmsg instead of joining them when the socket supports it and they are large enough.
+
+        :param buffers: A list of bytes-like objects.
+        :param flags: Flags passed on to the socket.
+
+        :returns: The number of bytes written, which may be less than the total size.
+        """
+        self.writes_out += 1
+        if len(buffers) > 1:
+            if self.scatter and (len(buffers) > 2 or len(buffers[-1]) >= _GATHER_MIN_SIZE):
+                return self.client.sendmsg(buffers, (), flags)
+            return self.client.send(b''.join(buffers), flags)
+        return self.client.send(buffers[0], flags)
+
+    def enqueue(self, buffers):
+        """Append buffers to the outbound queue. Mutable buffers are copied since the caller may
+        reuse them once the send returns. The caller must hold write_lock.
+        """
+        for data in buffers:
+            if not len(data):
+                continue
+            if not isinstance(data, bytes) and not (isinstance(data, memoryview) and data.readonly):
+                data = bytes(data)
+            self.out_queue.append(data)
+            self.out_bytes += len(data)
+
+    def consume(self, size):
+        """Remove size bytes that have been written from the front of the outbound queue.
+        The caller must hold write_lock.
+        """
+        self.out_bytes -= size
+        queue = self.out_queue
+        while size:
+            data = queue[0]
+            if size < len(data):
+                queue[0] = memoryview(data)[size:]
+                return
+            size -= len(data)
+            queue.popleft()
+
+    def flush_queue(self, flags=0):
+        """Write the outbound queue until it is empty or the socket stops accepting data. Small
+        queued frames are coalesced into one sendmsg call. The caller must hold write_lock.
+
+        :param flags: Flags passed on to the socket.
+        :raises BlockingIOError: If the socket does not accept any more data.
+        :raises OSError: If the connection failed.
+        """
+        queue = self.out_queue
+        while queue:
+            buffers = list(islice(queue, _IOV_MAX))
+            sent = self.send_buffers(buffers, flags)
+            size = sum(map(len, buffers))
+            self.consume(sent)
+            if sent < size:
+                return
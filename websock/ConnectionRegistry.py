@@ -0,0 +1,155 @@
+""" The connections of a server, indexed by socket, address, id and application tags.
+
+Writers, which accept and close connections, take a lock. Readers that look a connection up
+use plain dictionary reads, and readers that visit every connection, such as broadcast, get
+an immutable snapshot that is built once after every change and shared until the next one,
+so they never see a dictionary changing size while they iterate over it.
+"""
+import itertools
+import threading
+from collections.abc import MutableMapping
+
+
+class ConnectionRegistry(MutableMapping):
+    """A mapping of client socket to Connection.
+
+    Every connection added is given an integer id, increasing from 1 and never reused, and
+    can be tagged with name and value pairs such as ('user', 42) to find the clients of a
+    user without visiting every connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_socket = {}
+        self._by_id = {}
+        self.by_address = {}    # Dictionary of address to client socket, the clients of the server.
+        self._tags = {}         # Dictionary of tag name to a dictionary of value to the tagged clients.
+        self._ids = itertools.count(1)
+        self._snapshot = None   # Tuple of the Connections, None once it is out of date.
+        self._clients = None    # Tuple of the client sockets, None once it is out of date.
+        # Lookups are on the path of every message, use the dictionary's own method.
+        self.get = self._by_socket.get
+
+    def __getitem__(self, client):
+        return self._by_socket[client]
+
+    def __setitem__(self, client, connection):
+        with self._lock:
+            if client in self._by_socket:
+                self._remove(client)
+            connection.id = next(self._ids)
+            self._by_socket[client] = connection
+            self._by_id[connection.id] = connection
+            self.by_address[connection.address] = client
+            self._snapshot = self._clients = None
+
+    def __delitem__(self, client):
+        with self._lock:
+            if client not in self._by_socket:
+                raise KeyError(client)
+            self._remove(client)
+
+    def __contains__(self, client):
+        return client in self._by_socket
+
+    def __iter__(self):
+        return iter(self.clients())
+
+    def __len__(self):
+        return len(self._by_socket)
+
+    def add(self, connection):
+        """Register a connection.
+
+        :param connection: The Connection of a client that has been accepted.
+
+        :returns: The id given to the connection.
+        """
+        self[connection.client] = connection
+        return connection.id
+
+    def pop(self, client, *default):
+        """Remove a client and every tag of it.
+
+        :returns: The Connection of the client, or default if it is not registered.
+        """
+        with self._lock:
+            if client not in self._by_socket:
+                if default:
+                    return default[0]
+                raise KeyError(client)
+            return self._remove(client)
+
+    def _remove(self, client):
+        """Remove a client, the caller must hold the lock."""
+        connection = self._by_socket.pop(client)
+        self._by_id.pop(connection.id, None)
+        if self.by_address.get(connection.address) is client:
+            del self.by_address[connection.address]
+        for name, value in connection.tags.items():
+            tagged = self._tags[name][value]
+            tagged.pop(client, None)
+            if not tagged:
+                del self._tags[name][value]
+        connection.tags = {}
+        self._snapshot = self._clients = None
+        return connection
+
+    def by_id(self, connection_id):
+        """Returns the Connection with an id, or None if it has been closed."""
+        return self._by_id.get(connection_id)
+
+    def snapshot(self):
+        """Returns a tuple of every Connection. The tuple is shared until a connection is added
+        or removed, so callers must not hold on to it for longer than they need.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot = tuple(self._by_socket.values())
+        return snapshot
+
+    def clients(self):
+        """Returns a tuple of every client socket, shared like the snapshot."""
+        clients = self._clients
+        if clients is None:
+            with self._lock:
+                clients = self._clients = tuple(self._by_socket)
+        return clients
+
+    def tag(self, client, name, value):
+        """Index a client under a name and value, replacing its earlier value for that name.
+
+        :param client: The client to tag.
+        :param name: The name of the index, e.g. 'user'.
+        :param value: A hashable value, e.g. the id of the user.
+        """
+        with self._lock:
+            connection = self._by_socket.get(client)
+            if connection is None:
+                return
+            self._untag(connection, name)
+            connection.tags[name] = value
+            # Dictionaries keep the clients in the order they were tagged.
+            self._tags.setdefault(name, {}).setdefault(value, {})[client] = None
+
+    def untag(self, client, name):
+        """Remove a client from an index."""
+        with self._lock:
+            connection = self._by_socket.get(client)
+            if connection is not None:
+                self._untag(connection, name)
+
+    def _untag(self, connection, name):
+        if name not in connection.tags:
+            return
+        value = connection.tags.pop(name)
+        tagged = self._tags[name][value]
+        tagged.pop(connection.client, None)
+        if not tagged:
+            del self._tags[name][value]
+
+    def tagged(self, name, value):
+        """Returns a list of the clients tagged with a name and value, empty if there are none."""
+        with self._lock:
+            return list(self._tags.get(name, {}).get(value, ()))
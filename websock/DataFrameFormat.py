@@ -25,6 +25,9 @@ field:
     + - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - +
     |                     Payload Data continued ...                |
     +---------------------------------------------------------------+
+
+The dictionaries document the layout and are kept for compatibility. Frames are parsed and
+built by the precompiled codec in FrameHeader.
 """
 
 # Keys
@@ -45,6 +48,17 @@ FIN = {
     'OFFSET': 7
 }
 
+RSV = {  # RSV1 is set on the first frame of a compressed message, see RFC 7692.
+    'LABEL': "Rsv",
+    'LOW_BYTE': 0,
+    'HIGH_BYTE': 0,
+    'BIT_MASK': 112,
+    'BYTE_LENGTH': 1,
+    'OFFSET': 4
+}
+
+RSV1 = 4    # Value of the RSV field when only RSV1 is set.
+
 OPCODE = {
     'LABEL': "OpCode",
     'LOW_BYTE': 0,
@@ -118,3 +132,15 @@ class FrameType(IntEnum):
     CLOSE = 8
     PING = 9
     PONG = 10
+
+
+class CloseStatus(IntEnum):
+    NORMAL = 1000
+    GOING_AWAY = 1001
+    PROTOCOL_ERROR = 1002
+    UNSUPPORTED_DATA = 1003
+    ABNORMAL = 1006     # Reported when a connection is closed without a close frame, never sent.
+    INVALID_PAYLOAD = 1007
+    POLICY_VIOLATION = 1008
+    MESSAGE_TOO_BIG = 1009
+    INTERNAL_ERROR = 1011
@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from .TimerWheel import TimerWheel
+from .Log import logger
+
+
+class EventLoop:
+    """A minimal single-threaded reactor built on top of the selectors module (epoll on Linux).
+
+    Sockets are registered together with a callback which is invoked with the ready event mask
+    whenever the socket becomes readable or writable. Work can be handed to the loop from other
+    threads with call_soon_threadsafe, and delayed with call_later, or with call_at when a tick
+    of the timer wheel is too coarse.
+    """
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.thread_id = None   # Identifier of the thread running the loop.
+        self._pending = deque()
+        self.timers = TimerWheel()
+        self._deadlines = []    # Heap of (time, sequence, callback, args) scheduled with call_at.
+        self._sequence = itertools.count()
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._waker_r.setblocking(False)
+        self._waker_w.setblocking(False)
+        self.selector.register(self._waker_r, selectors.EVENT_READ, self._on_wake)
+
+    def register(self, sock, events, callback):
+        """Watch a socket for the given events.
+
+        :param sock: The socket to watch.
+        :param events: A bitwise mask of selectors.EVENT_READ and selectors.EVENT_WRITE.
+        :param callback: Called with the ready event mask when the socket is ready.
+        """
+        self.selector.register(sock, events, callback)
+
+    def modify(self, sock, events, callback):
+        """Change the events or callback of a registered socket."""
+        self.selector.modify(sock, events, callback)
+
+    def unregister(self, sock):
+        """Stop watching a socket. Unknown sockets are ignored."""
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def call_soon_threadsafe(self, callback, *args):
+        """Schedule a callback to run on the loop thread and wake the loop up.
+
+        :param callback: The function to run.
+        :param args: Positional arguments for the callback.
+        """
+        self._pending.append((callback, args))
+        try:
+            self._waker_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def call_later(self, delay, callback, *args):
+        """Schedule a callback to run on the loop thread once delay seconds have passed, with
+        the resolution of a tick of the TimerWheel. Safe to call from any thread.
+
+        :param delay: The number of seconds to wait.
+        :param callback: The function to run.
+        :param args: Positional arguments for the callback.
+
+        :returns: The Timer, which can be cancelled.
+        """
+        timer = self.timers.schedule(delay, callback, *args)
+        if self.running and not self.in_loop_thread():
+            # The loop may be waiting without a timeout.
+            self.call_soon_threadsafe(lambda: None)
+        return timer
+
+    def call_at(self, when, callback, *args):
+        """Schedule a callback to run on the loop thread at a precise time, within the resolution
+        of the selector. Meant for the few short deadlines the timer wheel is too coarse for.
+        Safe to call from any thread.
+
+        :param when: The time.monotonic() at which to run the callback.
+        :param callback: The function to run.
+        :param args: Positional arguments for the callback.
+        """
+        entry = (when, next(self._sequence), callback, args)
+        if self.running and not self.in_loop_thread():
+            self.call_soon_threadsafe(heapq.heappush, self._deadlines, entry)
+        else:
+            heapq.heappush(self._deadlines, entry)
+
+    def _on_wake(self, mask):
+        """Drain the wake up socket."""
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def run_once(self, timeout=None):
+        """Wait for at most timeout seconds and dispatch every ready socket.
+
+        :param timeout: The maximum number of seconds to wait, None blocks until an event arrives.
+        """
+        if self._pending:
+            timeout = 0
+        else:
+            if self.timers:
+                due = self.timers.timeout()
+                if timeout is None or due < timeout:
+                    timeout = due
+            if self._deadlines:
+                due = max(0.0, self._deadlines[0][0] - time.monotonic())
+                if timeout is None or due < timeout:
+                    timeout = due
+        for key, mask in self.selector.select(timeout):
+            EventLoop._run(key.data, mask)
+
+        while self._pending:
+            callback, args = self._pending.popleft()
+            EventLoop._run(callback, *args)
+
+        if self._deadlines:
+            now = time.monotonic()
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, _, callback, args = heapq.heappop(self._deadlines)
+                EventLoop._run(callback, *args)
+
+        if self.timers:
+            self.timers.advance()
+
+    @staticmethod
+    def _run(callback, *args):
+        """Run a callback, logging what it raises so one failing callback can not stop the loop."""
+        try:
+            callback(*args)
+        except Exception:
+            logger.exception("Event loop callback %r failed", callback)
+
+    def run_forever(self):
+        """Dispatch events until stop is called."""
+        self.running = True
+        self.thread_id = threading.get_ident()
+        try:
+            while self.running:
+                self.run_once()
+        finally:
+            self.thread_id = None
+
+    def in_loop_thread(self):
+        """Returns True if called from the thread running the loop."""
+        return self.thread_id == threading.get_ident()
+
+    def run_in_loop(self, callback, *args):
+        """Run a callback on the loop thread and wait for it to finish. The callback is run
+        directly if the loop is not running or this is already the loop thread.
+
+        :param callback: The function to run.
+        :param args: Positional arguments for the callback.
+
+        :returns: The value returned by the callback.
+        """
+        if not self.running or self.in_loop_thread():
+            return callback(*args)
+
+        done = threading.Event()
+        result = [None, None]
+
+        def run():
+            try:
+                result[0] = callback(*args)
+            except BaseException as exc:
+                result[1] = exc
+            finally:
+                done.set()
+
+        self.call_soon_threadsafe(run)
+        done.wait()
+        if result[1] is not None:
+            raise result[1]
+        return result[0]
+
+    def stop(self):
+        """Ask the loop to exit after the current iteration. Safe to call from any thread."""
+        self.running = False
+        self.call_soon_threadsafe(lambda: None)
+
+    def close(self):
+        """Release the selector and the wake up sockets."""
+        self.selector.close()
+        self._waker_r.close()
+        self._waker_w.close()
@@ -0,0 +1,79 @@
+""" Precompiled codec for the header of data frames as per RFC 6455 section 5.2.
+
+The layout of the header is documented field by field in DataFrameFormat. This module
+parses and builds headers with precompiled structs for each of the three payload length
+encodings and looks opcodes up in a 16 entry table instead of going through the field
+dictionaries for every frame.
+"""
+import struct
+from .DataFrameFormat import FrameType
+
+HEADER = struct.Struct('!BB')       # 7 bit payload length.
+HEADER_16 = struct.Struct('!BBH')   # Payload length 126 followed by a 16 bit length.
+HEADER_64 = struct.Struct('!BBQ')   # Payload length 127 followed by a 64 bit length.
+MASK_KEY_SIZE = 4
+
+FIN_BIT = 0x80
+RSV_BITS = 0x70
+RSV_SHIFT = 4
+RSV1_BIT = 0x40
+OPCODE_BITS = 0x0F
+MASK_BIT = 0x80
+LENGTH_BITS = 0x7F
+
+# The FrameType of each 4 bit opcode, None for the reserved opcodes.
+_VALID = frozenset(frame_type.value for frame_type in FrameType)
+OPCODES = tuple(FrameType(opcode) if opcode in _VALID else None for opcode in range(16))
+
+
+def parse_header(buffer, pos=0):
+    """Parse the header of the frame starting at pos.
+
+    :param buffer: A bytes-like object holding the received bytes.
+    :param pos: The offset of the first byte of the frame.
+
+    :returns: A tuple of (first, masked, header_len, payload_len) where first is the byte holding
+    the fin bit, the reserved bits and the opcode and header_len includes the masking key,
+    or None if the buffer does not hold the whole header yet.
+    """
+    available = len(buffer) - pos
+    if available < 2:
+        return None
+
+    first, second = HEADER.unpack_from(buffer, pos)
+    payload_len = second & LENGTH_BITS
+    if payload_len < 126:
+        header_len = 2
+    elif payload_len == 126:
+        if available < HEADER_16.size:
+            return None
+        header_len = HEADER_16.size
+        payload_len = HEADER_16.unpack_from(buffer, pos)[2]
+    else:
+        if available < HEADER_64.size:
+            return None
+        header_len = HEADER_64.size
+        payload_len = HEADER_64.unpack_from(buffer, pos)[2]
+
+    masked = second & MASK_BIT
+    if masked:
+        header_len += MASK_KEY_SIZE
+    return (first, masked, header_len, payload_len)
+
+
+def pack_header(opcode, payload_len, fin=True, rsv1=False):
+    """Build the header of an unmasked frame, as sent by the server.
+
+    :param opcode: The FrameType of the frame.
+    :param payload_len: The length of the payload in bytes.
+    :param fin: False if more fragments of the message will follow.
+    :param rsv1: True if the payload has been compressed with permessage-deflate.
+
+    :returns: The header as bytes.
+    """
+    first = opcode | (FIN_BIT if fin else 0) | (RSV1_BIT if rsv1 else 0)
+    if payload_len < 126:
+        return HEADER.pack(first, payload_len)
+    if payload_len <= 0xFFFF:
+        return HEADER_16.pack(first, 126, payload_len)
+    return HEADER_64.pack(first, 127, payload_len)
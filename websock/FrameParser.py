@@ -0,0 +1,163 @@
+from collections import namedtuple
+from .DataFrameFormat import *
+from .FrameHeader import parse_header, OPCODES, FIN_BIT, RSV_BITS, RSV_SHIFT, OPCODE_BITS, MASK_KEY_SIZE
+from .Masking import unmask
+from .ServerException import *
+
+Frame = namedtuple('Frame', ['fin', 'opcode', 'payload', 'rsv'])
+Frame.__new__.__defaults__ = (0,)
+Frame.__doc__ = """A complete data frame. The payload has already been unmasked.
+
+    fin     - 1 if this is the final fragment of a message.
+    opcode  - The raw 4 bit opcode, see FrameType.
+    payload - A memoryview of the payload inside the parser's buffer. The parser never
+              modifies the bytes of a frame once it has been returned.
+    rsv     - The 3 reserved bits, used by extensions.
+"""
+
+
+class FrameParser:
+    """Incremental parser for data frames formatted as per RFC 6455.
+
+    Bytes are fed in chunks of any size, for example straight from recv_into, and complete
+    frames are returned once all of their bytes have arrived. A frame may be split over
+    several chunks and a chunk may contain several frames.
+
+        parser = FrameParser()
+        parser.feed(chunk)
+        for frame in parser:
+            ...
+    """
+
+    def __init__(self, max_frame_size=None):
+        """
+        :param max_frame_size: The largest payload accepted in a single frame, None for no limit.
+        """
+        self.buffer = bytearray()
+        self.pos = 0    # Start of the first unparsed frame in the buffer.
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        """Append received bytes to the buffer.
+
+        :param data: A bytes-like object holding the next chunk of the stream.
+        """
+        if self.pos:
+            # Drop the frames that have already been parsed.
+            try:
+                del self.buffer[:self.pos]
+            except BufferError:
+                # A payload view handed out earlier is still alive, leave it untouched.
+                self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        try:
+            self.buffer.extend(data)
+        except BufferError:
+            self.buffer = self.buffer + data
+
+    def pending(self):
+        """Returns the number of buffered bytes that do not form a complete frame yet."""
+        return len(self.buffer) - self.pos
+
+    def next_frame(self):
+        """Parse the next frame in the buffer.
+
+        :returns: A Frame or None if the buffer does not hold a complete frame yet.
+        :raises WebSocketMessageTooBig: If the frame is larger than max_frame_size.
+        """
+        header = parse_header(self.buffer, self.pos)
+        if header is None:
+            return None
+        first, masked, header_len, payload_len = header
+
+        if self.max_frame_size is not None and payload_len > self.max_frame_size:
+            raise WebSocketMessageTooBig("Frame of {} bytes exceeds the limit".format(payload_len), None)
+
+        start = self.pos + header_len
+        end = start + payload_len
+        if len(self.buffer) < end:
+            return None
+
+        payload = memoryview(self.buffer)[start:end]
+        if masked:
+            # Unmask in place, the bytes have been consumed so the buffer can be overwritten.
+            unmask(payload, self.buffer[start-MASK_KEY_SIZE:start], payload)
+
+        self.pos = end
+        return Frame(1 if first & FIN_BIT else 0, first & OPCODE_BITS, payload, (first & RSV_BITS) >> RSV_SHIFT)
+
+    def __iter__(self):
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+class MessageAssembler:
+    """Reassembles fragmented messages as per RFC 6455 section 5.4.
+
+    The payloads of the fragments are appended to a single growable buffer. Unfragmented
+    messages and control frames, which may be interleaved with fragments, are passed
+    through without being copied. Messages compressed with permessage-deflate are
+    decompressed once complete.
+    """
+
+    def __init__(self, max_message_size=None):
+        """
+        :param max_message_size: The largest message accepted, None for no limit.
+        """
+        self.max_message_size = max_message_size
+        self.deflate = None     # DeflateContext if permessage-deflate was negotiated.
+        self.opcode = None      # Opcode of the message being reassembled.
+        self.compressed = False
+        self.buffer = None
+
+    def add(self, frame):
+        """Add the next frame received from the client.
+
+        :param frame: The Frame returned by the FrameParser.
+
+        :returns: A tuple of (opcode, payload) once a message or control frame is complete,
+        otherwise None.
+        :raises WebSocketInvalidDataFrame: If the frame breaks the fragmentation rules.
+        :raises WebSocketMessageTooBig: If the message is larger than max_message_size.
+        """
+        opcode = OPCODES[frame.opcode]
+        if opcode is None:
+            raise WebSocketInvalidDataFrame("Unknown opcode {}".format(frame.opcode), None)
+        if frame.rsv and (frame.rsv != RSV1 or self.deflate is None or opcode in (FrameType.CONTINUATION, FrameType.CLOSE, FrameType.PING, FrameType.PONG)):
+            raise WebSocketInvalidDataFrame("Unexpected reserved bits {}".format(frame.rsv), None)
+        if opcode >= FrameType.CLOSE:
+            if not frame.fin or len(frame.payload) > 125:
+                raise WebSocketInvalidDataFrame("Control frames must not be fragmented", None)
+            return (opcode, frame.payload)
+
+        if opcode == FrameType.CONTINUATION:
+            if self.opcode is None:
+                raise WebSocketInvalidDataFrame("Continuation frame without a message to continue", None)
+        elif self.opcode is not None:
+            raise WebSocketInvalidDataFrame("Expected a continuation frame", None)
+
+        size = len(frame.payload) + (len(self.buffer) if self.buffer is not None else 0)
+        if self.max_message_size is not None and size > self.max_message_size:
+            self.opcode = self.buffer = None
+            raise WebSocketMessageTooBig("Message of {} bytes exceeds the limit".format(size), None)
+
+        if opcode != FrameType.CONTINUATION:
+            if frame.fin:
+                return (opcode, self._decompress(frame.payload) if frame.rsv else frame.payload)
+            self.opcode = opcode
+            self.compressed = bool(frame.rsv)
+            self.buffer = bytearray()
+
+        self.buffer.extend(frame.payload)
+        if not frame.fin:
+            return None
+
+        message = (self.opcode, self._decompress(self.buffer) if self.compressed else self.buffer)
+        self.opcode = self.buffer = None
+        return message
+
+    def _decompress(self, payload):
+        """Decompress a complete permessage-deflate message."""
+        return self.deflate.decompress(payload, self.max_message_size)
@@ -0,0 +1,178 @@
+""" Runs the callbacks of the application off the thread that reads the sockets.
+
+Tasks are submitted with a key, the client that caused them, and the tasks of one key
+run one at a time in the order they were submitted while tasks of different keys run
+concurrently. Each key has a bounded number of pending tasks, past which the server stops
+reading from the client until the handler catches up.
+"""
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .Log import logger
+
+
+def _timed(fn, *args):
+    """Run fn in the executor and record when it started and finished. time.monotonic is
+    system wide, so the times can be compared across processes.
+    """
+    started = time.monotonic()
+    result = fn(*args)
+    return (result, started, time.monotonic())
+
+
+class Timing:
+    """Count, total and maximum of a series of durations.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        """Returns a dictionary of count, mean and max, in seconds."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+
+
+class HandlerExecutor:
+    """Keeps the tasks of each client in order on top of a concurrent.futures executor.
+
+    With a ThreadPoolExecutor the server runs on_data_receive and on_binary_receive through
+    it. A ProcessPoolExecutor suits CPU heavy work, which the application submits itself
+    with a picklable function and a callback that gets the result back in this process:
+
+        cpu = HandlerExecutor(ProcessPoolExecutor())
+
+        def on_data_receive(client, data):
+            cpu.submit(client, answer, data, callback=lambda reply: server.send(client, reply))
+    """
+
+    def __init__(self, executor=None, max_workers=None, max_pending=64):
+        """
+        :param executor: The concurrent.futures.Executor to run the tasks in, a ThreadPoolExecutor
+        with max_workers threads if left out.
+        :param max_workers: The number of threads of the default executor.
+        :param max_pending: The number of pending tasks of one client above which it is paused.
+        """
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers, thread_name_prefix="WebSocketHandler")
+        self.executor = executor
+        self.max_pending = max_pending
+        self.on_error = None    # Called with the exception raised by a task.
+        self.on_resume = None   # Called with the key of a paused client once it may be read again.
+        self.queue_wait = Timing()  # Time between submitting a task and the start of its execution.
+        self.execution = Timing()   # Time spent executing the tasks.
+        self._queues = {}       # Dictionary of key to the deque of its pending tasks, the first one is running.
+        self._lock = threading.Condition()
+
+    def submit(self, key, fn, *args, callback=None):
+        """Run fn(*args) after the tasks already submitted with the same key.
+
+        :param key: The client the task belongs to.
+        :param fn: The function to run.
+        :param args: Positional arguments for fn.
+        :param callback: An optional function called with the result of fn.
+
+        :returns: False if the key now has max_pending tasks or more and its client should not
+        be read until on_resume is called, otherwise True.
+        """
+        task = (fn, args, callback, time.monotonic())
+        with self._lock:
+            tasks = self._queues.get(key)
+            if tasks is None:
+                tasks = self._queues[key] = deque()
+            tasks.append(task)
+            pending = len(tasks)
+        if pending == 1:
+            self._start(key, task)
+        return pending < self.max_pending
+
+    def pending(self, key=None):
+        """Returns the number of pending tasks of a key, or of every key if left out."""
+        with self._lock:
+            if key is not None:
+                return len(self._queues.get(key, ()))
+            return sum(len(tasks) for tasks in self._queues.values())
+
+    def wait(self, key, timeout=None):
+        """Block until a key has fewer than max_pending tasks.
+
+        :returns: False if the timeout expired first.
+        """
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self._queues.get(key, ())) < self.max_pending, timeout)
+
+    def metrics(self):
+        """Returns a dictionary with the number of pending tasks and the queue wait and
+        execution time summaries.
+        """
+        return {
+            'pending': self.pending(),
+            'queue_wait': self.queue_wait.summary(),
+            'execution': self.execution.summary(),
+        }
+
+    def shutdown(self, wait=True):
+        """Shut the underlying executor down.
+
+        :param wait: If True the tasks already submitted are run first, the following task of a
+        key is only handed to the executor once the previous one has finished.
+        """
+        if wait:
+            with self._lock:
+                self._lock.wait_for(lambda: not self._queues)
+        self.executor.shutdown(wait=wait)
+
+    def _start(self, key, task):
+        fn, args, callback, submitted = task
+        try:
+            future = self.executor.submit(_timed, fn, *args)
+        except RuntimeError as exc:
+            # The executor has been shut down.
+            logger.warning("Dropped a task of %s: %s", key, exc)
+            with self._lock:
+                self._queues.pop(key, None)
+                self._lock.notify_all()
+            return
+        future.add_done_callback(functools.partial(self._done, key, task))
+
+    def _done(self, key, task, future):
+        """Called when a task has finished, starts the next task of the same key."""
+        fn, args, callback, submitted = task
+        try:
+            result, started, finished = future.result()
+            self.queue_wait.add(max(0.0, started - submitted))
+            self.execution.add(finished - started)
+            if callback is not None:
+                callback(result)
+        except Exception as exc:
+            if self.on_error is not None:
+                self.on_error(exc)
+            else:
+                logger.exception("Handler of %s failed", key)
+
+        with self._lock:
+            tasks = self._queues[key]
+            tasks.popleft()
+            resume = len(tasks) == self.max_pending - 1
+            following = tasks[0] if tasks else None
+            if following is None:
+                del self._queues[key]
+            self._lock.notify_all()
+
+        if resume and self.on_resume is not None:
+            self.on_resume(key)
+        if following is not None:
+            self._start(key, following)
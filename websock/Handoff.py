@@ -0,0 +1,65 @@
+""" Passing the listening socket of a server to the process replacing it.
+
+During a restart the old process hands its listening socket over a Unix socket with
+SCM_RIGHTS. The replacement accepts from the same socket, so the kernel keeps queueing
+new connections throughout and none is refused, while the old process drains its clients.
+
+    # Replacement process
+    listener = receive_listener("/run/websock.handoff")
+    server = WebSocketServer(listener=listener, on_data_receive=on_data_receive)
+    server.serve_forever(event_loop=True)
+
+The old process offers its socket with WebSocketServer.enable_handoff, before the
+replacement is started.
+"""
+import array
+import os
+import socket
+
+_FD_SIZE = array.array('i').itemsize
+
+
+def listen(path):
+    """Create the Unix socket on which the listening socket is offered.
+
+    :param path: The file system path of the Unix socket, an existing file there is replaced.
+
+    :returns: The listening Unix socket.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1)
+    return sock
+
+
+def send_listener(sock, listener):
+    """Send a listening socket over a connected Unix socket.
+
+    :param sock: The Unix socket connected to the receiving process.
+    :param listener: The listening socket, it stays open in this process.
+    """
+    sock.sendmsg([b"L"], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [listener.fileno()]))])
+
+
+def receive_listener(path, timeout=10.0):
+    """Receive the listening socket offered by the process being replaced.
+
+    :param path: The path of the Unix socket of the old process.
+    :param timeout: Seconds to wait for the socket, None to wait forever.
+
+    :returns: The listening socket, already bound and listening.
+    :raises OSError: If no socket was received.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        _, ancillary, _, _ = sock.recvmsg(1, socket.CMSG_SPACE(_FD_SIZE))
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS and len(data) >= _FD_SIZE:
+            fd = array.array('i', data[:_FD_SIZE])[0]
+            return socket.socket(socket.AF_INET, socket.SOCK_STREAM, fileno=fd)
+    raise OSError("No listening socket received from {}".format(path))
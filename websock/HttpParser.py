@@ -0,0 +1,186 @@
+""" Incremental parser of the HTTP/1.1 request that opens a WebSocket connection.
+
+The request is read in chunks of any size, for example straight from recv_into, until the
+blank line ending its header. The size and number of the header fields are capped so a
+client can not make the server buffer an unbounded request, and the bytes that follow the
+request in the same chunk, such as the first data frames of an eager client, are kept so
+they can be handed to the FrameParser. handshake_response answers a parsed request, it is
+shared by WebSocketServer and AsyncWebSocketServer.
+"""
+from urllib.parse import parse_qs
+from .ServerException import WebSocketBadRequest
+
+_HEAD_END = b"\r\n\r\n"
+# The 101 response is built by splicing the accept key between two constant byte strings.
+_SWITCHING_HEAD = (
+    b"HTTP/1.1 101 Switching Protocols\r\n"
+    b"Upgrade: websocket\r\n"
+    b"Connection: Upgrade\r\n"
+    b"Sec-WebSocket-Accept: "
+)
+_EXTENSIONS_HEADER = "\r\nSec-WebSocket-Extensions: %s"
+
+
+class HttpRequest:
+    """The request line and header of an HTTP request.
+
+    Header field names are lower case, and the values of a field that is repeated are joined
+    with ", " as allowed by RFC 7230.
+    """
+
+    def __init__(self, method, target, version, headers):
+        self.method = method
+        self.target = target    # The request target as sent, e.g. "/chat?room=1".
+        self.version = version
+        self.headers = headers  # Dictionary of lower case field name to value.
+        self.path, _, self.query = target.partition('?')
+
+    def header(self, name, default=None):
+        """Returns the value of a header field, looked up case-insensitively.
+
+        :param name: The name of the field.
+        :param default: Returned if the field was not sent.
+        """
+        return self.headers.get(name.lower(), default)
+
+    def has_token(self, name, token):
+        """Returns True if a comma separated header field, such as Connection, contains a token.
+        The comparison is case-insensitive.
+        """
+        value = self.headers.get(name.lower())
+        if value is None:
+            return False
+        value = value.lower()
+        token = token.lower()
+        return value == token or any(item.strip() == token for item in value.split(','))
+
+    def params(self):
+        """Returns the query string parsed into a dictionary of name to a list of values."""
+        return parse_qs(self.query)
+
+
+def parse_head(head, max_headers=None):
+    """Parse the request line and header fields of a request.
+
+    :param head: The bytes of the request up to, and without, the blank line.
+    :param max_headers: The largest number of header fields accepted, None for no limit.
+
+    :returns: An HttpRequest.
+    :raises WebSocketBadRequest: If the request is malformed or has too many header fields.
+    """
+    # Field values are opaque bytes, latin-1 maps each of them to a character. Splitting on a
+    # single character is much faster than on CRLF, the CR is stripped with the whitespace.
+    lines = head.decode('latin-1').split("\n")
+    request_line = lines[0].rstrip("\r").split(' ')
+    if len(request_line) != 3 or not request_line[2].startswith("HTTP/"):
+        raise WebSocketBadRequest("Malformed request line", None)
+    if max_headers is not None and len(lines) - 1 > max_headers:
+        raise WebSocketBadRequest("Too many header fields", None, 431)
+
+    headers = {}
+    for line in lines[1:]:
+        name, colon, value = line.partition(':')
+        # Whitespace around the name is not allowed, which also rules out obsolete line folding.
+        if not colon or not name or name != name.strip():
+            raise WebSocketBadRequest("Malformed header field", None)
+        name = name.lower()
+        value = value.strip(' \t\r')
+        if name in headers:
+            headers[name] += ", " + value
+        else:
+            headers[name] = value
+    return HttpRequest(request_line[0], request_line[1], request_line[2], headers)
+
+
+def handshake_response(request, accept, permessage_deflate=None):
+    """Derives the response to an upgrade request and negotiates the extensions requested by the client.
+
+    :param request: The parsed HttpRequest, or the raw bytes of the whole upgrade request.
+    :param accept: A function returning the Sec-WebSocket-Accept value, as bytes, of a Sec-WebSocket-Key.
+    :param permessage_deflate: The PerMessageDeflate offered by the server, None to refuse compression.
+
+    :returns (valid, response, deflate): A flag indicating if the request was valid, the bytes of
+    the 101 response or None if it was not, and the DeflateContext of the connection, or None if
+    permessage-deflate was not negotiated.
+    """
+    resp = (False, None, None)
+    if not isinstance(request, HttpRequest):
+        try:
+            request = HttpParser().feed(request)
+        except WebSocketBadRequest:
+            return resp
+        if request is None:
+            return resp
+
+    if request.method != "GET" or not request.has_token("upgrade", "websocket"):
+        return resp
+    key = request.header("sec-websocket-key")
+    if not key:
+        return resp
+
+    try:
+        response = _SWITCHING_HEAD + accept(key)
+    except UnicodeEncodeError:
+        return resp
+
+    deflate = None
+    extensions = request.header("sec-websocket-extensions")
+    if permessage_deflate is not None and extensions:
+        deflate, accepted = permessage_deflate.negotiate(extensions)
+        if deflate is not None:
+            response += (_EXTENSIONS_HEADER % accepted).encode()
+
+    return (True, response + _HEAD_END, deflate)
+
+
+class HttpParser:
+    """Collects the bytes of a request until its header is complete.
+
+        parser = HttpParser()
+        request = parser.feed(chunk)
+        if request is not None:
+            frame_parser.feed(parser.leftover)
+    """
+
+    def __init__(self, max_size=16384, max_headers=100):
+        """
+        :param max_size: The largest request line and header accepted in bytes.
+        :param max_headers: The largest number of header fields accepted.
+        """
+        self.max_size = max_size
+        self.max_headers = max_headers
+        self.buffer = bytearray()
+        self.scanned = 0    # Bytes of the buffer already searched for the end of the header.
+        self.leftover = b''     # Bytes received after the request.
+
+    def feed(self, data):
+        """Append received bytes and parse the request once its header is complete.
+
+        :param data: A bytes-like object holding the next chunk of the stream.
+
+        :returns: The HttpRequest, or None if more data is needed.
+        :raises WebSocketBadRequest: If the request is malformed or too large.
+        """
+        if self.buffer:
+            buffer = self.buffer
+            buffer.extend(data)
+        else:
+            # Usually the whole request arrives in one read and is never buffered.
+            buffer = bytes(data)
+        # The end of the header may straddle two chunks.
+        end = buffer.find(_HEAD_END, max(0, self.scanned - len(_HEAD_END) + 1))
+        if end < 0:
+            if len(buffer) > self.max_size:
+                raise WebSocketBadRequest("Request header of more than {} bytes".format(self.max_size), None, 431)
+            if buffer is not self.buffer:
+                self.buffer.extend(buffer)
+            self.scanned = len(buffer)
+            return None
+        if end > self.max_size:
+            raise WebSocketBadRequest("Request header of more than {} bytes".format(self.max_size), None, 431)
+
+        self.leftover = bytes(buffer[end + len(_HEAD_END):])
+        head = buffer[:end]
+        self.buffer = bytearray()
+        self.scanned = 0
+        return parse_head(head, self.max_headers)
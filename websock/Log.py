@@ -0,0 +1,115 @@
+""" Logging of the servers, kept off the path of every message.
+
+Everything is logged to the "websock" logger and nothing is configured by default, so the
+host application decides where the records go. The records of every message are only built
+when INFO is enabled, with lazy %-style arguments, and they can be sampled. FileLog writes
+the records to a file from a background thread instead of the threads serving the clients.
+"""
+import itertools
+import logging
+import logging.handlers
+import queue
+from .DataFrameFormat import FrameType
+
+logger = logging.getLogger("websock")
+# Keeps the records from reaching the lastResort handler on stderr when the application configures no logging.
+logger.addHandler(logging.NullHandler())
+
+LOG_IN = "[IN] "
+LOG_OUT = "[OUT]"
+LOG_FORMAT = "%(levelname)s:%(threadName)s\n\t%(message)s"
+
+# Unbounded queue implemented in C, much cheaper to put to than queue.Queue where available.
+_SimpleQueue = getattr(queue, 'SimpleQueue', queue.Queue)
+
+
+class Sampler:
+    """Decides which of the frequent events are logged.
+
+    Rates are given per event as one record in N events, 0 to drop them all. The events are
+    'message' for TEXT and BINARY messages, 'control' for CLOSE, PING and PONG frames and
+    'refused' for connections refused by admission control.
+    """
+
+    def __init__(self, rates=None):
+        """
+        :param rates: A dictionary of event to N, events that are left out are all logged.
+        """
+        self.rates = dict(rates) if rates else {}
+        self._counters = {event: itertools.count() for event in self.rates}
+
+    def sample(self, event):
+        """Returns True if this occurrence of event should be logged."""
+        rate = self.rates.get(event, 1)
+        if rate <= 1:
+            return rate == 1
+        return next(self._counters[event]) % rate == 0
+
+
+def log_frame(sampler, frame_type, address, data):
+    """Log a message or control frame received from a client. Callers check that INFO is
+    enabled first so nothing is done for every message when it is not.
+
+    :param sampler: The Sampler of the server.
+    :param frame_type: The FrameType of the frame.
+    :param address: The address of the client.
+    :param data: The decoded payload.
+    """
+    if frame_type == FrameType.TEXT:
+        if sampler.sample('message'):
+            logger.info("%s %s: %s - '%s'", LOG_IN, frame_type.name, address, data)
+    elif frame_type == FrameType.BINARY:
+        if sampler.sample('message'):
+            logger.info("%s %s: %s - %d bytes", LOG_IN, frame_type.name, address, len(data))
+    elif sampler.sample('control'):
+        logger.info("%s %s: %s", LOG_IN, frame_type.name, address)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues the records as they are, so even the message is formatted on the listener thread.
+    The arguments of the records logged by the servers are immutable.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class FileLog:
+    """Writes the records of the websock logger to a file on a background thread.
+
+    The serving threads only put the records on a queue with a QueueHandler, and a
+    QueueListener formats them and does the file I/O.
+    """
+
+    def __init__(self, filename, level=logging.INFO, mode='w', format=LOG_FORMAT):
+        """
+        :param filename: The path of the log file.
+        :param level: The lowest level that is logged.
+        :param mode: 'w' to truncate the file, 'a' to append to it.
+        :param format: The format of the records.
+        """
+        self.filename = filename
+        self.level = level
+        self._file_handler = logging.FileHandler(filename, mode=mode, delay=True)
+        self._file_handler.setFormatter(logging.Formatter(format))
+        self._queue = _SimpleQueue()
+        self._queue_handler = _QueueHandler(self._queue)
+        self._listener = logging.handlers.QueueListener(self._queue, self._file_handler)
+
+    def start(self):
+        """Start writing the records to the file.
+
+        :returns: The FileLog.
+        """
+        self._queue_handler.setLevel(self.level)
+        logger.addHandler(self._queue_handler)
+        if logger.level == logging.NOTSET or logger.level > self.level:
+            logger.setLevel(self.level)
+        self._listener.start()
+        return self
+
+    def stop(self):
+        """Write the queued records and close the file."""
+        logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        self._file_handler.close()
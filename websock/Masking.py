@@ -0,0 +1,63 @@
+""" Fast XOR masking of payload data as per RFC 6455 section 5.3.
+
+Instead of XORing one byte at a time the 4 byte masking key is tiled to the size of a
+block and whole blocks are XORed as integers. NumPy is used instead for larger payloads
+when it is installed.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_BLOCK_SIZE = 65536     # Must be a multiple of 8.
+_NUMPY_MIN_SIZE = 1024  # Below this size the overhead of creating arrays outweighs the faster XOR.
+
+
+def unmask(data, mask_key, out=None):
+    """XOR data with the repeating 4 byte mask_key. Masking and unmasking are the same operation.
+
+    :param data: A bytes-like object holding the masked payload.
+    :param mask_key: The 4 byte masking key.
+    :param out: An optional writable buffer of the same length as data that receives the result.
+    It may be data itself to unmask in place.
+
+    :returns: The buffer holding the result, out if it was provided or else a new bytearray.
+    """
+    size = len(data)
+    if out is None:
+        out = bytearray(size)
+    if size == 0:
+        return out
+
+    if numpy is not None and size >= _NUMPY_MIN_SIZE:
+        _unmask_numpy(data, bytes(mask_key), out)
+    else:
+        _unmask_int(data, bytes(mask_key), out)
+    return out
+
+
+def _unmask_int(data, mask_key, out):
+    """Unmask block by block using arbitrary precision integers."""
+    size = len(data)
+    block = min(size + (-size % 8), _BLOCK_SIZE)
+    key = int.from_bytes(mask_key * (block // 4), 'little')
+    view = memoryview(data)
+    target = memoryview(out)
+    for start in range(0, size, block):
+        chunk = view[start:start+block]
+        length = len(chunk)
+        chunk_key = key if length == block else key & ((1 << (length * 8)) - 1)
+        target[start:start+length] = (int.from_bytes(chunk, 'little') ^ chunk_key).to_bytes(length, 'little')
+
+
+def _unmask_numpy(data, mask_key, out):
+    """Unmask 8 bytes at a time using NumPy."""
+    size = len(data)
+    result = numpy.frombuffer(out, dtype=numpy.uint8)
+    source = numpy.frombuffer(data, dtype=numpy.uint8)
+    words = size // 8
+    if words:
+        key = numpy.frombuffer(mask_key * 2, dtype=numpy.uint64)
+        numpy.bitwise_xor(source[:words*8].view(numpy.uint64), key, out=result[:words*8].view(numpy.uint64))
+    for i in range(words * 8, size):
+        result[i] = source[i] ^ mask_key[i % 4]
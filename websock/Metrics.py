@@ -0,0 +1,328 @@
+""" Counters and latency histograms describing the traffic of a server.
+
+The counters of each connection are plain attributes of its Connection, incremented by the
+thread that already owns the connection, so the hot path never takes a lock. Server wide
+totals are the sum of the live connections plus the connections that have been closed,
+which are folded into the totals when they are retired. Histograms are sharded per thread
+and merged when they are read.
+
+The metrics can be pulled as a dictionary with snapshot, or scraped by Prometheus from
+the text endpoint started with serve.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from .Log import logger
+
+# Counters kept by every Connection.
+CONNECTION_COUNTERS = (
+    ('frames_in', "Frames received."),
+    ('messages_in', "Messages received."),
+    ('bytes_in', "Bytes received, including frame headers."),
+    ('frames_out', "Frames sent."),
+    ('bytes_out', "Bytes sent, including frame headers and handshake responses."),
+    ('writes_out', "System calls writing to the sockets."),
+)
+
+# Counters of events that happen once per connection at most.
+SERVER_COUNTERS = (
+    ('connections_opened', "Connections accepted."),
+    ('connections_closed', "Connections closed."),
+    ('handshakes', "Successful opening handshakes."),
+    ('handshake_failures', "Invalid upgrade requests."),
+    ('handshake_timeouts', "Connections dropped for not completing the opening handshake within handshake_timeout seconds."),
+    ('connections_refused', "Connections refused by admission control."),
+    ('idle_timeouts', "Connections closed after idle_timeout seconds without a message."),
+    ('pong_timeouts', "Connections dropped after a keepalive PING went unanswered for ping_timeout seconds."),
+    ('tls_handshakes', "Completed TLS handshakes."),
+    ('tls_resumed', "TLS handshakes that resumed an earlier session."),
+    ('tls_handshake_failures', "TLS handshakes that failed or were abandoned."),
+)
+
+HISTOGRAMS = (
+    ('handshake_seconds', "Time from accepting a connection to completing its opening handshake."),
+    ('callback_seconds', "Time spent in on_data_receive and on_binary_receive."),
+    ('rtt_seconds', "Round trip time of keepalive PINGs."),
+)
+
+_PREFIX = "websock_"
+
+
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+_MAX_SHIFT = 36     # Values from 2**(_MAX_SHIFT+_SUB_BITS+1) microseconds, about 9 days, share the last bucket.
+_BUCKETS = _SUB_COUNT * (_MAX_SHIFT + 2)
+
+
+class Histogram:
+    """HDR-style histogram of durations with a bounded relative error.
+
+    Durations are recorded as whole microseconds. Values below 16 get a bucket each and
+    every following power of two is split into 16 linear sub-buckets, so a bucket is never
+    wider than 1/16th of its values and recording is a few integer operations on a list.
+    """
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0  # Sum of the recorded values in microseconds.
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        if value < _SUB_COUNT:
+            return value
+        shift = value.bit_length() - _SUB_BITS - 1
+        if shift > _MAX_SHIFT:
+            return _BUCKETS - 1
+        return (shift << _SUB_BITS) + (value >> shift)
+
+    @staticmethod
+    def _upper(index):
+        """Returns the largest value counted in a bucket."""
+        if index < _SUB_COUNT:
+            return index
+        shift = (index >> _SUB_BITS) - 1
+        return ((index - (shift << _SUB_BITS) + 1) << shift) - 1
+
+    def record(self, seconds):
+        """Add a duration.
+
+        :param seconds: The duration in seconds.
+        """
+        value = int(seconds * 1000000)
+        if value < _SUB_COUNT:
+            if value < 0:
+                value = 0
+            index = value
+        else:
+            # Inlined _index, this runs once per message.
+            shift = value.bit_length() - _SUB_BITS - 1
+            index = (shift << _SUB_BITS) + (value >> shift) if shift <= _MAX_SHIFT else _BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Add the values recorded by another histogram."""
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Returns the duration in seconds below which percent of the values fall, rounded up
+        to the upper end of its bucket.
+
+        :param percent: A number between 0 and 100.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(Histogram._upper(index), self.max) / 1000000.0
+        return self.max / 1000000.0
+
+    def below(self, value):
+        """Returns the number of values smaller than value microseconds, which must be a power of two."""
+        return sum(self.counts[:Histogram._index(value)])
+
+    def summary(self):
+        """Returns a dictionary of count, mean, p50, p90, p99 and max, in seconds."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count / 1000000.0 if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max / 1000000.0,
+        }
+
+
+class _Shard:
+    """The histograms written by one thread."""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.histograms = {name: Histogram() for name, _ in HISTOGRAMS}
+
+
+class Metrics:
+    """Counters and histograms of one or more servers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = dict.fromkeys((name for name, _ in CONNECTION_COUNTERS + SERVER_COUNTERS), 0)
+        self._closes = {}       # Dictionary of close status code to the number of connections closed with it.
+        self._sources = []      # Functions returning the live connections.
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()    # Histograms of the threads that have exited.
+
+    def add_source(self, connections):
+        """Include the counters of live connections in the totals.
+
+        :param connections: A function returning a list of the live Connections.
+        """
+        with self._lock:
+            self._sources.append(connections)
+
+    def increment(self, name, value=1):
+        """Add to one of the SERVER_COUNTERS. Takes a lock, so it is meant for events that
+        happen once per connection rather than once per message.
+        """
+        with self._lock:
+            self._totals[name] += value
+
+    def retire(self, connection, status_code):
+        """Fold the counters of a connection into the totals when it is closed. Must be called
+        while the connection is still returned by its source.
+
+        :param connection: The Connection being closed.
+        :param status_code: The status code it was closed with.
+        """
+        with self._lock:
+            if connection.retired:
+                return
+            connection.retired = True
+            for name, _ in CONNECTION_COUNTERS:
+                self._totals[name] += getattr(connection, name)
+            self._totals['connections_closed'] += 1
+            self._closes[status_code] = self._closes.get(status_code, 0) + 1
+
+    def observe(self, name, seconds):
+        """Record a duration in one of the HISTOGRAMS.
+
+        :param name: The name of the histogram.
+        :param seconds: The duration in seconds.
+        """
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._add_shard()
+        shard.histograms[name].record(seconds)
+
+    def _add_shard(self):
+        shard = _Shard()
+        with self._lock:
+            self._fold_exited()
+            self._shards.append(shard)
+        return shard
+
+    def _fold_exited(self):
+        """Merge the shards of the threads that have exited, which no longer write to them."""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                for name, histogram in shard.histograms.items():
+                    self._retired.histograms[name].merge(histogram)
+        self._shards = alive
+
+    def counters(self):
+        """Returns a dictionary of every counter, plus the number of open connections."""
+        with self._lock:
+            totals = dict(self._totals)
+            live = 0
+            for source in self._sources:
+                for connection in source():
+                    if connection.retired:
+                        continue
+                    live += 1
+                    for name, _ in CONNECTION_COUNTERS:
+                        totals[name] += getattr(connection, name)
+        totals['connections'] = live
+        return totals
+
+    def close_codes(self):
+        """Returns a dictionary of close status code to the number of connections closed with it."""
+        with self._lock:
+            return dict(self._closes)
+
+    def histogram(self, name):
+        """Returns a Histogram merging the values recorded by every thread."""
+        merged = Histogram()
+        with self._lock:
+            self._fold_exited()
+            merged.merge(self._retired.histograms[name])
+            for shard in self._shards:
+                merged.merge(shard.histograms[name])
+        return merged
+
+    def snapshot(self):
+        """Returns a dictionary of the counters, the close codes and a summary of every histogram."""
+        snapshot = self.counters()
+        snapshot['close_codes'] = self.close_codes()
+        for name, _ in HISTOGRAMS:
+            snapshot[name] = self.histogram(name).summary()
+        return snapshot
+
+    def prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+        counters = self.counters()
+        for name, description in CONNECTION_COUNTERS + SERVER_COUNTERS:
+            metric = _PREFIX + name + "_total"
+            lines.append("# HELP {} {}".format(metric, description))
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, counters[name]))
+
+        metric = _PREFIX + "connections"
+        lines.append("# HELP {} Open connections.".format(metric))
+        lines.append("# TYPE {} gauge".format(metric))
+        lines.append("{} {}".format(metric, counters['connections']))
+
+        metric = _PREFIX + "closes_total"
+        lines.append("# HELP {} Connections closed by status code, 1006 when closed without a close frame.".format(metric))
+        lines.append("# TYPE {} counter".format(metric))
+        for code, count in sorted(self.close_codes().items()):
+            lines.append('{}{{code="{}"}} {}'.format(metric, int(code), count))
+
+        for name, description in HISTOGRAMS:
+            histogram = self.histogram(name)
+            metric = _PREFIX + name
+            lines.append("# HELP {} {}".format(metric, description))
+            lines.append("# TYPE {} histogram".format(metric))
+            # Powers of two from 16 microseconds to about 67 seconds.
+            for shift in range(4, 27):
+                lines.append('{}_bucket{{le="{:g}"}} {}'.format(metric, (1 << shift) / 1000000.0, histogram.below(1 << shift)))
+            lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, histogram.count))
+            lines.append("{}_sum {}".format(metric, histogram.total / 1000000.0))
+            lines.append("{}_count {}".format(metric, histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, ip='', port=9100):
+        """Serve the metrics in the Prometheus text format over HTTP on a thread of its own.
+
+        :param ip: The address to listen on.
+        :param port: The port to listen on, 0 picks a free port.
+
+        :returns: The HTTPServer, call shutdown and server_close on it to stop serving.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("Metrics scrape from %s", self.client_address)
+
+        endpoint = HTTPServer((ip, port), Handler)
+        threading.Thread(target=endpoint.serve_forever, name="MetricsEndpoint", daemon=True).start()
+        return endpoint
@@ -0,0 +1,162 @@
+""" The permessage-deflate extension as per RFC 7692.
+
+PerMessageDeflate holds the server's preferences and negotiates the extension with each
+client, producing a DeflateContext which owns the connection's compressor and decompressor.
+"""
+import zlib
+from .ServerException import *
+
+EXTENSION_NAME = "permessage-deflate"
+_TAIL = b'\x00\x00\xff\xff'     # Removed from the end of every compressed message.
+
+
+class PerMessageDeflate:
+    """Server side configuration of the permessage-deflate extension.
+    """
+
+    def __init__(self, server_no_context_takeover=False, client_no_context_takeover=False,
+                 server_max_window_bits=15, client_max_window_bits=15, compress_level=6,
+                 mem_level=8, threshold=128):
+        """
+        :param server_no_context_takeover: Reset the compressor after every message, which uses less
+        memory per connection at the cost of a worse compression ratio.
+        :param client_no_context_takeover: Ask clients to reset their compressor after every message.
+        :param server_max_window_bits: The LZ77 window size used to compress, between 9 and 15.
+        :param client_max_window_bits: The largest window size clients may use when they allow it to be limited.
+        :param compress_level: The zlib compression level.
+        :param mem_level: The zlib memory level, lower values use less memory per connection.
+        :param threshold: Messages smaller than this number of bytes are sent uncompressed.
+        """
+        if not 9 <= server_max_window_bits <= 15 or not 9 <= client_max_window_bits <= 15:
+            raise ValueError("Window bits must be between 9 and 15")
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_max_window_bits = server_max_window_bits
+        self.client_max_window_bits = client_max_window_bits
+        self.compress_level = compress_level
+        self.mem_level = mem_level
+        self.threshold = threshold
+
+    def negotiate(self, header):
+        """Accept the first acceptable permessage-deflate offer of a client.
+
+        :param header: The value of the Sec-WebSocket-Extensions request header.
+
+        :returns: A tuple of (DeflateContext, response) where response is the value of the
+        Sec-WebSocket-Extensions response header, or (None, None) if no offer was acceptable.
+        """
+        for offer in header.split(","):
+            params = [param.strip() for param in offer.split(";")]
+            if params[0].lower() != EXTENSION_NAME:
+                continue
+            accepted = self._accept(params[1:])
+            if accepted is not None:
+                return accepted
+        return (None, None)
+
+    def _accept(self, params):
+        """Validate the parameters of one offer and derive the agreed parameters.
+
+        :returns: A tuple of (DeflateContext, response) or None if the offer is not acceptable.
+        """
+        offered = {}
+        for param in params:
+            name, _, value = param.partition("=")
+            name = name.strip().lower()
+            value = value.strip().strip('"')
+            if name in offered:
+                return None
+            offered[name] = value
+
+        server_no_context_takeover = self.server_no_context_takeover
+        client_no_context_takeover = self.client_no_context_takeover
+        server_window_bits = self.server_max_window_bits
+        client_window_bits = None
+        for name, value in offered.items():
+            if name == "server_no_context_takeover" and not value:
+                server_no_context_takeover = True
+            elif name == "client_no_context_takeover" and not value:
+                client_no_context_takeover = True
+            elif name == "server_max_window_bits" and value.isdigit() and 9 <= int(value) <= 15:
+                server_window_bits = min(server_window_bits, int(value))
+            elif name == "client_max_window_bits" and (not value or value.isdigit() and 8 <= int(value) <= 15):
+                client_window_bits = min(self.client_max_window_bits, int(value) if value else 15)
+            else:
+                return None
+
+        response = [EXTENSION_NAME]
+        if server_no_context_takeover:
+            response.append("server_no_context_takeover")
+        if client_no_context_takeover:
+            response.append("client_no_context_takeover")
+        if "server_max_window_bits" in offered or server_window_bits < 15:
+            response.append("server_max_window_bits={}".format(server_window_bits))
+        if client_window_bits is not None and client_window_bits < 15:
+            response.append("client_max_window_bits={}".format(client_window_bits))
+
+        context = DeflateContext(server_no_context_takeover, client_no_context_takeover, server_window_bits,
+                                 self.compress_level, self.mem_level, self.threshold)
+        return (context, "; ".join(response))
+
+
+class DeflateContext:
+    """The compressor and decompressor of one connection.
+    """
+
+    def __init__(self, server_no_context_takeover=False, client_no_context_takeover=False,
+                 server_window_bits=15, compress_level=6, mem_level=8, threshold=128):
+        self.server_no_context_takeover = server_no_context_takeover
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_window_bits = server_window_bits
+        self.compress_level = compress_level
+        self.mem_level = mem_level
+        self.threshold = threshold
+        self._compressor = None
+        self._decompressor = None
+
+    def compress(self, data, final=True):
+        """Compress a message, or one fragment of a message.
+
+        :param data: The bytes-like payload.
+        :param final: False if more fragments of the same message will follow.
+
+        :returns: The compressed payload.
+        """
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -self.server_window_bits, self.mem_level)
+        payload = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if final:
+            if payload.endswith(_TAIL):
+                payload = payload[:-len(_TAIL)]
+            if self.server_no_context_takeover:
+                self._compressor = None
+        return payload
+
+    def decompress(self, data, max_size=None):
+        """Decompress a complete message received from the client.
+
+        :param data: The bytes-like compressed payload.
+        :param max_size: The largest decompressed size accepted, None for no limit.
+
+        :returns: The decompressed payload.
+        :raises WebSocketMessageTooBig: If the message decompresses to more than max_size bytes.
+        :raises WebSocketInvalidDataFrame: If the payload is not valid deflate data.
+        """
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            payload = self._decompressor.decompress(bytes(data) + _TAIL, max_size or 0)
+        except zlib.error as exc:
+            self._decompressor = None
+            raise WebSocketInvalidDataFrame("Invalid compressed data: {}".format(exc), None)
+
+        if self._decompressor.unconsumed_tail:
+            self._decompressor = None
+            raise WebSocketMessageTooBig("Decompressed message exceeds the limit", None)
+        if self.client_no_context_takeover:
+            self._decompressor = None
+        return payload
+
+    def should_compress(self, data):
+        """Returns True if a message is large enough to be worth compressing."""
+        return len(data) >= self.threshold
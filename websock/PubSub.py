@@ -0,0 +1,354 @@
+""" Topics, also known as rooms or channels, that clients subscribe to.
+
+A TopicIndex maps every topic to the set of clients subscribed to it, so publishing a
+message only touches the subscribers of its topic instead of every client. A Backplane
+spreads the messages published on one server to the subscribers held by other servers.
+"""
+import hashlib
+import hmac
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from .DataFrameFormat import FrameType
+from .Log import logger
+
+_MESSAGE_HEADER = struct.Struct('!HIB')     # Topic length, payload length and FrameType.
+_NONCE_SIZE = 16                            # Bytes of the challenge sent to a peer that has to prove the secret.
+_AUTH_TIMEOUT = 5.0                         # Seconds a peer has to answer the challenge.
+
+
+def _recv_exactly(sock, size):
+    """Receive exactly size bytes from a blocking socket.
+
+    :raises OSError: If the connection is closed first.
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionResetError("Connection closed by the peer")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class TopicIndex:
+    """Thread-safe inverted index of topic to subscribed clients.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # Dictionary of topic to the set of its clients.
+        self._topics = {}       # Dictionary of client to the set of its topics.
+        self._lock = threading.Lock()
+
+    def subscribe(self, client, topic):
+        """Add a client to the subscribers of a topic."""
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(client)
+            self._topics.setdefault(client, set()).add(topic)
+
+    def unsubscribe(self, client, topic):
+        """Remove a client from the subscribers of a topic, ignored if it was not subscribed."""
+        with self._lock:
+            self._discard(client, topic)
+            topics = self._topics.get(client)
+            if topics is not None:
+                topics.discard(topic)
+                if not topics:
+                    del self._topics[client]
+
+    def remove(self, client):
+        """Unsubscribe a client from every topic.
+
+        :returns: The set of topics the client was subscribed to.
+        """
+        with self._lock:
+            topics = self._topics.pop(client, set())
+            for topic in topics:
+                self._discard(client, topic)
+            return topics
+
+    def _discard(self, client, topic):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def subscribers(self, topic):
+        """Returns a list of the clients subscribed to a topic."""
+        with self._lock:
+            return list(self._subscribers.get(topic, ()))
+
+    def topics(self, client=None):
+        """Returns the set of topics a client is subscribed to, or every topic with at least
+        one subscriber if client is left out.
+        """
+        with self._lock:
+            if client is None:
+                return set(self._subscribers)
+            return set(self._topics.get(client, ()))
+
+
+class Backplane:
+    """Spreads published messages between the servers sharing it.
+
+    A server attaches itself when it is created with a backplane. Messages published on
+    the server are passed to publish, and the backplane delivers the messages of the other
+    servers by calling server.publish with local=True.
+    """
+
+    def attach(self, server):
+        """Start delivering the messages of other servers to server."""
+        raise NotImplementedError
+
+    def detach(self, server):
+        """Stop delivering messages to server, called when it is closed."""
+        pass
+
+    def publish(self, server, topic, data, data_type):
+        """Deliver a message published on server to the subscribers held by the other servers.
+
+        :param server: The WebSocketServer the message was published on.
+        :param topic: The topic as a String.
+        :param data: The payload as bytes.
+        :param data_type: The FrameType of the message.
+        """
+        raise NotImplementedError
+
+
+class LocalBackplane(Backplane):
+    """Connects several servers running in the same process.
+    """
+
+    def __init__(self):
+        self._servers = []
+        self._lock = threading.Lock()
+
+    def attach(self, server):
+        with self._lock:
+            self._servers = self._servers + [server]
+
+    def detach(self, server):
+        with self._lock:
+            self._servers = [other for other in self._servers if other is not server]
+
+    def publish(self, server, topic, data, data_type):
+        for other in self._servers:
+            if other is not server:
+                other.publish(topic, data, data_type=data_type, local=True)
+
+
+class TcpBackplane(Backplane):
+    """Connects servers running on different nodes over TCP.
+
+    Every node listens on its own address and keeps a connection to each of its peers, so
+    the nodes form a full mesh and a message crosses a single hop. Each peer has a bounded
+    queue and a sender thread, which reconnects when the connection is lost, so a slow or
+    unreachable peer never blocks publishing.
+
+    Whoever can connect to the backplane can publish to every client subscribed on the node,
+    so it listens on the loopback interface unless told otherwise. Nodes on different hosts
+    should restrict the inbound connections to the addresses of their peers with allowed_peers
+    and share a secret, which a peer has to prove by answering a random challenge with its
+    HMAC before any of its messages are delivered. The messages themselves are neither
+    encrypted nor signed, so the backplane belongs on a private network or a secure tunnel.
+
+        backplane = TcpBackplane("10.0.0.1", 9000, peers=[("10.0.0.2", 9000)],
+                                 allowed_peers=["10.0.0.2"], secret=b"shared by every node")
+    """
+
+    def __init__(self, ip='127.0.0.1', port=0, peers=(), queue_size=10000, reconnect_delay=1.0,
+                 allowed_peers=None, secret=None):
+        """
+        :param ip: The address to listen on for messages from the peers.
+        :param port: The port to listen on, 0 picks a free port.
+        :param peers: A sequence of (host, port) addresses of the other nodes.
+        :param queue_size: The number of messages kept for a peer that can not keep up, more are dropped.
+        :param reconnect_delay: The number of seconds to wait before reconnecting to a peer.
+        :param allowed_peers: The IP addresses inbound connections are accepted from, None to accept any.
+        :param secret: Bytes shared by every node which peers have to prove, None to trust any peer
+        that can connect.
+        """
+        self.ip = ip
+        self.port = port
+        self.queue_size = queue_size
+        self.reconnect_delay = reconnect_delay
+        self.allowed_peers = frozenset(allowed_peers) if allowed_peers is not None else None
+        self.secret = secret
+        self.server = None
+        self.alive = False
+        self._listener = None
+        self._peers = {}    # Dictionary of address to the queue of messages for that peer.
+        self._inbound = []
+        self._lock = threading.Lock()
+        for peer in peers:
+            self.add_peer(peer)
+
+    def address(self):
+        """Returns the (host, port) address the backplane listens on."""
+        return self._listener.getsockname()
+
+    def add_peer(self, address):
+        """Start sending the published messages to another node.
+
+        :param address: The (host, port) address the peer's backplane listens on.
+        """
+        with self._lock:
+            if address in self._peers:
+                return
+            messages = queue.Queue(self.queue_size)
+            self._peers[address] = messages
+        if self.alive:
+            self._start_sender(address, messages)
+
+    def attach(self, server):
+        self.server = server
+        self.alive = True
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.ip, self.port))
+        self._listener.listen(16)
+        threading.Thread(target=self._accept, name="BackplaneAccept", daemon=True).start()
+        with self._lock:
+            peers = list(self._peers.items())
+        for address, messages in peers:
+            self._start_sender(address, messages)
+
+    def detach(self, server):
+        self.alive = False
+        if self._listener is not None:
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+        with self._lock:
+            peers = list(self._peers.values())
+            inbound, self._inbound = self._inbound, []
+        for messages in peers:
+            try:
+                messages.put_nowait(None)   # Wakes up the sender thread so it can exit.
+            except queue.Full:
+                pass
+        for sock in inbound:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+    def publish(self, server, topic, data, data_type):
+        topic = topic.encode()
+        message = _MESSAGE_HEADER.pack(len(topic), len(data), data_type) + topic + bytes(data)
+        with self._lock:
+            peers = list(self._peers.items())
+        for address, messages in peers:
+            try:
+                messages.put_nowait(message)
+            except queue.Full:
+                logger.warning("Backplane peer %s is not keeping up, message dropped", address)
+
+    def _start_sender(self, address, messages):
+        threading.Thread(target=self._send, args=(address, messages), name="BackplaneSender", daemon=True).start()
+
+    def _send(self, address, messages):
+        """Body of the sender thread of a peer."""
+        sock = None
+        message = None
+        while self.alive:
+            if message is None:
+                message = messages.get()
+                if message is None:
+                    break
+            try:
+                if sock is None:
+                    sock = socket.create_connection(address, timeout=self.reconnect_delay)
+                    if self.secret is not None:
+                        self._answer_challenge(sock)
+                    sock.settimeout(None)
+                sock.sendall(message)
+                message = None
+            except OSError as exc:
+                logger.warning("Backplane peer %s is unreachable: %s", address, exc)
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                time.sleep(self.reconnect_delay)
+        if sock is not None:
+            sock.close()
+
+    def _accept(self):
+        """Body of the thread accepting the connections of the peers."""
+        while self.alive:
+            try:
+                sock, address = self._listener.accept()
+            except OSError:
+                return
+            if self.allowed_peers is not None and address[0] not in self.allowed_peers:
+                logger.warning("Backplane connection from %s refused, not an allowed peer", address[0])
+                sock.close()
+                continue
+            with self._lock:
+                self._inbound.append(sock)
+            threading.Thread(target=self._receive, args=(sock, address), name="BackplaneReceiver", daemon=True).start()
+
+    def _answer_challenge(self, sock):
+        """Prove the secret to the peer a sender has just connected to.
+
+        :raises OSError: If the peer closed the connection or did not send its challenge in time.
+        """
+        nonce = _recv_exactly(sock, _NONCE_SIZE)
+        sock.sendall(hmac.new(self.secret, nonce, hashlib.sha256).digest())
+
+    def _challenge(self, sock):
+        """Check that a peer that has just connected knows the secret.
+
+        :returns: True if the peer answered the challenge with the right HMAC.
+        """
+        nonce = os.urandom(_NONCE_SIZE)
+        expected = hmac.new(self.secret, nonce, hashlib.sha256).digest()
+        try:
+            sock.settimeout(_AUTH_TIMEOUT)
+            sock.sendall(nonce)
+            answer = _recv_exactly(sock, len(expected))
+            sock.settimeout(None)
+        except OSError:
+            return False
+        return hmac.compare_digest(answer, expected)
+
+    def _receive(self, sock, address):
+        """Body of the thread receiving the messages of a peer."""
+        authenticated = self.secret is None or self._challenge(sock)
+        if not authenticated:
+            logger.warning("Backplane connection from %s refused, it did not prove the secret", address[0])
+        buffer = bytearray()
+        while self.alive and authenticated:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                break
+            if not data:
+                break
+            buffer.extend(data)
+            pos = 0
+            while len(buffer) - pos >= _MESSAGE_HEADER.size:
+                topic_len, size, data_type = _MESSAGE_HEADER.unpack_from(buffer, pos)
+                start = pos + _MESSAGE_HEADER.size
+                end = start + topic_len + size
+                if len(buffer) < end:
+                    break
+                topic = buffer[start:start+topic_len]
+                payload = bytes(buffer[start+topic_len:end])
+                pos = end
+                try:
+                    self.server.publish(topic.decode(), payload, data_type=FrameType(data_type), local=True)
+                except Exception as exc:
+                    logger.warning("Backplane delivery failed: %s", exc)
+            del buffer[:pos]
+        with self._lock:
+            if sock in self._inbound:
+                self._inbound.remove(sock)
+        sock.close()
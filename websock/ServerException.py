@@ -7,10 +7,35 @@ class WebSocketInvalidHandshake(Exception):
         self.client = client
 
 
+class WebSocketBadRequest(WebSocketInvalidHandshake):
+    """ The upgrade request could not be parsed, or exceeds the limits of the server
+    """
+
+    def __init__(self, message, client, status=400):
+        super().__init__(message, client)
+        self.status = status    # HTTP status code of the response sent to the client.
+
+
 class WebSocketInvalidDataFrame(Exception):
     """ The server was unable to parse the data frame
     """
 
     def __init__(self, message, client):
         super().__init__(message)
-        self.client = client
\ No newline at end of file
+        self.client = client
+
+class WebSocketMessageTooBig(WebSocketInvalidDataFrame):
+    """ The client sent a message larger than the server accepts
+    """
+
+    def __init__(self, message, client):
+        super().__init__(message, client)
+
+
+class WebSocketSlowConsumer(Exception):
+    """ The outbound queue of a client is full, the message was dropped or the client disconnected
+    """
+
+    def __init__(self, message, client):
+        super().__init__(message)
+        self.client = client
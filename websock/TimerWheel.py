@@ -0,0 +1,111 @@
+""" Hashed timer wheel, for the timers every connection keeps such as keepalive checks.
+
+Time is divided into ticks and a timer is kept in the slot of the tick it expires on, modulo
+the number of slots. Scheduling and cancelling are O(1) and advancing the wheel only looks
+at the slots of the ticks that have passed, so 100k timers cost no more than a list entry
+each instead of a thread per threading.Timer.
+"""
+import math
+import threading
+import time
+from .Log import logger
+
+
+class Timer:
+    """A callback scheduled on a TimerWheel."""
+
+    def __init__(self, target, callback, args):
+        self.target = target    # The tick the timer expires on.
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the timer from firing. It is dropped from its slot when the wheel reaches it."""
+        self.cancelled = True
+
+
+class TimerWheel:
+    """Timers with a resolution of one tick.
+
+    schedule may be called from any thread. advance runs the expired callbacks on the calling
+    thread, which is the event loop thread or a thread of its own, see EventLoop.call_later.
+    """
+
+    def __init__(self, tick=0.1, slots=512):
+        """
+        :param tick: The resolution of the timers in seconds.
+        :param slots: The number of slots, timers further away than slots ticks wait in their
+        slot for more than one turn of the wheel.
+        """
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._start = time.monotonic()
+        self._processed = 0     # The last tick whose timers have been run.
+        self._count = 0         # Timers in the slots, including cancelled ones not dropped yet.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _now_tick(self, now):
+        return int((now - self._start) / self.tick)
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) once delay seconds have passed, rounded up to the next tick.
+
+        :returns: The Timer, which can be cancelled.
+        """
+        with self._lock:
+            target = max(self._now_tick(time.monotonic()) + max(1, int(math.ceil(delay / self.tick))), self._processed + 1)
+            timer = Timer(target, callback, args)
+            self._slots[target % len(self._slots)].append(timer)
+            self._count += 1
+        return timer
+
+    def timeout(self, now=None):
+        """Returns the number of seconds until the next tick is due, or None if there are no timers."""
+        if not self._count:
+            return None
+        if now is None:
+            now = time.monotonic()
+        return max(0.0, self._start + (self._processed + 1) * self.tick - now)
+
+    def advance(self, now=None):
+        """Run the callbacks of the timers that have expired.
+
+        :returns: The number of callbacks run.
+        """
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        with self._lock:
+            now_tick = self._now_tick(now)
+            if now_tick <= self._processed:
+                return 0
+            slots = self._slots
+            # After a long pause every slot is visited once rather than once per missed tick.
+            for tick in range(max(self._processed + 1, now_tick - len(slots) + 1), now_tick + 1):
+                index = tick % len(slots)
+                if not slots[index]:
+                    continue
+                remaining = []
+                for timer in slots[index]:
+                    if timer.cancelled:
+                        self._count -= 1
+                    elif timer.target <= now_tick:
+                        self._count -= 1
+                        expired.append(timer)
+                    else:
+                        remaining.append(timer)
+                slots[index] = remaining
+            self._processed = now_tick
+
+        for timer in expired:
+            if not timer.cancelled:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    # One failing timer must not stop the others or the thread advancing the wheel.
+                    logger.exception("Timer callback %r failed", timer.callback)
+        return len(expired)
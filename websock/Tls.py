@@ -0,0 +1,52 @@
+""" TLS settings for serving wss:// directly instead of behind a terminating proxy.
+
+The servers take any server side ssl.SSLContext. create_server_context builds one with the
+settings that matter for a WebSocket server: ALPN announcing HTTP/1.1, a floor on the protocol
+version, an optional cipher list and session tickets, which let reconnecting clients resume
+their session with an abbreviated handshake instead of a full key exchange.
+"""
+import ssl
+
+
+def create_server_context(certfile, keyfile=None, password=None, alpn_protocols=("http/1.1",), ciphers=None,
+                          minimum_version=ssl.TLSVersion.TLSv1_2, session_tickets=2):
+    """Create an SSLContext for a WebSocketServer or AsyncWebSocketServer.
+
+    :param certfile: Path of the PEM certificate chain.
+    :param keyfile: Path of the private key, None if it is in certfile.
+    :param password: Password of the private key, if it is encrypted.
+    :param alpn_protocols: Protocols offered with ALPN, None to not use ALPN.
+    :param ciphers: An OpenSSL cipher string for TLS 1.2, None for the defaults. The TLS 1.3
+    suites are not affected.
+    :param minimum_version: The oldest ssl.TLSVersion accepted.
+    :param session_tickets: The number of TLS 1.3 tickets sent after a full handshake, 0 to
+    turn tickets off. TLS 1.2 clients may then still resume from the session cache of the context.
+
+    :returns: The ssl.SSLContext.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile, password)
+    context.minimum_version = minimum_version
+    if ciphers is not None:
+        context.set_ciphers(ciphers)
+    if alpn_protocols:
+        context.set_alpn_protocols(list(alpn_protocols))
+    if session_tickets:
+        if hasattr(context, 'num_tickets'):
+            context.num_tickets = session_tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        if hasattr(context, 'num_tickets'):
+            context.num_tickets = 0
+    return context
+
+
+def describe(sock):
+    """Returns a dictionary describing the TLS session of a connected SSLSocket."""
+    cipher = sock.cipher()
+    return {
+        'version': sock.version(),
+        'cipher': cipher[0] if cipher else None,
+        'alpn': sock.selected_alpn_protocol(),
+        'resumed': sock.session_reused,
+    }
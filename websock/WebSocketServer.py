@@ -1,74 +1,649 @@
 import errno
+import functools
+import itertools
+import os
+import select
+import selectors
 import socket
+import ssl
 import threading
+import time
 import hashlib
 import base64
 import logging
+from http import HTTPStatus
 from .DataFrameFormat import *
 from .ServerException import *
+from .EventLoop import EventLoop
+from .TimerWheel import TimerWheel
+from .Connection import Connection, ConnectionState
+from .ConnectionRegistry import ConnectionRegistry
+from .FrameParser import FrameParser
+from .FrameHeader import pack_header, OPCODES
+from .HttpParser import HttpParser, handshake_response
+from .PubSub import TopicIndex
+from .Metrics import Metrics
+from .Log import logger, log_frame, Sampler, FileLog, LOG_IN, LOG_OUT
+from . import Handoff, Tls
+
+# Makes a single send on a blocking socket return instead of waiting, 0 where unsupported.
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+# Raised by a non-blocking socket that can not make progress, SSLSockets raise their own errors.
+_WOULD_BLOCK = (BlockingIOError, InterruptedError, ssl.SSLWantReadError, ssl.SSLWantWriteError)
+
+# Longest a threaded server waits in accept before it checks whether it is still serving.
+_ACCEPT_POLL = 0.5
+
+# Longest the thread of a TLS client waits for its socket to be readable before reading again.
+_READ_POLL = 0.5
 
 
 class WebSocketServer:
 
     _SEC_KEY = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
-    _HANDKSHAKE_RESP = (
-        "HTTP/1.1 101 Switching Protocols\r\n"
-        "Upgrade: websocket\r\n"
-        "Connection: Upgrade\r\n"
-        "Sec-WebSocket-Accept: %s\r\n\r\n"
-    )
-
-    _LOGS_FILE = "ws.log"
-    _LOG_IN = "[IN] "
-    _LOG_OUT = "[OUT]"
-
-    def __init__(self, ip='', port=80, on_data_receive=None, on_connection_open=None, on_connection_close=None, on_server_destruct=None, on_error=None, DEBUG=False):
+    _SEC_KEY_BYTES = _SEC_KEY.encode()
+    _ERROR_RESP = "HTTP/1.1 %d %s\r\nConnection: close\r\nContent-Length: 0\r\n\r\n"
+    # Responses of the connections refused by admission control, built once.
+    _REFUSED_RESP = {
+        429: b"HTTP/1.1 429 Too Many Requests\r\nConnection: close\r\nContent-Length: 0\r\nRetry-After: 1\r\n\r\n",
+        503: b"HTTP/1.1 503 Service Unavailable\r\nConnection: close\r\nContent-Length: 0\r\nRetry-After: 1\r\n\r\n",
+    }
+
+    _HANDSHAKE_END = b"\r\n\r\n"
+
+
+    def __init__(self, ip='', port=80, on_data_receive=None, on_connection_open=None, on_connection_close=None, on_server_destruct=None, on_error=None, DEBUG=False, read_size=65536, max_message_size=16777216, on_binary_receive=None, permessage_deflate=None,
+                 on_pause_writing=None, on_resume_writing=None, write_limit_high=65536, write_limit_low=16384,
+                 max_write_buffer=16777216, slow_consumer_policy='disconnect', slow_consumer_timeout=None,
+                 backplane=None, handler_executor=None, metrics=None, metrics_port=None, log_file=None,
+                 log_sampling=None, ping_interval=None, ping_timeout=20.0, idle_timeout=None,
+                 max_request_size=16384, max_request_headers=100, accept_cache_size=0, ssl_context=None,
+                 backlog=128, admission=None, handshake_timeout=10.0, listener=None,
+                 coalesce_delay=None, coalesce_bytes=65536, tcp_nodelay=None):
         self.server = None
         self.ip = ip
         self.port = port
         self.alive = True
-        self.clients = {}   # Dictionary of active clients, remove when the connection is closed.
+        self.event_loop = None
+        self._connections = ConnectionRegistry()    # Mapping of client socket to Connection state.
+        self.clients = self._connections.by_address     # Dictionary of address to active client, kept by the registry.
+        self.read_size = read_size  # Maximum number of bytes read from a socket at once.
+        self.max_message_size = max_message_size    # Larger messages are refused, None for no limit.
+        self.max_request_size = max_request_size    # Largest upgrade request header in bytes, larger ones get a 431.
+        self.max_request_headers = max_request_headers  # Most header fields in an upgrade request.
+        # Accept keys of the most recent Sec-WebSocket-Keys, for clients that retry with the same key.
+        self.accept_cache_size = accept_cache_size
+        if accept_cache_size:
+            self._accept = functools.lru_cache(maxsize=accept_cache_size)(WebSocketServer._accept_key)
+        else:
+            self._accept = WebSocketServer._accept_key
+        self.permessage_deflate = permessage_deflate    # PerMessageDeflate offered to clients, None to disable compression.
+        self.write_limit_high = write_limit_high    # Queued bytes above which on_pause_writing is called.
+        self.write_limit_low = write_limit_low      # Queued bytes below which on_resume_writing is called.
+        self.max_write_buffer = max_write_buffer    # Queued bytes above which a client is a slow consumer, None for no limit.
+        if slow_consumer_policy not in ('disconnect', 'drop'):
+            raise ValueError("slow_consumer_policy must be 'disconnect' or 'drop'")
+        self.slow_consumer_policy = slow_consumer_policy
+        self.slow_consumer_timeout = slow_consumer_timeout  # Seconds a client may stay paused, None for no limit.
+        self._local = threading.local()
+        self._writer_loop = None    # Flushes the outbound queues of threaded clients.
+        self._writer_lock = threading.Lock()
+        self.channel = None     # BroadcastChannel reaching the clients of other worker processes.
+        self.topics = TopicIndex()  # Clients subscribed to each topic.
+        self.backplane = backplane  # Backplane spreading published messages to other servers, None for this server only.
+        self.handler_executor = handler_executor    # HandlerExecutor running the data callbacks, None to run them on the reading thread.
+        if handler_executor is not None:
+            handler_executor.on_resume = self._resume_reading
+        self.metrics = metrics if metrics is not None else Metrics()    # Metrics shared with other servers if given.
+        self.metrics.add_source(self._connections.snapshot)
+        self.metrics_port = metrics_port    # Port of the Prometheus endpoint, None to not serve the metrics.
+        self._metrics_endpoint = None
+        self.ping_interval = ping_interval  # Seconds without receiving anything after which a client is pinged, None to not ping.
+        self.ping_timeout = ping_timeout    # Seconds to wait for the PONG before the client is dropped.
+        self.idle_timeout = idle_timeout    # Seconds without a message after which a client is closed, None for no limit.
+        self._timers = None     # TimerWheel of the keepalive checks of threaded clients.
+        self._ping_ids = itertools.count()
         self.on_data_receive = on_data_receive if on_data_receive is not None else self._default_func
         self.on_connection_open = on_connection_open if on_connection_open is not None else self._default_func
         self.on_connection_close = on_connection_close if on_connection_close is not None else self._default_func
         self.on_server_destruct = on_server_destruct if on_server_destruct is not None else self._default_func
         self.on_error = on_error if on_error is not None else self._default_func
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.on_binary_receive = on_binary_receive if on_binary_receive is not None else self._default_func
+        self.on_pause_writing = on_pause_writing if on_pause_writing is not None else self._default_func
+        self.on_resume_writing = on_resume_writing if on_resume_writing is not None else self._default_func
+        # A listening socket handed over by the process this server replaces, see Handoff.
+        self.server = listener if listener is not None else socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listening = listener is not None
+        self.draining = False   # True once drain has been called, no more clients are accepted.
+        self.drained = threading.Event()    # Set once a drain is complete.
+        self._drain_timer = None    # Timer of the drain deadline, None once the drain is finished.
+        self._drain_stop = True
+        self.ssl_context = ssl_context  # Server side SSLContext wrapping every client for wss://, see Tls.create_server_context.
+        self.backlog = backlog      # Connections the kernel queues until they are accepted.
+        self.admission = admission  # AdmissionControl refusing connections over its limits, None to accept every connection.
+        self.handshake_timeout = handshake_timeout  # Seconds a client has to complete its opening handshake, None for no limit.
+        self.coalesce_delay = coalesce_delay    # Seconds the frames sent to a client are held to be written together, None to write at once.
+        self.coalesce_bytes = coalesce_bytes    # Held bytes after which the frames are written without waiting.
+        self.tcp_nodelay = tcp_nodelay  # TCP_NODELAY of the clients, None for the default of the system.
         self.DEBUG = DEBUG
+        if backplane is not None:
+            backplane.attach(self)
 
-        # Initialize log file format.
-        logging.basicConfig(
-            filename=WebSocketServer._LOGS_FILE,
-            filemode='w',
-            format='%(levelname)s:%(threadName)s\n\t%(message)s',
-            level=logging.DEBUG if DEBUG else logging.INFO
-        )
+        # Logging is left to the application unless a log file is asked for.
+        self._sampler = Sampler(log_sampling)   # One in N of the frequent records are logged, see Sampler.
+        if DEBUG:
+            logger.setLevel(logging.DEBUG)
+        self._log_file = None
+        if log_file is not None:
+            self._log_file = FileLog(log_file, logging.DEBUG if DEBUG else logging.INFO).start()
 
     def _default_func(self, *args, **kwargs):
         """Default function if the user does not define one.
         """
         pass
 
-    def serve_forever(self):
+    def serve_forever(self, event_loop=False, reuse_port=False):
         """Just like serve_once but forever.
+
+        :param event_loop: If True all clients are multiplexed on a single thread using a
+        selectors based event loop instead of starting a thread per client. The callbacks
+        are then run on the event loop thread and recv is not available.
+        :param reuse_port: If True the socket is bound with SO_REUSEPORT so several processes
+        can listen on the same port, see WorkerPool.
         """
-        self.server.bind((self.ip, self.port))
-        self.server.listen(5)
-        while self.alive:
+        if not self._listening:
+            if reuse_port:
+                self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server.bind((self.ip, self.port))
+            self.server.listen(self.backlog)
+            self._listening = True
+        if self.metrics_port is not None and self._metrics_endpoint is None:
+            self._metrics_endpoint = self.metrics.serve(self.ip, self.metrics_port)
+        if event_loop:
+            self._serve_event_loop()
+            return
+
+        # The accept returns now and then so a drain or close_server is noticed.
+        self.server.settimeout(_ACCEPT_POLL)
+        while self.alive and not self.draining:
             self.serve_once(serve_forever=True)
+        if self.draining:
+            # The client threads are daemons, keep the process up until they are closed.
+            self.drained.wait()
+
+    def _serve_event_loop(self):
+        """Run the accept, handshake and receive state machine of every client on one event loop.
+        """
+        self.event_loop = EventLoop()
+        self.server.setblocking(False)
+        self.event_loop.register(self.server, selectors.EVENT_READ, self._on_accept)
+        if self.channel is not None:
+            self.channel.attach(self)
+        logger.info("Server is ready to accept")
+
+        try:
+            if self.alive:
+                self.event_loop.run_forever()
+        finally:
+            self.event_loop.close()
+
+    def _on_accept(self, mask):
+        """Accept every pending connection and register it with the event loop.
+        """
+        while True:
+            try:
+                client, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # The server socket was closed.
+                return
+
+            client.setblocking(False)
+            if self.admission is not None:
+                status = self.admission.admit(address[0])
+                if status is not None:
+                    self._refuse(client, address, status)
+                    continue
+            client = self._prepare(client, address)
+            if client is None:
+                continue
+            connection = Connection(client, address, non_blocking=True, max_message_size=self.max_message_size)
+            connection.on_event = functools.partial(self._on_client_event, connection)
+            self._connections.add(connection)
+            connection.events = selectors.EVENT_READ
+            self.event_loop.register(client, selectors.EVENT_READ, connection.on_event)
+            self.metrics.increment('connections_opened')
+            logger.info("%s CONNECTION: %s", LOG_IN, address)
+            self._start_handshake_timer(connection)
+
+    def _refuse(self, client, address, status):
+        """Answer a connection refused by admission control with a canned response and close it,
+        before any thread or state is allocated for it. TLS clients are closed without a response,
+        which would cost the handshake the refusal is meant to save.
+
+        :param client: The accepted socket.
+        :param address: The address of the client.
+        :param status: The HTTP status, 429 or 503.
+        """
+        self.metrics.increment('connections_refused')
+        if self._sampler.sample('refused'):
+            logger.info("%s REFUSED: %s %d", LOG_OUT, address, status)
+        if self.ssl_context is None:
+            client.setblocking(False)
+            try:
+                # Reading what the client already sent keeps close from resetting the connection
+                # before the client has read the response.
+                client.recv(4096)
+            except OSError:
+                pass
+            try:
+                client.send(WebSocketServer._REFUSED_RESP[status])
+            except OSError:
+                pass
+        client.close()
+
+    def _start_handshake_timer(self, connection):
+        """Close a new client unless it completes its opening handshake within handshake_timeout seconds."""
+        if self.handshake_timeout is not None:
+            connection.keepalive = self._call_later(self.handshake_timeout, self._handshake_expired, connection)
+
+    def _handshake_expired(self, connection):
+        """Drop a client that is still in the HANDSHAKE state, run on the thread of its timer wheel.
+
+        :param connection: The Connection whose handshake timed out.
+        """
+        if connection.state != ConnectionState.HANDSHAKE:
+            return
+        logger.info("%s HANDSHAKE TIMEOUT: %s", LOG_OUT, connection.address)
+        self.metrics.increment('handshake_timeouts')
+        connection.rejected = True
+        self.close_client(connection.address, hard_close=True)
+
+    def _on_client_event(self, connection, mask):
+        """Called by the event loop when a client socket is readable or writable.
+
+        :param connection: The Connection that is ready.
+        :param mask: The ready events.
+        """
+        if connection.state == ConnectionState.CLOSED:
+            return
+        try:
+            if connection.tls_pending:
+                self._tls_handshake(connection)
+                return
+            if mask & selectors.EVENT_WRITE:
+                self._flush(connection)
+            if mask & selectors.EVENT_READ and connection.state != ConnectionState.CLOSED:
+                self._on_readable(connection)
+        except Exception as exc:
+            # An error serving one client, in on_connection_open for example, must not stop the loop.
+            self._handler_failed(connection.client, exc)
+
+    def _on_readable(self, connection):
+        """Read the available bytes and advance the connection's state machine.
+
+        :param connection: The Connection that is readable.
+        """
+        try:
+            data = self._read(connection.client)
+        except _WOULD_BLOCK:
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self.close_client(connection.address, hard_close=True)
+            return
+        connection.bytes_in += len(data)
+        connection.last_seen = time.monotonic()
+
+        if connection.state == ConnectionState.HANDSHAKE:
+            self._feed_handshake(connection, data)
+        else:
+            connection.parser.feed(data)
+        self._on_parsed(connection)
+        if connection.tls_pending is False and connection.state != ConnectionState.CLOSED and connection.client.pending():
+            # Records decrypted by OpenSSL but not read yet do not make the socket readable.
+            self.event_loop.call_soon_threadsafe(self._on_readable, connection)
+
+    def _prepare(self, client, address):
+        """Apply the socket options of the server to an admitted socket and wrap it for TLS.
+        A client that resets the connection meanwhile is closed and its admission slot released.
+
+        :param client: The accepted socket.
+        :param address: The address of the client.
+
+        :returns: The socket to serve, or None if it was closed.
+        """
+        try:
+            if self.tcp_nodelay is not None:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay))
+        except OSError as exc:
+            logger.warning("%s SETUP FAILED: %s %s", LOG_IN, address, exc)
+            if self.admission is not None:
+                self.admission.release(address[0])
+            client.close()
+            return None
+        if self.ssl_context is not None:
+            return self._wrap(client, address)
+        return client
+
+    def _wrap(self, client, address):
+        """Wrap an accepted socket with the SSLContext of the server. The TLS handshake is done
+        later, on the thread serving the client or by the event loop without blocking.
+
+        :param client: The accepted socket.
+        :param address: The address of the client.
+
+        :returns: The SSLSocket, or None if the socket could not be wrapped.
+        """
+        try:
+            # OpenSSL writes the session tickets on their own after the handshake, Nagle's algorithm
+            # would then hold the 101 response back until the client acknowledges them.
+            if self.tcp_nodelay is None:
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return self.ssl_context.wrap_socket(client, server_side=True, do_handshake_on_connect=False)
+        except (ssl.SSLError, OSError) as exc:
+            logger.warning("%s TLS FAILED: %s %s", LOG_IN, address, exc)
+            if self.admission is not None:
+                self.admission.release(address[0])
+            client.close()
+            return None
+
+    def _tls_handshake(self, connection):
+        """Advance the TLS handshake of an event loop client as far as it goes without blocking,
+        watching the socket for the event OpenSSL waits on.
+
+        :param connection: The Connection whose handshake is pending.
+        """
+        client = connection.client
+        try:
+            client.do_handshake()
+        except ssl.SSLWantReadError:
+            events = selectors.EVENT_READ
+        except ssl.SSLWantWriteError:
+            events = selectors.EVENT_WRITE
+        except (ssl.SSLError, OSError) as exc:
+            self._tls_failed(connection, exc)
+            return
+        else:
+            self._tls_done(connection)
+            events = selectors.EVENT_READ
+        if events != connection.events:
+            self.event_loop.modify(client, events, connection.on_event)
+            connection.events = events
+        if not connection.tls_pending:
+            # The upgrade request may have arrived with the end of the handshake.
+            self._on_readable(connection)
+
+    def _tls_done(self, connection):
+        """Record a completed TLS handshake."""
+        connection.tls_pending = False
+        self.metrics.increment('tls_handshakes')
+        if connection.client.session_reused:
+            self.metrics.increment('tls_resumed')
+
+    def _tls_failed(self, connection, exc):
+        """Close a client whose TLS handshake failed, the application never saw it."""
+        logger.info("%s TLS HANDSHAKE FAILED: %s %s", LOG_IN, connection.address, exc)
+        self.metrics.increment('tls_handshake_failures')
+        connection.rejected = True
+        self.close_client(connection.address, hard_close=True)
+
+    def _feed_handshake(self, connection, data):
+        """Add received bytes to the upgrade request of a connection and complete the opening
+        handshake once the request is complete. The bytes received after the request are
+        passed on to the frame parser.
+
+        :param connection: The Connection in the HANDSHAKE state.
+        :param data: The bytes received.
+        """
+        if connection.http is None:
+            connection.http = HttpParser(self.max_request_size, self.max_request_headers)
+        try:
+            request = connection.http.feed(data)
+        except WebSocketBadRequest as exc:
+            exc.client = connection.client
+            self._reject_handshake(connection, exc)
+            return
+        if request is None:
+            return
+
+        leftover = connection.http.leftover
+        connection.http = None
+        connection.request = request
+        valid, ack = self._opening_handshake(connection.client, request)
+        if not valid:
+            self._reject_handshake(connection, WebSocketBadRequest("Invalid Handshake", connection.client))
+            return
+
+        self.send_raw(connection.client, ack)
+        connection.state = ConnectionState.OPEN
+        connection.coalesce_delay = self.coalesce_delay
+        connection.coalesce_bytes = self.coalesce_bytes
+        if connection.keepalive is not None:
+            # The handshake timer.
+            connection.keepalive.cancel()
+            connection.keepalive = None
+        connection.parser.feed(leftover)
+        self.on_connection_open(connection.client)
+        self._start_keepalive(connection)
+
+    def _reject_handshake(self, connection, exc):
+        """Answer an upgrade request that can not be accepted with an HTTP error and close the connection.
+
+        :param connection: The Connection in the HANDSHAKE state.
+        :param exc: The WebSocketBadRequest describing the problem.
+        """
+        logger.warning("%s REJECTED: %s %d %s", LOG_OUT, connection.address, exc.status, exc)
+        self.on_error(exc)
+        connection.rejected = True
+        try:
+            self.send_raw(connection.client, (WebSocketServer._ERROR_RESP % (exc.status, HTTPStatus(exc.status).phrase)).encode())
+        except (OSError, WebSocketSlowConsumer):
+            pass
+        self.close_client(connection.address, hard_close=True)
+
+    def _on_parsed(self, connection):
+        """Handle the complete messages buffered for an event loop client.
+
+        :param connection: The Connection to handle.
+        """
+        while connection.state == ConnectionState.OPEN and not connection.read_paused:
+            try:
+                message = self._next_message(connection)
+            except WebSocketInvalidDataFrame as exc:
+                self._reject_message(connection, exc)
+                return
+            if message is None:
+                return
+            valid, data = self._frame_message(*message)
+            self._handle_frame(connection.client, connection.address, valid, data)
+
+    def _next_message(self, connection):
+        """Parse the frames buffered for a connection until a message is complete.
+
+        :param connection: The Connection to parse.
+
+        :returns: A tuple of (opcode, payload) or None if more data is needed.
+        """
+        for frame in connection.parser:
+            connection.frames_in += 1
+            message = connection.assembler.add(frame)
+            if message is not None:
+                connection.messages_in += 1
+                if message[0] <= FrameType.BINARY:
+                    connection.last_message = connection.last_seen
+                return message
+        return None
+
+    def _reject_message(self, connection, exc):
+        """Close a connection that sent a message which can not be accepted.
+
+        :param connection: The offending Connection.
+        :param exc: The WebSocketInvalidDataFrame describing the problem.
+        """
+        logger.critical("Received Invalid Data Frame: %s", exc)
+        if isinstance(exc, WebSocketMessageTooBig):
+            status_code = CloseStatus.MESSAGE_TOO_BIG
+        else:
+            status_code = CloseStatus.PROTOCOL_ERROR
+        self.close_client(connection.address, status_code=status_code)
+
+    def _read(self, client):
+        """Receive the next chunk of bytes from a client into a buffer that is reused by the calling thread.
+
+        :param client: The client to read from.
+
+        :returns: A memoryview of the bytes received, which is only valid until the next read on this thread.
+        An empty view means the client closed the connection.
+        """
+        buffer = getattr(self._local, 'read_buffer', None)
+        if buffer is None or len(buffer) != self.read_size:
+            buffer = self._local.read_buffer = bytearray(self.read_size)
+        size = client.recv_into(buffer)
+        return memoryview(buffer)[:size]
+
+    def _flush(self, connection):
+        """Write as much of the connection's outbound queue as the socket accepts without blocking.
+        Called on the event loop thread, or on the writer thread for threaded clients.
+
+        :param connection: The Connection to flush.
+        """
+        client = connection.client
+        flags = WebSocketServer._send_flags(connection)
+        failed = False
+        resume = False
+        with connection.write_lock:
+            if connection.state == ConnectionState.CLOSED:
+                return
+            try:
+                connection.flush_queue(flags)
+            except _WOULD_BLOCK:
+                pass
+            except OSError:
+                failed = True
+
+            drained = not connection.out_queue
+            if drained:
+                connection.writing = False
+                self._watch_writable(connection, False)
+            if connection.paused and (drained or connection.out_bytes <= self.write_limit_low):
+                connection.paused = False
+                connection.paused_since = None
+                resume = True
+
+        if failed:
+            self.close_client(connection.address, hard_close=True)
+        elif resume:
+            self.on_resume_writing(client)
+
+    def _on_writable(self, connection, mask):
+        """Called by the writer loop when the socket of a threaded client is writable."""
+        self._flush(connection)
+
+    def _write_loop(self):
+        """Returns the EventLoop that flushes the outbound queues. Threaded clients share a writer
+        thread of their own which is started the first time a write has to be queued.
+        """
+        if self.event_loop is not None:
+            return self.event_loop
+        with self._writer_lock:
+            if self._writer_loop is None:
+                self._writer_loop = EventLoop()
+                writer = threading.Thread(target=self._run_writer, args=(self._writer_loop,), name="WebSocketWriter", daemon=True)
+                writer.start()
+            return self._writer_loop
+
+    def _run_writer(self, loop):
+        """Body of the writer thread."""
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def _start_writing(self, connection):
+        """Watch the socket of a connection with queued output for writability."""
+        loop = self._write_loop()
+        if loop.in_loop_thread():
+            self._enable_writing(connection)
+        else:
+            loop.call_soon_threadsafe(self._enable_writing, connection)
+
+    def _enable_writing(self, connection):
+        """Watch a socket for writability unless its queue has been flushed or it was closed meanwhile."""
+        with connection.write_lock:
+            self._watch_writable(connection, True)
+
+    def _watch_writable(self, connection, enable):
+        """Start or stop watching a socket for writability. Must run on the thread of the write loop
+        with the write_lock of the connection held.
+
+        :param connection: The Connection to watch.
+        :param enable: True to watch for writability, False to stop.
+        """
+        if connection.state == ConnectionState.CLOSED or (enable and not connection.writing):
+            return
+        loop = self._write_loop()
+        if connection.non_blocking:
+            self._update_events(connection)
+        elif enable:
+            loop.register(connection.client, selectors.EVENT_WRITE, functools.partial(self._on_writable, connection))
+        else:
+            loop.unregister(connection.client)
+
+    def _update_events(self, connection):
+        """Watch the socket of an event loop client for the events it currently waits on: reading
+        unless it is paused by the handler executor and writing while its queue is not empty.
+        Must run on the event loop thread.
+
+        :param connection: The Connection to update.
+        """
+        events = (0 if connection.read_paused else selectors.EVENT_READ) | (selectors.EVENT_WRITE if connection.writing else 0)
+        if events == connection.events or connection.state == ConnectionState.CLOSED:
+            return
+        if not connection.events:
+            self.event_loop.register(connection.client, events, connection.on_event)
+        elif not events:
+            self.event_loop.unregister(connection.client)
+        else:
+            self.event_loop.modify(connection.client, events, connection.on_event)
+        connection.events = events
 
     def serve_once(self, serve_forever=False):
         """Listen for incoming connections and start a new thread if a client is received.
         """
 
-        if not serve_forever:
+        if not serve_forever and not self._listening:
             self.server.bind((self.ip, self.port))
-            self.server.listen(5)
+            self.server.listen(self.backlog)
+            self._listening = True
 
-        logging.info("Server is ready to accept")
-        client, address = self.server.accept()
-        self.clients[address] = client
-        logging.info("{} CONNECTION: {}".format(WebSocketServer._LOG_IN, client.getsockname()))
+        logger.info("Server is ready to accept")
+        try:
+            client, address = self.server.accept()
+        except socket.timeout:
+            return
+        except OSError:
+            if self.alive:
+                raise
+            # The server socket was closed.
+            return
+        if self.admission is not None:
+            status = self.admission.admit(address[0])
+            if status is not None:
+                self._refuse(client, address, status)
+                return
+        client = self._prepare(client, address)
+        if client is None:
+            return
+        connection = Connection(client, address, max_message_size=self.max_message_size)
+        self._connections.add(connection)
+        self.metrics.increment('connections_opened')
+        logger.info("%s CONNECTION: %s", LOG_IN, address)
+        self._start_handshake_timer(connection)
 
         if serve_forever:
             client_thread = threading.Thread(target=self._manage_client, args=(client,), daemon=True)
@@ -83,20 +658,50 @@ class WebSocketServer:
 
         :param client: The client to control
         """   
-        upgrade_req = client.recv(2048)
-        valid, ack = self._opening_handshake(client, upgrade_req)
-
-        if valid:
-            client.send(ack)
-        else:
-            self.on_error(WebSocketInvalidHandshake("Invalid Handshake", client))            
+        connection = self._connections[client]
+        address = connection.address
+        if connection.tls_pending:
+            try:
+                client.do_handshake()
+            except (ssl.SSLError, OSError) as exc:
+                self._tls_failed(connection, exc)
+                return
+            self._tls_done(connection)
+            # SSLSocket can not be written with MSG_DONTWAIT, so the socket is made non-blocking for
+            # the sends to be queued like those of other clients, and this thread polls it instead.
+            client.setblocking(False)
 
-        self.on_connection_open(client)
+        while connection.state == ConnectionState.HANDSHAKE:
+            try:
+                data = self._read(client)
+            except _WOULD_BLOCK:
+                WebSocketServer._wait_readable(client)
+                continue
+            except OSError:
+                data = b''
+            if not data:
+                self.close_client(address, hard_close=True)
+                return
+            connection.bytes_in += len(data)
+            self._feed_handshake(connection, data)
 
-        address = client.getpeername()
         while address in self.clients:
             self._recv(client)
 
+    @staticmethod
+    def _wait_readable(client):
+        """Wait until the non-blocking socket of a threaded TLS client is readable. Returns after
+        _READ_POLL seconds anyway, so a socket closed by another thread is noticed by the next read.
+        """
+        if client.fileno() < 0:
+            return
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(client, select.POLLIN)
+            poller.poll(_READ_POLL * 1000)
+        else:
+            select.select([client], [], [], _READ_POLL)
+
     def recv(self, client):
         """Receive data from the client. This function will not call the user defined on_data_receive
            but will instead return the data. If a the next message from the client is not data (for example a close
@@ -104,7 +709,7 @@ class WebSocketServer:
            message is received.
         
             :param client: The client to receive a message from.
-            :returns: The message sent by the client.
+            :returns: The message sent by the client, a String for TEXT messages and a memoryview for BINARY messages.
         """
         return self._recv(client, user=True)
 
@@ -113,98 +718,646 @@ class WebSocketServer:
         
             :param client: The client to receive a message from.
         """
-        try:
-            address = client.getpeername()
-            data = client.recv(2048)
-        except ConnectionError:
-            self.close_client(address, hard_close=True)
-            return None
-        except OSError as exc:
-            # Socket is not connected.
-            if exc.errno == errno.ENOTCONN:
+        connection = self._connections[client]
+        address = connection.address
+        while True:
+            try:
+                message = self._next_message(connection)
+            except WebSocketInvalidDataFrame as exc:
+                self._reject_message(connection, exc)
+                return None
+            if message is not None:
+                break
+
+            try:
+                data = self._read(client)
+            except _WOULD_BLOCK:
+                WebSocketServer._wait_readable(client)
+                continue
+            except (ConnectionError, ssl.SSLError):
+                data = b''
+            except OSError as exc:
+                # Socket is not connected, or was closed by another thread.
+                if exc.errno in (errno.ENOTCONN, errno.EBADF):
+                    data = b''
+                else:
+                    raise
+
+            if not data:
                 self.close_client(address, hard_close=True)
                 return None
-            else:
-                raise
-        try:
-            valid, data = self._decode_data_frame(data)
-        except:
-            valid = None
-         
+            connection.bytes_in += len(data)
+            connection.last_seen = time.monotonic()
+            connection.parser.feed(data)
+
+        valid, data = self._frame_message(*message)
+        return self._handle_frame(client, address, valid, data, user)
+
+    def _handle_frame(self, client, address, valid, data, user=False):
+        """Act on a decoded data frame.
+
+            :param client: The client that sent the frame.
+            :param address: The address of the client.
+            :param valid: The FrameType of the frame or None if it could not be decoded.
+            :param data: The decoded payload.
+            :param user: If True TEXT and BINARY payloads are returned instead of passed to the callbacks.
+        """
+        if valid is not None and logger.isEnabledFor(logging.INFO):
+            log_frame(self._sampler, valid, address, data)
+
         if valid == FrameType.TEXT:
-            logging.info("{} {}: {} - '{}'".format(WebSocketServer._LOG_IN, valid.name, client.getsockname(), data))
             if user:
                 return data
             else:
-                self.on_data_receive(client, data)
+                self._dispatch(client, self.on_data_receive, data)
+        elif valid == FrameType.BINARY:
+            if user:
+                return data
+            else:
+                self._dispatch(client, self.on_binary_receive, data)
         elif valid == FrameType.CLOSE:
-            logging.info("{} {}: {}".format(WebSocketServer._LOG_IN, valid.name, client.getsockname()))
-            
-            # Server sent closing message client connection has already closed
-            if not self.clients[address]:
-                self.close_client(address)
+            # Either the client starts the closing handshake and is answered with its own status
+            # code, or it acknowledges the CLOSE frame of the server and no frame is sent.
+            status_code = int.from_bytes(data[:2], 'big') if len(data) >= 2 else None
+            self.close_client(address, status_code=status_code)
 
         elif valid == FrameType.PING:
-            logging.info("{} {}: {}".format(WebSocketServer._LOG_IN, valid.name, client.getsockname()))
             self._pong(client, data)
         elif valid == FrameType.PONG:
-            logging.info("{} {}: {}".format(WebSocketServer._LOG_IN, valid.name, client.getsockname()))
+            self._on_pong(client, data)
         else:
             # Received Invalid Data Frame
-            logging.critical("Received Invalid Data Frame")
+            logger.critical("Received Invalid Data Frame")
+            self.close_client(address, hard_close=True)
+
+    def _start_keepalive(self, connection):
+        """Schedule the first keepalive check of a client whose opening handshake is complete.
+
+        :param connection: The Connection to watch.
+        """
+        if self.ping_interval is None and self.idle_timeout is None:
+            return
+        connection.keepalive = self._call_later(self._keepalive_delay(connection, time.monotonic()), self._keepalive, connection)
+
+    def _call_later(self, delay, callback, *args):
+        """Schedule a callback on the timer wheel of the server. Event loop clients use the wheel of
+        the event loop, threaded clients share a wheel advanced by a thread of its own which is
+        started the first time a timer is needed.
+
+        :returns: The Timer, which can be cancelled.
+        """
+        if self.event_loop is not None:
+            return self.event_loop.call_later(delay, callback, *args)
+        with self._writer_lock:
+            if self._timers is None:
+                self._timers = TimerWheel()
+                timer_thread = threading.Thread(target=self._run_timers, args=(self._timers,), name="WebSocketKeepalive", daemon=True)
+                timer_thread.start()
+        return self._timers.schedule(delay, callback, *args)
+
+    def _run_timers(self, timers):
+        """Body of the keepalive thread of threaded clients."""
+        while self.alive:
+            time.sleep(timers.tick)
+            timers.advance()
+
+    def _keepalive_delay(self, connection, now):
+        """Returns the number of seconds until the next keepalive deadline of a connection."""
+        deadlines = []
+        if self.idle_timeout is not None:
+            deadlines.append(connection.last_message + self.idle_timeout)
+        if connection.ping_sent is not None:
+            deadlines.append(connection.ping_sent + self.ping_timeout)
+        elif self.ping_interval is not None:
+            deadlines.append(connection.last_seen + self.ping_interval)
+        return max(0.0, min(deadlines) - now)
+
+    def _keepalive(self, connection):
+        """Keepalive check of a client, run on the thread of its timer wheel. Closes the client
+        if it has not sent a message for idle_timeout seconds or has not answered a PING for
+        ping_timeout seconds, pings it if nothing has been received for ping_interval seconds,
+        and schedules the next check.
+
+        :param connection: The Connection to check.
+        """
+        if connection.state == ConnectionState.CLOSED:
+            return
+        now = time.monotonic()
+        address = connection.address
+        if self.idle_timeout is not None and now - connection.last_message >= self.idle_timeout:
+            logger.info("%s IDLE TIMEOUT: %s", LOG_OUT, address)
+            self.metrics.increment('idle_timeouts')
+            self.close_client(address, status_code=CloseStatus.GOING_AWAY)
+            return
+
+        if connection.ping_sent is not None:
+            if now - connection.ping_sent >= self.ping_timeout:
+                logger.info("%s PONG TIMEOUT: %s", LOG_OUT, address)
+                self.metrics.increment('pong_timeouts')
+                self.close_client(address, hard_close=True)
+                return
+        elif self.ping_interval is not None and now - connection.last_seen >= self.ping_interval:
+            # The payload identifies the PING so an unsolicited PONG is not mistaken for its answer.
+            connection.ping_payload = next(self._ping_ids).to_bytes(8, 'big')
+            connection.ping_sent = now
+            try:
+                self.send(connection.client, connection.ping_payload, FrameType.PING)
+            except WebSocketSlowConsumer:
+                return
+            except OSError:
+                self.close_client(address, hard_close=True)
+                return
+
+        connection.keepalive = self._call_later(self._keepalive_delay(connection, now), self._keepalive, connection)
+
+    def _on_pong(self, client, data):
+        """Record the round trip time of a keepalive PING once the client answers it.
+
+        :param client: The client that sent the PONG.
+        :param data: The payload of the PONG.
+        """
+        connection = self._connections.get(client)
+        if connection is None or connection.ping_sent is None or data != connection.ping_payload:
+            return
+        connection.rtt = time.monotonic() - connection.ping_sent
+        connection.ping_sent = None
+        connection.ping_payload = None
+        self.metrics.observe('rtt_seconds', connection.rtt)
+
+    def _dispatch(self, client, callback, data):
+        """Run a data callback, on the handler executor if there is one. A client whose handler
+        falls max_pending messages behind is not read until it catches up.
+
+            :param client: The client that sent the message.
+            :param callback: on_data_receive or on_binary_receive.
+            :param data: The message.
+        """
+        if self.handler_executor is None:
+            self._run_callback(callback, client, data)
+            return
+        if self.handler_executor.submit(client, self._run_callback, callback, client, data):
+            return
+        connection = self._connections.get(client)
+        if connection is None:
+            return
+        if connection.non_blocking:
+            connection.read_paused = True
+            self._update_events(connection)
+        else:
+            # The client has a thread of its own which can simply wait.
+            self.handler_executor.wait(client)
+
+    def _run_callback(self, callback, client, data):
+        """Run a data callback and record how long it took. A callback that raises is reported
+        to on_error and only its client is closed, the server keeps serving the others."""
+        started = time.monotonic()
+        try:
+            callback(client, data)
+        except Exception as exc:
+            self._handler_failed(client, exc)
+        finally:
+            self.metrics.observe('callback_seconds', time.monotonic() - started)
+
+    def _handler_failed(self, client, exc):
+        """Report an exception raised while serving a client and hard close that client.
+
+        :param client: The client being served.
+        :param exc: The exception.
+        """
+        connection = self._connections.get(client)
+        address = connection.address if connection is not None else None
+        logger.error("%s HANDLER FAILED: %s %r", LOG_OUT, address, exc)
+        try:
+            self.on_error(exc)
+        except Exception:
+            logger.exception("on_error of %s failed", address)
+        if connection is None:
+            return
+        if connection.non_blocking and self.event_loop.running and not self.event_loop.in_loop_thread():
+            # The client is owned by the event loop thread, the handler may run on an executor.
+            self.event_loop.call_soon_threadsafe(self.close_client, address, None, None, True)
+        else:
             self.close_client(address, hard_close=True)
 
-    def send(self, client, data, data_type=FrameType.TEXT):
-        """Send a string of data to the client.
+    def _resume_reading(self, client):
+        """Called by the handler executor once a paused client may be read again."""
+        if self.event_loop is not None:
+            self.event_loop.call_soon_threadsafe(self._unpause_reading, client)
+
+    def _unpause_reading(self, client):
+        connection = self._connections.get(client)
+        if connection is None or not connection.read_paused:
+            return
+        connection.read_paused = False
+        self._update_events(connection)
+        # Messages already buffered by the parser do not make the socket readable.
+        self._on_parsed(connection)
+
+    def send(self, client, data, data_type=None):
+        """Send data to the client. Strings are sent as TEXT messages and bytes, bytearray
+        or memoryview objects as BINARY messages.
 
         :param data: The data to send.
         :param client: The Client to send the data too.
-        :param data_type: The FrameType -- assumed to be a utf-8 encoded String if left out.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+        """
+        if data_type is None:
+            data_type = WebSocketServer._data_type(data)
+
+        connection = self._connections.get(client)
+        if connection is None:
+            self._send_buffers(client, WebSocketServer._encode_message_parts(None, data_type, data))
+            return
+
+        with connection.lock:
+            parts = WebSocketServer._encode_message_parts(connection.deflate, data_type, data)
+            self._send_buffers(client, parts)
+
+    def send_batch(self, client, messages, data_type=None, separator=None):
+        """Send several small messages as a single message, joined by a separator the client
+        splits them on. This saves the frame header of every message but the first and lets
+        permessage-deflate compress them together.
+
+        :param client: The Client to send the data too.
+        :param messages: A sequence of Strings, or of bytes-like objects.
+        :param data_type: The FrameType -- derived from the type of the messages if left out.
+        :param separator: Joins the messages, a newline if left out.
+        """
+        if not messages:
+            return
+        if separator is None:
+            separator = "\n" if isinstance(messages[0], str) else b"\n"
+        self.send(client, separator.join(messages), data_type)
+
+    def set_coalescing(self, client, delay, max_bytes=None):
+        """Hold the frames sent to a client for up to delay seconds, or until max_bytes are held,
+        and write them with a single system call. Many small messages then cost one write instead
+        of one each, for at most delay seconds of latency. Threaded clients need MSG_DONTWAIT, so
+        their frames are written at once where it is not available.
+
+        :param client: The Client to configure.
+        :param delay: The length of the coalescing window in seconds, None to write every frame at once.
+        :param max_bytes: The held bytes that end the window early, unchanged if left out.
+        """
+        connection = self._connections.get(client)
+        if connection is None:
+            return
+        with connection.write_lock:
+            connection.coalesce_delay = delay
+            if max_bytes is not None:
+                connection.coalesce_bytes = max_bytes
+
+    def set_tcp_options(self, client, nodelay=None, cork=None):
+        """Change the TCP options of a client, options left out are unchanged.
+
+        :param client: The Client to configure.
+        :param nodelay: True to send small segments at once (TCP_NODELAY), False to let Nagle's
+        algorithm hold them until earlier data is acknowledged.
+        :param cork: True to hold partial segments until the socket is uncorked (TCP_CORK, Linux
+        only), False to uncork and send what is held.
+        :raises OSError: If an option is not supported.
+        """
+        if nodelay is not None:
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
+        if cork is not None:
+            if not hasattr(socket, 'TCP_CORK'):
+                raise OSError(errno.ENOPROTOOPT, "TCP_CORK is not supported")
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(cork))
+
+    def send_stream(self, client, chunks, data_type=None):
+        """Send a message as a sequence of fragments so it never has to be held in memory at once.
+
+        :param client: The Client to send the data too.
+        :param chunks: An iterable of strings or bytes-like objects, each of which is sent as one fragment.
+        :param data_type: The FrameType of the message -- derived from the type of the first chunk if left out.
+        """
+        connection = self._connections[client]
+        with connection.lock:
+            frame_type = data_type
+            previous = None
+            for chunk in chunks:
+                if previous is not None:
+                    if frame_type is None:
+                        frame_type = WebSocketServer._data_type(previous)
+                    parts = WebSocketServer._encode_message_parts(connection.deflate, frame_type, previous, fin=False, stream=True)
+                    self._send_buffers(client, parts)
+                    frame_type = FrameType.CONTINUATION
+                previous = chunk
+
+            if previous is None:
+                previous = b''
+            if frame_type is None:
+                frame_type = WebSocketServer._data_type(previous)
+            parts = WebSocketServer._encode_message_parts(connection.deflate, frame_type, previous, stream=True)
+            self._send_buffers(client, parts)
+
+    def send_raw(self, client, data):
+        """Send bytes that are already formatted to the client without blocking on a slow client.
+        Whatever the socket does not accept immediately is added to the client's outbound queue,
+        which is flushed once the socket becomes writable.
+
+        The application is told to stop producing with on_pause_writing when more than
+        write_limit_high bytes are queued, and on_resume_writing once the queue drains below
+        write_limit_low. A client whose queue would exceed max_write_buffer, or which stays paused
+        for longer than slow_consumer_timeout, is a slow consumer: the data is dropped and the
+        client is disconnected unless slow_consumer_policy is 'drop'.
+
+        :param client: The Client to send the data too.
+        :param data: The bytes to send.
+        :raises WebSocketSlowConsumer: If the data was not queued because the client is too slow.
+        """
+        if isinstance(data, memoryview) and data.itemsize != 1:
+            data = data.cast('B')
+        self._send_buffers(client, (data,), frame=False)
+
+    def _send_buffers(self, client, buffers, frame=True):
+        """Send a frame made of several buffers, such as a header and an untouched payload, as
+        described in send_raw. The buffers are written together with sendmsg so the payload is
+        never copied into a frame.
+
+        :param client: The Client to send the data too.
+        :param buffers: A sequence of bytes-like objects, mutable ones are copied if they have to be queued.
+        :param frame: False if the buffers are not a frame built by the server, only their bytes are counted.
+        :raises WebSocketSlowConsumer: If the data was not queued because the client is too slow.
+        """
+        connection = self._connections.get(client)
+        if connection is None or (not connection.non_blocking and connection.tls_pending is None
+                                  and (not _MSG_DONTWAIT or not connection.scatter)):
+            for data in buffers:
+                client.sendall(data)
+            if connection is not None:
+                with connection.write_lock:
+                    connection.frames_out += frame
+                    connection.bytes_out += sum(map(len, buffers))
+                    connection.writes_out += len(buffers)
+            return
+
+        size = sum(map(len, buffers))
+        if connection.out_queue:
+            self._check_slow_consumer(connection, size)
+        flags = WebSocketServer._send_flags(connection)
+        pause = False
+        with connection.write_lock:
+            connection.frames_out += frame
+            connection.bytes_out += size
+            if connection.coalescing:
+                connection.enqueue(buffers)
+                if connection.out_bytes < connection.coalesce_bytes:
+                    return
+                # The byte budget is spent, the window ends early.
+                connection.coalescing = False
+                try:
+                    connection.flush_queue(flags)
+                except _WOULD_BLOCK:
+                    pass
+                if not connection.out_queue:
+                    return
+            elif not connection.out_queue:
+                if connection.coalesce_delay is not None and size < connection.coalesce_bytes:
+                    # Open a coalescing window, the frames sent until it ends are written together.
+                    connection.enqueue(buffers)
+                    connection.coalescing = True
+                    self._write_loop().call_at(time.monotonic() + connection.coalesce_delay, self._end_coalescing, connection)
+                    return
+                try:
+                    sent = connection.send_buffers(buffers, flags)
+                except _WOULD_BLOCK:
+                    sent = 0
+                if sent == size:
+                    return
+                connection.enqueue(buffers)
+                connection.consume(sent)
+            else:
+                connection.enqueue(buffers)
+            start = not connection.writing
+            connection.writing = True
+            if not connection.paused and self.write_limit_high is not None and connection.out_bytes > self.write_limit_high:
+                connection.paused = True
+                connection.paused_since = time.monotonic()
+                pause = True
+
+        if start:
+            self._start_writing(connection)
+        if pause:
+            logger.debug("%s PAUSED: %s %s bytes queued", LOG_OUT, connection.address, connection.out_bytes)
+            self.on_pause_writing(client)
+
+    @staticmethod
+    def _send_flags(connection):
+        """Returns the flags of the sends to a client that must not block. The sockets of event loop
+        and TLS clients are non-blocking, and SSLSocket does not accept flags, while the blocking
+        socket of a threaded client is written with MSG_DONTWAIT.
+        """
+        return 0 if connection.non_blocking or connection.tls_pending is not None else _MSG_DONTWAIT
+
+    def _end_coalescing(self, connection):
+        """Write the frames held during a coalescing window, run on the thread of the write loop.
+        Whatever the socket does not accept is flushed once it becomes writable.
+
+        :param connection: The Connection whose window has ended.
         """
-        data = WebSocketServer._encode_data_frame(data_type, data)
-        client.send(data)
+        with connection.write_lock:
+            if not connection.coalescing:
+                return
+            connection.coalescing = False
+            connection.writing = True
+        self._flush(connection)
+        with connection.write_lock:
+            self._watch_writable(connection, True)
+
+    def _check_slow_consumer(self, connection, size):
+        """Apply the slow consumer policy if the client can not take size more bytes.
+
+        :param connection: The Connection that is about to queue size bytes.
+        :param size: The number of bytes to queue.
+        :raises WebSocketSlowConsumer: If the client is a slow consumer.
+        """
+        full = self.max_write_buffer is not None and connection.out_bytes + size > self.max_write_buffer
+        stalled = (self.slow_consumer_timeout is not None and connection.paused
+                   and time.monotonic() - connection.paused_since > self.slow_consumer_timeout)
+        if not full and not stalled:
+            return
+
+        logger.warning("%s SLOW CONSUMER: %s %s bytes queued", LOG_OUT, connection.address, connection.out_bytes)
+        if self.slow_consumer_policy == 'disconnect':
+            self.close_client(connection.address, hard_close=True)
+            raise WebSocketSlowConsumer("Client disconnected, {} bytes queued".format(connection.out_bytes), connection.client)
+        raise WebSocketSlowConsumer("Message dropped, {} bytes queued".format(connection.out_bytes), connection.client)
 
     def send_all(self, client, data, echo=False):
         """Send a string of data to all clients.
 
-        :param data: A string of data formatted as ASCII
+        :param data: A String or a bytes-like object
         :param client: The client initiating the data transfer.
         :param echo: A boolean that indicates whether 'client' 
         should receive an echo of the message they are initiating.
         """
-        for endpoint in self.clients.values():
-            if endpoint != client or echo:
-                self.send(endpoint, data)
+        self.broadcast(data, exclude=None if echo else client)
+
+    def broadcast(self, data, clients=None, exclude=None, data_type=None, executor=None, local=False):
+        """Send the same message to many clients. The data frame is built once and the same
+        immutable buffer is written to every socket. Only clients that compress their messages
+        with a context of their own get a frame of their own. When the server runs in a
+        WorkerPool, messages to every client are also published to the other workers.
+
+        :param data: A String or a bytes-like object.
+        :param clients: The clients to send the message to, every connected client if left out.
+        :param exclude: A client that should not receive the message.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+        :param executor: An optional concurrent.futures.Executor used to write to the sockets
+        concurrently. In event loop mode the writes are always made on the event loop thread.
+        :param local: If True only the clients of this process receive the message.
+
+        :returns: A dictionary of client to the exception raised while sending to it, empty
+        if every send succeeded.
+        """
+        if self.event_loop is not None and self.event_loop.running and not self.event_loop.in_loop_thread():
+            return self.event_loop.run_in_loop(self.broadcast, data, clients, exclude, data_type, None, local)
+
+        if data_type is None:
+            data_type = WebSocketServer._data_type(data)
+        if isinstance(data, str):
+            data = data.encode()
+        if clients is None:
+            clients = self._connections.clients()
+            if self.channel is not None and not local:
+                self.channel.publish(data, data_type)
+
+        frames = {}     # Shared frames by compression settings.
+        failures = {}
+
+        def send(endpoint):
+            connection = self._connections.get(endpoint)
+            if connection is None:
+                self._send_buffers(endpoint, WebSocketServer._shared_frame(frames, None, data_type, data))
+                return
+            with connection.lock:
+                parts = WebSocketServer._shared_frame(frames, connection.deflate, data_type, data)
+                if parts is None:
+                    parts = WebSocketServer._encode_message_parts(connection.deflate, data_type, data)
+                self._send_buffers(endpoint, parts)
+
+        if executor is None:
+            for endpoint in clients:
+                if endpoint is exclude:
+                    continue
+                try:
+                    send(endpoint)
+                except Exception as exc:
+                    failures[endpoint] = exc
+        else:
+            futures = {endpoint: executor.submit(send, endpoint) for endpoint in clients if endpoint is not exclude}
+            for endpoint, future in futures.items():
+                exc = future.exception()
+                if exc is not None:
+                    failures[endpoint] = exc
+
+        for endpoint, exc in failures.items():
+            logger.warning("Broadcast to %s failed: %s", endpoint, exc)
+        return failures
+
+    def subscribe(self, client, topic):
+        """Subscribe a client to a topic, also known as a room or channel.
+
+        :param client: The Client to subscribe.
+        :param topic: The name of the topic as a String.
+        """
+        self.topics.subscribe(client, topic)
+
+    def unsubscribe(self, client, topic=None):
+        """Unsubscribe a client from a topic.
+
+        :param client: The Client to unsubscribe.
+        :param topic: The name of the topic, every topic of the client if left out.
+        """
+        if topic is None:
+            self.topics.remove(client)
+        else:
+            self.topics.unsubscribe(client, topic)
+
+    def publish(self, topic, data, data_type=None, exclude=None, local=False):
+        """Send a message to the subscribers of a topic. Only the subscribers are visited, and
+        the message is also published on the backplane to reach the subscribers of other servers.
+
+        :param topic: The name of the topic as a String.
+        :param data: A String or a bytes-like object.
+        :param data_type: The FrameType -- derived from the type of data if left out.
+        :param exclude: A client that should not receive the message, such as its sender.
+        :param local: If True only the subscribers held by this server receive the message.
+
+        :returns: A dictionary of client to the exception raised while sending to it, empty
+        if every send succeeded.
+        """
+        if data_type is None:
+            data_type = WebSocketServer._data_type(data)
+        if isinstance(data, str):
+            data = data.encode()
+        if self.backplane is not None and not local:
+            self.backplane.publish(self, topic, data, data_type)
+
+        subscribers = self.topics.subscribers(topic)
+        if not subscribers:
+            return {}
+        return self.broadcast(data, clients=subscribers, exclude=exclude, data_type=data_type)
+
+    @staticmethod
+    def _shared_frame(frames, deflate, data_type, data):
+        """Returns the frame shared by every connection with the same compression settings. Every
+        connection writes the same header and payload buffers.
+
+        :param frames: A dictionary caching the frames built for one message.
+        :param deflate: The DeflateContext of the connection or None.
+        :param data_type: The FrameType of the message.
+        :param data: The payload as bytes.
+
+        :returns: The shared frame as a tuple of header and payload, or None if the connection
+        compresses with a context of its own and needs a frame of its own.
+        """
+        if deflate is None or not deflate.should_compress(data):
+            key = None
+        elif deflate.server_no_context_takeover:
+            key = (deflate.server_window_bits, deflate.compress_level, deflate.mem_level)
+        else:
+            return None
+
+        frame = frames.get(key)
+        if frame is None:
+            frame = frames[key] = WebSocketServer._encode_message_parts(deflate, data_type, data)
+        return frame
 
     def _opening_handshake(self, client, data):
         """Derives handshake response to a client upgrade request.
 
         :param client: The client to complete the handshake with.
-        :param data: The raw data included in the upgrade request -- assumes
-        the input data is encoded in a utf-8 format.
+        :param data: The parsed HttpRequest, or the raw bytes of the whole upgrade request.
 
         :returns (valid, response): A tuple containing a boolean flag 
         indicating if the request was valid, and a String containing
         the handshake response (encoded in utf-8 format) or None if 
         the upgrade request was invalid.
         """
-        resp = (False, None)
-        tokens = data.decode().split("\r\n")
+        valid, response, deflate = handshake_response(data, self._accept, self.permessage_deflate)
+        connection = self._connections.get(client)
+        if connection is not None:
+            connection.set_deflate(deflate)
+        if valid:
+            self.metrics.increment('handshakes')
+            if connection is not None:
+                self.metrics.observe('handshake_seconds', time.monotonic() - connection.opened)
+        else:
+            self.metrics.increment('handshake_failures')
+        return (valid, response)
 
-        upgrade_set = ["Upgrade: WebSocket", "Upgrade: websocket", "upgrade: websocket"]
-        label_set = ["Sec-WebSocket-Key", "sec-websocket-key"]
-        if not bool(set(upgrade_set).intersection(tokens)):
-            return resp
+    @staticmethod
+    def _accept_key(sec_key):
+        """Derives the Sec-WebSocket-Accept value from the client's Sec-WebSocket-Key.
 
-        for token in tokens[1:]:
-            label, value = token.split(": ", 1)
-            if label in label_set:
-                digest = WebSocketServer._digest(value)
-                resp = (True, (WebSocketServer._HANDKSHAKE_RESP %
-                               (digest)).encode())
-                break
+        :param sec_key: A String representing the Sec-Key provided in an upgrade request.
 
-        return resp
+        :returns: The Sec-Accept key as bytes.
+        :raises UnicodeEncodeError: If the key is not ASCII.
+        """
+        return base64.b64encode(hashlib.sha1(sec_key.encode("ascii") + WebSocketServer._SEC_KEY_BYTES).digest())
 
     @staticmethod
     def _digest(sec_key):
@@ -214,8 +1367,7 @@ class WebSocketServer:
 
         :returns: A utf-8 encoding of the Sec-Accept key.
         """
-        raw = sec_key + WebSocketServer._SEC_KEY
-        return base64.b64encode(hashlib.sha1(raw.encode("ascii")).digest()).decode("utf-8")
+        return WebSocketServer._accept_key(sec_key).decode("utf-8")
 
     @staticmethod
     def _decode_data_frame(data):
@@ -226,74 +1378,92 @@ class WebSocketServer:
         :returns: A tuple of (FrameType, String) where the FrameType will be None
         if the data could not be understood.
         """
-        fin = (data[FIN[LOW]]&FIN[BIT_MASK])>>FIN[OFFSET]
-        opcode = (data[OPCODE[LOW]]&OPCODE[BIT_MASK])>>OPCODE[OFFSET]
+        parser = FrameParser()
+        parser.feed(data)
+        frame = parser.next_frame()
+        if frame is None:
+            return (None, None)
+        return WebSocketServer._frame_message(frame.opcode, frame.payload)
+
+    @staticmethod
+    def _frame_message(opcode, payload):
+        """Converts a complete message into the data handed to the application.
+
+        :param opcode: The opcode of the message.
+        :param payload: The bytes-like payload of the message.
+
+        :returns: A tuple of (FrameType, data) where the FrameType will be None if the
+        opcode is not valid. TEXT payloads are decoded to a String and BINARY payloads are
+        returned as a memoryview without being copied.
+        """
+        frame_type = OPCODES[opcode] if 0 <= opcode < len(OPCODES) else None
+        if frame_type is None:
+            return (None, None)
 
-        # Check that the payload is valid.
-        frame_type = [f_type for f_type in FrameType if opcode == f_type]
-        if not frame_type:
+        if frame_type == FrameType.BINARY:
+            return (frame_type, memoryview(payload))
+        if frame_type != FrameType.TEXT:
+            return (frame_type, bytes(payload))
+        try:
+            return (frame_type, str(payload, 'utf-8'))
+        except UnicodeDecodeError:
             return (None, None)
-        else:
-            frame_type = frame_type[0]
-
-        mask_key_low = PAYLOAD_LEN[HIGH]+1
-        payload_len = (data[PAYLOAD_LEN[LOW]]&PAYLOAD_LEN[BIT_MASK])>>PAYLOAD_LEN[OFFSET]
-        if payload_len == 126:
-            # Read the next 16 bits.
-            mask_key_low = PAYLOAD_LEN_EXT_126[HIGH]+1
-            payload_len = int.from_bytes(data[PAYLOAD_LEN_EXT_126[LOW] : PAYLOAD_LEN_EXT_126[HIGH]+1],'big')
-        elif payload_len == 127:
-            # Read the next 64 bits.
-            mask_key_low = PAYLOAD_LEN_EXT_127[HIGH]+1
-            payload_len = int.from_bytes(data[PAYLOAD_LEN_EXT_127[LOW] : PAYLOAD_LEN_EXT_127[HIGH]+1],'big')
-
-        mask = (data[MASK[LOW]]&MASK[BIT_MASK])>>MASK[OFFSET]
-        mask_key_high = mask_key_low + MASK_KEY[LEN] if mask else mask_key_low
-        mask_key = payload = None
-
-        if mask:  # Need to unmask the payload data.
-            mask_key = data[mask_key_low: mask_key_high]
-            encrypted = data[mask_key_high: mask_key_high+payload_len]
-            payload = bytearray(encrypted[i]^mask_key[i%4] for i in range(len(encrypted)))
-        else:
-            payload = data[mask_key_high: mask_key_high+payload_len]
 
-        return (frame_type, bytes(payload).decode() if frame_type != FrameType.CLOSE else None)
+    @staticmethod
+    def _data_type(data):
+        """Returns the FrameType used to send data: TEXT for Strings and BINARY otherwise."""
+        return FrameType.TEXT if isinstance(data, str) else FrameType.BINARY
 
     @staticmethod
-    def _encode_data_frame(frame_type, data):
-        """Formats data into a data frame as per RFC 6455.
+    def _encode_message_parts(deflate, frame_type, data, fin=True, stream=False):
+        """Formats a data frame, compressing the payload if permessage-deflate was negotiated. The
+        header and the payload are returned separately so the payload can be written without being
+        copied into the frame.
 
+        :param deflate: The DeflateContext of the connection or None.
         :param frame_type: FrameType indicating the type of data being sent.
         :param data: The data to be formatted.
+        :param fin: False if more fragments of the message will follow.
+        :param stream: True if the frame is a fragment sent by send_stream, fragments are always
+        compressed since the size of the whole message is not known.
 
-        :returns: The formatted data frame.
+        :returns: A tuple of (header, payload).
         """
-        data = data.encode() if data else None
+        data = WebSocketServer._payload(data)
+        rsv1 = False
+        if deflate is not None and frame_type in (FrameType.TEXT, FrameType.BINARY, FrameType.CONTINUATION):
+            if stream or deflate.should_compress(data):
+                data = deflate.compress(data, final=fin)
+                rsv1 = frame_type != FrameType.CONTINUATION
+        return (pack_header(frame_type, len(data), fin, rsv1), data)
 
-        fin = 1  # No fragmentation support yet.
-        mask = 0  # Server never masks data.
-        opcode = frame_type.value
+    @staticmethod
+    def _encode_data_frame(frame_type, data, fin=True, rsv1=False):
+        """Formats data into a data frame as per RFC 6455.
 
-        # Create the data frame one byte at a time.
-        frame = bytearray()
-        frame.append((fin<<FIN[OFFSET])^opcode)
+        :param frame_type: FrameType indicating the type of data being sent.
+        :param data: The data to be formatted, a String is encoded as utf-8 while bytes-like
+        objects are used as they are.
+        :param fin: False if more fragments of the message will follow.
+        :param rsv1: True if the payload has been compressed with permessage-deflate.
 
-        payload_len = len(data) if data else 0
-        if payload_len < 126:
-            frame.append((mask<<MASK[OFFSET])^payload_len)
-        elif payload_len < 65535 : # Can the length fit in 16 bits?
-            frame.append((mask<<MASK[OFFSET])^126)
-            for i in range(PAYLOAD_LEN_EXT_126[LEN]-1,-1,-1):
-                frame.append((payload_len>>(i*8))&255)
-        else:
-            frame.append((mask<<MASK[OFFSET])^127)
-            for i in range(PAYLOAD_LEN_EXT_127[LEN]-1,-1,-1):
-                frame.append((payload_len>>(i*8))&255)
-        
-        if payload_len > 0:
-            frame.extend(data)    
-        return bytes(frame)
+        :returns: The formatted data frame.
+        """
+        data = WebSocketServer._payload(data)
+        frame = bytearray(pack_header(frame_type, len(data), fin, rsv1))
+        frame += data
+        return frame
+
+    @staticmethod
+    def _payload(data):
+        """Returns data as a bytes-like object with one byte per item, a String is encoded as utf-8."""
+        if data is None:
+            return b''
+        if isinstance(data, str):
+            return data.encode()
+        if isinstance(data, memoryview) and data.itemsize != 1:
+            return data.cast('B')   # Count bytes rather than items.
+        return data
 
     def _initiate_close(self, client, status_code=None, app_data=None):
         """Sends the first Closing frame to the client.
@@ -305,23 +1475,13 @@ class WebSocketServer:
         # Concatenate the status_code and app_data into one byte string if provided.
         payload_bytes = []
         if status_code is not None:
-            status_bytes = bytearray([status_code & 255, (status_code >> 8) & 255])
-            payload_bytes.append(bytes(status_bytes))
+            payload_bytes.append(int(status_code).to_bytes(2, 'big'))
 
         if app_data is not None:
             payload_bytes.append(app_data.encode())
 
         self.send(client, b''.join(payload_bytes) if len(payload_bytes) > 0 else None, FrameType.CLOSE)
 
-    def _respond_to_close(self, client):
-        """Acknowledge the closing of a client connection -- for now, just send an empty
-        close frame (i.e. same as initiating a close frame with no app_data). Later, this
-        will be updated to echo the status_code from the client's close frame.
-
-        :param client: The Client who requested the connection close.
-        """
-        self._initiate_close(client)
-
     def close_client(self, address, status_code=None, app_data=None, hard_close=False):
         """Close the connection with a client.
 
@@ -330,11 +1490,167 @@ class WebSocketServer:
         :param app_data: A utf-8 encoded String to include with the close frame.
         :param hard_close: A boolean which indicates whether the client needs to be closed hard or soft.
         """
-        self.on_connection_close(self.clients[address])
-        if not hard_close:
-            self._initiate_close(self.clients[address], status_code=status_code, app_data=app_data)
-        self.clients[address].close()
+        client = self.clients.get(address)
+        if client is None:
+            # The connection has already been closed, possibly by another thread.
+            return
+        connection = self._connections.get(client)
+        if connection is None or not connection.rejected:
+            try:
+                self.on_connection_close(client)
+            except Exception:
+                logger.exception("on_connection_close of %s failed", address)
+        try:
+            if not hard_close and (connection is None or not connection.close_sent):
+                try:
+                    self._initiate_close(client, status_code=status_code, app_data=app_data)
+                except (OSError, WebSocketSlowConsumer):
+                    pass
+
+            self.topics.remove(client)
+            connection = self._connections.get(client)
+            if connection is not None:
+                self.metrics.retire(connection, CloseStatus.ABNORMAL if hard_close else status_code or CloseStatus.NORMAL)
+        finally:
+            self._release(client, address, hard_close)
+        if self._drain_timer is not None and not self._connections:
+            self._finish_drain()
+
+    def _release(self, client, address, hard_close):
+        """Forget a client and close its socket, the part of close_client that must always run.
+
+        :param client: The Client being closed.
+        :param address: The address of the client.
+        :param hard_close: If False the queued output is flushed first, as far as the socket allows.
+        """
+        connection = self._connections.pop(client, None)
+        if connection is not None:
+            if self.admission is not None:
+                self.admission.release(address[0])
+            with connection.write_lock:
+                if connection.out_queue and not hard_close:
+                    # Best effort attempt to write the queued output before releasing the socket.
+                    try:
+                        connection.flush_queue(WebSocketServer._send_flags(connection))
+                    except OSError:
+                        pass
+                connection.out_queue.clear()
+                connection.out_bytes = 0
+                connection.state = ConnectionState.CLOSED
+                if connection.keepalive is not None:
+                    connection.keepalive.cancel()
+                if connection.non_blocking:
+                    self.event_loop.unregister(client)
+                elif connection.writing and self._writer_loop is not None:
+                    self._writer_loop.unregister(client)
+
         self.clients.pop(address, None)
+        try:
+            # Wakes up a thread blocked reading from the client, which close alone does not.
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        client.close()
+
+    def drain(self, status_code=CloseStatus.GOING_AWAY, app_data=None, window=0.0, timeout=10.0, stop=True):
+        """Close every client gracefully, for example before a restart. The server stops accepting
+        and sends each client a CLOSE frame, spread evenly over window seconds so the clients do
+        not all reconnect at once. A client is disconnected once it acknowledges the close, and the
+        clients still connected timeout seconds after the end of the window are dropped. drained
+        is set once every client is gone.
+
+        :param status_code: The status code of the CLOSE frames.
+        :param app_data: A utf-8 encoded String to include with the CLOSE frames.
+        :param window: Seconds over which the CLOSE frames are spread, 0 to send them all at once.
+        :param timeout: Seconds to wait for the acknowledgements after the last CLOSE frame.
+        :param stop: If True the server is closed as by close_server once the drain is complete.
+        """
+        if self.event_loop is not None and self.event_loop.running and not self.event_loop.in_loop_thread():
+            # The clients are owned by the event loop thread.
+            self.event_loop.run_in_loop(self.drain, status_code, app_data, window, timeout, stop)
+            return
+        if self.draining:
+            return
+        self.draining = True
+        self._drain_stop = stop
+        if self.event_loop is not None:
+            self.event_loop.unregister(self.server)
+
+        connections = self._connections.snapshot()
+        logger.info("Draining %d clients over %.1f seconds", len(connections), window)
+        self._drain_timer = self._call_later(window + timeout, self._finish_drain)
+        step = window / len(connections) if connections else 0.0
+        for index, connection in enumerate(connections):
+            if index and step:
+                self._call_later(index * step, self._drain_client, connection, status_code, app_data)
+            else:
+                self._drain_client(connection, status_code, app_data)
+        if not self._connections:
+            self._finish_drain()
+
+    def _drain_client(self, connection, status_code, app_data):
+        """Send the CLOSE frame of a drain to a client, which stays connected until it answers.
+        Clients that are still in their opening handshake are dropped.
+        """
+        if connection.state == ConnectionState.CLOSED:
+            return
+        if connection.state == ConnectionState.HANDSHAKE:
+            connection.rejected = True
+            self.close_client(connection.address, hard_close=True)
+            return
+        connection.close_sent = True
+        try:
+            self._initiate_close(connection.client, status_code=status_code, app_data=app_data)
+        except (OSError, WebSocketSlowConsumer):
+            self.close_client(connection.address, hard_close=True)
+
+    def _finish_drain(self):
+        """Drop the clients that have not acknowledged their CLOSE frame in time, or complete a
+        drain once every client is gone.
+        """
+        with self._writer_lock:
+            timer, self._drain_timer = self._drain_timer, None
+        if timer is None:
+            return
+        timer.cancel()
+        remaining = self._connections.snapshot()
+        if remaining:
+            logger.warning("Dropping %d clients that did not complete the close", len(remaining))
+        for connection in remaining:
+            self.close_client(connection.address, hard_close=True)
+        logger.info("Drain complete")
+        if self._drain_stop:
+            self.close_server()
+        self.drained.set()
+
+    def enable_handoff(self, path, **drain_options):
+        """Offer the listening socket to the process replacing this one, which receives it with
+        Handoff.receive_listener(path). Once the socket has been handed over the server drains.
+
+        :param path: The path of the Unix socket on which the listening socket is offered.
+        :param drain_options: Keyword arguments of drain, such as window.
+        """
+        sock = Handoff.listen(path)
+        handoff_thread = threading.Thread(target=self._serve_handoff, args=(sock, path, drain_options), name="WebSocketHandoff", daemon=True)
+        handoff_thread.start()
+
+    def _serve_handoff(self, sock, path, drain_options):
+        """Body of the handoff thread, hands the listening socket to the first process that asks."""
+        try:
+            with sock:
+                peer, _ = sock.accept()
+                with peer:
+                    Handoff.send_listener(peer, self.server)
+        except OSError as exc:
+            logger.error("Handing off the listening socket failed: %s", exc)
+            return
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        logger.info("Listening socket handed off")
+        self.drain(**drain_options)
 
     def close_server(self, status_code=None, app_data=None):
         """Close the connection with each client and then close the underlying tcp socket of the server.
@@ -342,13 +1658,103 @@ class WebSocketServer:
         :param status_code: A 16 bit optional status code to send to all of the clients.
         :param app_data: A utf-8 encoded String to include with the close frame.
         """
+        if self.event_loop is not None and self.event_loop.running and not self.event_loop.in_loop_thread():
+            # The clients are owned by the event loop thread.
+            self.event_loop.run_in_loop(self.close_server, status_code, app_data)
+            return
 
-        for address in list(self.clients.keys()):
-            self.close_client(address, status_code=status_code, app_data=app_data)
+        for connection in self._connections.snapshot():
+            self.close_client(connection.address, status_code=status_code, app_data=app_data)
 
         self.on_server_destruct()
-        self.server.close()
+        if self.event_loop is not None:
+            self.event_loop.unregister(self.server)
         self.alive = False
+        self.server.close()
+        if self.event_loop is not None:
+            self.event_loop.stop()
+        if self._writer_loop is not None:
+            self._writer_loop.stop()
+        if self.backplane is not None:
+            self.backplane.detach(self)
+        if self._metrics_endpoint is not None:
+            self._metrics_endpoint.shutdown()
+            self._metrics_endpoint.server_close()
+            self._metrics_endpoint = None
+        if self._log_file is not None:
+            self._log_file.stop()
+            self._log_file = None
+
+    def stats(self, client=None):
+        """Returns the metrics of the server, or of one client.
+
+        :param client: The Client to describe, the whole server if left out.
+
+        :returns: For the server, the dictionary of Metrics.snapshot. For a client, a dictionary of
+        its counters, the number of seconds it has been connected and the round trip time of its
+        last keepalive PING, or None if it is not connected.
+        """
+        if client is None:
+            return self.metrics.snapshot()
+        connection = self._connections.get(client)
+        if connection is None:
+            return None
+        return {
+            'frames_in': connection.frames_in,
+            'messages_in': connection.messages_in,
+            'bytes_in': connection.bytes_in,
+            'frames_out': connection.frames_out,
+            'bytes_out': connection.bytes_out,
+            'writes_out': connection.writes_out,
+            'age': time.monotonic() - connection.opened,
+            'rtt': connection.rtt,
+            'tls': Tls.describe(connection.client) if isinstance(connection.client, ssl.SSLSocket) else None,
+        }
+
+    def client_id(self, client):
+        """Returns the id of a client, an integer that is never reused by the server, or None if
+        the client is not connected.
+        """
+        connection = self._connections.get(client)
+        return connection.id if connection is not None else None
+
+    def get_client(self, client_id):
+        """Returns the client with an id, or None if it is no longer connected."""
+        connection = self._connections.by_id(client_id)
+        return connection.client if connection is not None else None
+
+    def tag(self, client, name, value):
+        """Index a client under a name and value, such as ('user', 42), so the clients of a user
+        can be found with tagged without visiting every client. The tags of a client are removed
+        when it is closed.
+
+        :param client: The Client to tag.
+        :param name: The name of the index as a String.
+        :param value: A hashable value, a client has one value per name.
+        """
+        self._connections.tag(client, name, value)
+
+    def untag(self, client, name):
+        """Remove a client from an index.
+
+        :param client: The Client to untag.
+        :param name: The name of the index.
+        """
+        self._connections.untag(client, name)
+
+    def tagged(self, name, value):
+        """Returns a list of the clients tagged with a name and value, which can be passed to broadcast."""
+        return self._connections.tagged(name, value)
+
+    def request(self, client):
+        """Returns the upgrade request of a client, to look at its path, query or header fields.
+
+        :param client: The Client that sent the request.
+
+        :returns: The HttpRequest, or None if the client is not connected or its handshake is not complete.
+        """
+        connection = self._connections.get(client)
+        return connection.request if connection is not None else None
 
     def ping(self, client):
         """Send a Ping frame.
@@ -361,4 +1767,11 @@ class WebSocketServer:
 
         :param client: The Client who send the Ping.
         """
-        self.send(client, data, FrameType.PONG)
+        try:
+            self.send(client, data, FrameType.PONG)
+        except (OSError, WebSocketSlowConsumer):
+            # A client flooding PINGs without reading the PONGs is evicted, whatever the slow
+            # consumer policy, rather than raising into the code reading its frames.
+            connection = self._connections.get(client)
+            if connection is not None:
+                self.close_client(connection.address, hard_close=True)
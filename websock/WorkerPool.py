@@ -0,0 +1,381 @@
+""" Pre-fork multi-process mode.
+
+A WorkerPool forks several worker processes which each bind their own listening socket to
+the same port with SO_REUSEPORT and run their own event loop, so the kernel spreads the
+connections over every core instead of one process being limited by the GIL. A supervisor
+restarts workers that die and drains them on shutdown.
+
+Each worker only holds its own clients. Messages sent to every client with send_all or
+broadcast are published on a BroadcastChannel which delivers them to the other workers.
+"""
+import functools
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import struct
+import threading
+import time
+from .DataFrameFormat import FrameType, CloseStatus
+from .EventLoop import EventLoop
+from .Log import logger
+
+_MESSAGE_HEADER = struct.Struct('!IB')  # Payload length and FrameType of a published message.
+
+
+def _split_messages(buffer):
+    """Remove the complete published messages from the front of a buffer.
+
+    :param buffer: A bytearray of received bytes.
+
+    :returns: A list of (FrameType, payload) tuples.
+    """
+    messages = []
+    pos = 0
+    while len(buffer) - pos >= _MESSAGE_HEADER.size:
+        size, data_type = _MESSAGE_HEADER.unpack_from(buffer, pos)
+        end = pos + _MESSAGE_HEADER.size + size
+        if len(buffer) < end:
+            break
+        messages.append((FrameType(data_type), bytes(buffer[pos+_MESSAGE_HEADER.size:end])))
+        pos = end
+    del buffer[:pos]
+    return messages
+
+
+class BroadcastChannel:
+    """Carries the messages sent to every client between the workers of a WorkerPool.
+
+    prepare, started and worker_exited are called in the supervisor, attach and publish in
+    the worker processes. The worker_id of the process is set before attach is called.
+    """
+
+    worker_id = None
+
+    def prepare(self, worker_id, loop):
+        """Called in the supervisor before a worker is started.
+
+        :param worker_id: The index of the worker.
+        :param loop: The EventLoop of the supervisor.
+        """
+        pass
+
+    def started(self, worker_id):
+        """Called in the supervisor once the worker process has been forked."""
+        pass
+
+    def worker_exited(self, worker_id):
+        """Called in the supervisor once a worker process has exited."""
+        pass
+
+    def attach(self, server):
+        """Called in the worker once the event loop of its server has been created. Messages
+        published by the other workers are passed to server.broadcast with local=True.
+
+        :param server: The WebSocketServer of the worker.
+        """
+        raise NotImplementedError
+
+    def publish(self, data, data_type):
+        """Called in a worker to deliver a message to the clients of every other worker.
+
+        :param data: The payload as bytes.
+        :param data_type: The FrameType of the message.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources of the channel."""
+        pass
+
+
+class UnixSocketChannel(BroadcastChannel):
+    """The default BroadcastChannel. Each worker is connected to the supervisor with a Unix
+    socket pair and the supervisor relays every published message to the other workers.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._hubs = {}         # Supervisor side socket of each worker.
+        self._in = {}           # Bytes received from each worker that do not form a whole message yet.
+        self._out = {}          # Bytes waiting for the socket of each worker to become writable.
+        self._writing = set()   # Workers whose socket is watched for writability.
+        self._ends = {}         # Worker side sockets not handed over to their process yet.
+        self._sock = None       # The worker side socket, in a worker.
+        self._buffer = bytearray()
+        self._server = None
+
+    def prepare(self, worker_id, loop):
+        hub, end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        hub.setblocking(False)
+        self._loop = loop
+        self._hubs[worker_id] = hub
+        self._in[worker_id] = bytearray()
+        self._out[worker_id] = bytearray()
+        self._ends[worker_id] = end
+        loop.register(hub, selectors.EVENT_READ, functools.partial(self._on_hub_event, worker_id))
+
+    def started(self, worker_id):
+        self._ends.pop(worker_id).close()
+
+    def worker_exited(self, worker_id):
+        hub = self._hubs.pop(worker_id, None)
+        if hub is not None:
+            self._loop.unregister(hub)
+            hub.close()
+        self._in.pop(worker_id, None)
+        self._out.pop(worker_id, None)
+        self._writing.discard(worker_id)
+
+    def _on_hub_event(self, worker_id, mask):
+        """Relay the messages of a worker to the others and flush its pending output."""
+        hub = self._hubs.get(worker_id)
+        if hub is None:
+            return
+        if mask & selectors.EVENT_WRITE:
+            self._write(worker_id, b'')
+        if not mask & selectors.EVENT_READ:
+            return
+
+        try:
+            data = hub.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            # The worker exited, its process sentinel takes care of restarting it.
+            self.worker_exited(worker_id)
+            return
+
+        buffer = self._in[worker_id]
+        buffer.extend(data)
+        pos = 0
+        while len(buffer) - pos >= _MESSAGE_HEADER.size:
+            end = pos + _MESSAGE_HEADER.size + _MESSAGE_HEADER.unpack_from(buffer, pos)[0]
+            if len(buffer) < end:
+                break
+            pos = end
+        if pos:
+            messages = bytes(buffer[:pos])
+            del buffer[:pos]
+            for other in list(self._hubs):
+                if other != worker_id:
+                    self._write(other, messages)
+
+    def _write(self, worker_id, data):
+        """Write to a worker without blocking the supervisor, buffering what is not accepted."""
+        hub = self._hubs[worker_id]
+        out = self._out[worker_id]
+        out.extend(data)
+        try:
+            sent = hub.send(out) if out else 0
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            return
+        del out[:sent]
+        if bool(out) == (worker_id in self._writing):
+            return
+        if out:
+            self._writing.add(worker_id)
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE
+        else:
+            self._writing.discard(worker_id)
+            events = selectors.EVENT_READ
+        self._loop.modify(hub, events, functools.partial(self._on_hub_event, worker_id))
+
+    def attach(self, server):
+        # Sockets inherited from the supervisor that belong to other workers.
+        for hub in self._hubs.values():
+            hub.close()
+        self._hubs.clear()
+        self._server = server
+        self._sock = self._ends.pop(self.worker_id)
+        server.event_loop.register(self._sock, selectors.EVENT_READ, self._on_readable)
+
+    def _on_readable(self, mask):
+        """Broadcast the messages relayed by the supervisor to the clients of this worker."""
+        try:
+            data = self._sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            logger.warning("Lost the broadcast channel of worker %s", self.worker_id)
+            self._server.event_loop.unregister(self._sock)
+            return
+
+        self._buffer.extend(data)
+        for data_type, payload in _split_messages(self._buffer):
+            self._server.broadcast(payload, data_type=data_type, local=True)
+
+    def publish(self, data, data_type):
+        if self._sock is None:
+            return
+        try:
+            self._sock.sendall(_MESSAGE_HEADER.pack(len(data), data_type) + bytes(data))
+        except OSError as exc:
+            logger.warning("Worker %s failed to publish: %s", self.worker_id, exc)
+
+    def close(self):
+        for worker_id in list(self._hubs):
+            self.worker_exited(worker_id)
+        for end in self._ends.values():
+            end.close()
+        self._ends.clear()
+        if self._sock is not None:
+            self._sock.close()
+
+
+class WorkerPool:
+    """Runs a WebSocketServer in several pre-forked worker processes.
+
+        server = WebSocketServer("0.0.0.0", 8467, on_data_receive=on_data_receive)
+        WorkerPool(server, workers=4).serve_forever()
+
+    Every worker runs the server's event loop mode. The callbacks are run in the worker
+    that owns the client, so state kept in the callbacks is per worker.
+    """
+
+    def __init__(self, server, workers=None, channel=None, restart_delay=1.0, drain_timeout=10.0,
+                 close_status=CloseStatus.GOING_AWAY, close_timeout=5.0):
+        """
+        :param server: The WebSocketServer to run, it must not be serving yet.
+        :param workers: The number of worker processes, the number of CPUs if left out.
+        :param channel: The BroadcastChannel between the workers, a UnixSocketChannel if left out.
+        :param restart_delay: The least number of seconds between two starts of the same worker,
+        which keeps a worker that crashes on start up from being restarted in a tight loop.
+        :param drain_timeout: The number of seconds workers get to close their clients on shutdown
+        before they are killed.
+        :param close_status: The status code of the close frames sent to the clients on shutdown.
+        :param close_timeout: The number of seconds a worker waits for its clients to acknowledge
+        the close frames before dropping them, it should be less than drain_timeout.
+        """
+        self.server = server
+        self.workers = workers or os.cpu_count() or 1
+        self.channel = channel if channel is not None else UnixSocketChannel()
+        self.restart_delay = restart_delay
+        self.drain_timeout = drain_timeout
+        self.close_status = close_status
+        self.close_timeout = close_timeout
+        self.processes = {}     # Dictionary of worker id to the running Process.
+        self.running = False
+        self._loop = None
+        self._started = {}      # Time at which each worker was last started.
+        self._restarts = {}     # Time at which each exited worker is restarted.
+        self._context = multiprocessing.get_context('fork')
+
+    def serve_forever(self):
+        """Start the workers and supervise them until stop is called or the supervisor
+        receives SIGINT or SIGTERM, then drain the workers.
+        """
+        self._loop = EventLoop()
+        self.running = True
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                handlers[signum] = signal.signal(signum, self._on_signal)
+        try:
+            for worker_id in range(self.workers):
+                self._start(worker_id)
+            logger.info("Supervising %s workers", self.workers)
+            while self.running:
+                self._loop.run_once(self._next_restart())
+                now = time.monotonic()
+                for worker_id, due in list(self._restarts.items()):
+                    if due <= now and self.running:
+                        del self._restarts[worker_id]
+                        self._start(worker_id)
+        finally:
+            self._drain()
+            self.channel.close()
+            self._loop.close()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def stop(self):
+        """Ask the supervisor to drain the workers and return from serve_forever. Safe to call
+        from any thread.
+        """
+        self.running = False
+        if self._loop is not None:
+            self._loop.stop()
+
+    def _on_signal(self, signum, frame):
+        self.stop()
+
+    def _next_restart(self):
+        """Returns the number of seconds until the next restart is due, None if there is none."""
+        if not self._restarts:
+            return None
+        return max(0, min(self._restarts.values()) - time.monotonic())
+
+    def _start(self, worker_id):
+        """Fork a worker process."""
+        self.channel.prepare(worker_id, self._loop)
+        process = self._context.Process(target=self._run_worker, args=(worker_id,),
+                                        name="WebSocketWorker-{}".format(worker_id), daemon=True)
+        process.start()
+        self.channel.started(worker_id)
+        self.processes[worker_id] = process
+        self._started[worker_id] = time.monotonic()
+        self._loop.register(process.sentinel, selectors.EVENT_READ, functools.partial(self._on_exit, worker_id, process))
+        logger.info("Started worker %s with pid %s", worker_id, process.pid)
+
+    def _on_exit(self, worker_id, process, mask):
+        """Called when the sentinel of a worker process shows that it has exited."""
+        self._loop.unregister(process.sentinel)
+        process.join()
+        self.channel.worker_exited(worker_id)
+        if self.processes.get(worker_id) is process:
+            del self.processes[worker_id]
+        if not self.running:
+            return
+        logger.warning("Worker %s exited with code %s, restarting", worker_id, process.exitcode)
+        self._restarts[worker_id] = max(time.monotonic(), self._started[worker_id] + self.restart_delay)
+
+    def _drain(self):
+        """Ask every worker to close its clients and kill those still running after drain_timeout."""
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.drain_timeout
+        for worker_id, process in list(self.processes.items()):
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not drain in time, killing it", worker_id)
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+            self._loop.unregister(process.sentinel)
+            self.channel.worker_exited(worker_id)
+        self.processes.clear()
+
+    def _run_worker(self, worker_id):
+        """Body of a worker process."""
+        # Ctrl-C reaches the whole process group, the supervisor decides when workers stop.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, functools.partial(self._on_worker_signal, self.server))
+
+        server = self.server
+        # The socket created in the supervisor is shared by every process, each worker binds its own.
+        server.server.close()
+        server.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.channel.worker_id = worker_id
+        server.channel = self.channel
+        if server.metrics_port:
+            # Every worker keeps metrics of its own.
+            server.metrics_port += worker_id
+        server.serve_forever(event_loop=True, reuse_port=True)
+
+    def _on_worker_signal(self, server, signum, frame):
+        """Drain a worker when the supervisor asks it to stop. The drain closes the server once
+        drained is set, which returns from serve_forever and ends the worker.
+        """
+        if server.event_loop is not None:
+            server.event_loop.call_soon_threadsafe(functools.partial(
+                server.drain, status_code=self.close_status, timeout=self.close_timeout))
+        else:
+            server.alive = False
@@ -1,3 +1,15 @@
 from .WebSocketServer import WebSocketServer
+from .AsyncWebSocketServer import AsyncWebSocketServer, AsyncClient
 from .DataFrameFormat import *
-from .ServerException import *
\ No newline at end of file
+from .ServerException import *
+from .PerMessageDeflate import PerMessageDeflate
+from .WorkerPool import WorkerPool, BroadcastChannel, UnixSocketChannel
+from .PubSub import TopicIndex, Backplane, LocalBackplane, TcpBackplane
+from .HandlerExecutor import HandlerExecutor
+from .Metrics import Metrics
+from .TimerWheel import TimerWheel
+from .HttpParser import HttpParser, HttpRequest
+from .ConnectionRegistry import ConnectionRegistry
+from .Tls import create_server_context
+from .Admission import AdmissionControl
+from . import Handoff